@@ -7,13 +7,16 @@ from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from db_engine import database_url, engine_options, register_sqlite_pragmas
+import db_routing
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': db_routing.RoutingSession})
 login_manager = LoginManager()
 
 # create the app
@@ -21,29 +24,107 @@ app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
-# configure the database - using SQLite as required
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///parking_management.db"
+# configure the database - SQLite by default, DATABASE_URL switches to e.g. PostgreSQL
+app.config["SQLALCHEMY_DATABASE_URI"] = database_url(os.environ.get("DATABASE_URL", "sqlite:///parking_management.db"))
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# optional read replica for the read-only reporting and search views
+if os.environ.get("REPLICA_DATABASE_URL"):
+    app.config["SQLALCHEMY_BINDS"] = {"replica": database_url(os.environ["REPLICA_DATABASE_URL"])}
+# seconds a user reads from the primary after writing, covering replica lag
+app.config["REPLICA_PIN_SECONDS"] = float(os.environ.get("REPLICA_PIN_SECONDS", 5))
+
+# connection pool per process
+app.config["DB_POOL_SIZE"] = int(os.environ.get("DB_POOL_SIZE", 5))
+app.config["DB_MAX_OVERFLOW"] = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+app.config["DB_POOL_RECYCLE"] = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+app.config["DB_POOL_PRE_PING"] = os.environ.get("DB_POOL_PRE_PING", "1") == "1"
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
+
+# pragmas applied to every SQLite connection; an empty value keeps SQLite's default
+app.config["SQLITE_JOURNAL_MODE"] = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+app.config["SQLITE_SYNCHRONOUS"] = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+app.config["SQLITE_BUSY_TIMEOUT_MS"] = os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "15000")
+app.config["SQLITE_MMAP_SIZE"] = os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))
+app.config["SQLITE_CACHE_SIZE"] = os.environ.get("SQLITE_CACHE_SIZE", "-65536")
+register_sqlite_pragmas(app.config)
+
+# seconds the admin dashboard statistics may be served from cache
+app.config["DASHBOARD_STATS_TTL"] = float(os.environ.get("DASHBOARD_STATS_TTL", 5))
+# live occupancy on the admin dashboard: each open stream holds a worker, so
+# streams end after this many seconds and the browser reconnects; 0 turns
+# the stream off and dashboards poll instead
+app.config["OCCUPANCY_STREAM"] = os.environ.get("OCCUPANCY_STREAM", "1") == "1"
+app.config["OCCUPANCY_STREAM_SECONDS"] = float(os.environ.get("OCCUPANCY_STREAM_SECONDS", 300))
+# seconds a logged-in user may be served from the per-process user cache
+app.config["USER_CACHE_TTL"] = float(os.environ.get("USER_CACHE_TTL", 60))
+# requests per endpoint kept for the /admin/perf latency percentiles
+app.config["PERF_SAMPLES_PER_ENDPOINT"] = int(os.environ.get("PERF_SAMPLES_PER_ENDPOINT", 1000))
+
+# background jobs: run by a thread pool in each web process and/or job_worker.py
+app.config["JOBS_IN_PROCESS"] = os.environ.get("JOBS_IN_PROCESS", "1") == "1"
+app.config["JOB_WORKERS"] = int(os.environ.get("JOB_WORKERS", 2))
+app.config["JOB_MAX_ATTEMPTS"] = int(os.environ.get("JOB_MAX_ATTEMPTS", 5))
+# seconds before a job left running by a dead worker is handed out again
+app.config["JOB_LEASE_SECONDS"] = int(os.environ.get("JOB_LEASE_SECONDS", 300))
+app.config["JOB_RETENTION_HOURS"] = float(os.environ.get("JOB_RETENTION_HOURS", 24))
+
+# receipts after release go out through this SMTP server, or to the log when unset
+app.config["MAIL_SERVER"] = os.environ.get("MAIL_SERVER")
+app.config["MAIL_PORT"] = int(os.environ.get("MAIL_PORT", 25))
+app.config["MAIL_SENDER"] = os.environ.get("MAIL_SENDER", "receipts@parking.local")
+
+# reservations never marked parked release their spot after this many minutes
+app.config["RESERVATION_GRACE_MINUTES"] = float(os.environ.get("RESERVATION_GRACE_MINUTES", 30))
+# how often job_worker.py sweeps, and how many reservations one sweep transaction expires
+app.config["RESERVATION_SWEEP_SECONDS"] = float(os.environ.get("RESERVATION_SWEEP_SECONDS", 60))
+app.config["RESERVATION_SWEEP_BATCH"] = int(os.environ.get("RESERVATION_SWEEP_BATCH", 500))
+
+# gate/ANPR batch endpoint: bearer token required from gate devices, batch limits
+app.config["GATE_API_TOKEN"] = os.environ.get("GATE_API_TOKEN")
+app.config["GATE_BATCH_MAX_EVENTS"] = int(os.environ.get("GATE_BATCH_MAX_EVENTS", 5000))
+app.config["GATE_BATCH_MAX_BYTES"] = int(os.environ.get("GATE_BATCH_MAX_BYTES", 4 * 1024 * 1024))
+app.config["GATE_BATCH_ATTEMPTS"] = int(os.environ.get("GATE_BATCH_ATTEMPTS", 3))
+
+# reservations re-priced per UPDATE/commit by rerate_reservations.py
+app.config["RERATE_BATCH"] = int(os.environ.get("RERATE_BATCH", 10000))
+# invoicing: reservations fetched per round trip, users invoiced per checkpoint commit
+app.config["INVOICE_FETCH_ROWS"] = int(os.environ.get("INVOICE_FETCH_ROWS", 10000))
+app.config["INVOICE_CHECKPOINT_USERS"] = int(os.environ.get("INVOICE_CHECKPOINT_USERS", 1000))
+# rows fetched per round trip (and encoded per chunk) by the admin exports
+app.config["EXPORT_FETCH_ROWS"] = int(os.environ.get("EXPORT_FETCH_ROWS", 5000))
 
 # initialize extensions
 db.init_app(app)
+db_routing.init_app(app)
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Please log in to access this page.'
 
 @login_manager.user_loader
 def load_user(user_id):
-    from app_models import User
-    return User.query.get(int(user_id))
+    from user_cache import get_cached_user
+    return get_cached_user(int(user_id))
 
 with app.app_context():
     # Import models and routes
     import app_models
     import routes
+    # Register background job handlers
+    import receipts
+    import rollups
     
     # Create all tables
+    from sqlalchemy import inspect
+    had_daily_stats = inspect(db.engine).has_table('lot_daily_stats')
     db.create_all()
     
+    # Bring older database files up to date with the models
+    from migrations import upgrade_schema
+    if 'parking_lots.available_spots_count' in upgrade_schema():
+        app_models.reconcile_lot_counters()
+    if not had_daily_stats:
+        rollups.backfill_daily_stats()
+    
     # Create admin user automatically if it doesn't exist
     from werkzeug.security import generate_password_hash
     admin = app_models.User.query.filter_by(username='admin').first()
@@ -57,13 +138,6 @@ with app.app_context():
         db.session.add(admin_user)
         db.session.commit()
         print("Admin user created automatically!")
-        admin = app_models.User()
-        admin.username = 'admin'
-        admin.email = 'admin@parking.com'
-        admin.password_hash = generate_password_hash('admin123')
-        admin.is_admin = True
-        db.session.add(admin)
-        db.session.commit()
         logging.info("Admin user created with username: admin, password: admin123")
 
 if __name__ == '__main__':
@@ -1,7 +1,35 @@
+import functools
 from app import db
 from flask_login import UserMixin
 from datetime import datetime
-from sqlalchemy import func
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from occupancy_events import queue_occupancy_delta
+
+MEMO_ATTRIBUTE = '_request_memo'
+
+def memoized(*depends_on):
+    """Cache a derived property on the instance for the rest of the request.
+
+    The cached value is keyed on the named column values, so assigning any
+    of them recomputes it. Values that depend on other rows are dropped by
+    the session hooks below whenever those rows are written. Instances do
+    not outlive the request's session, so neither does the cache.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self):
+            memo = self.__dict__.setdefault(MEMO_ATTRIBUTE, {})
+            key = tuple(getattr(self, column) for column in depends_on)
+            cached = memo.get(fn.__name__)
+            if cached is None or cached[0] != key:
+                cached = memo[fn.__name__] = (key, fn(self))
+            return cached[1]
+        return wrapper
+    return decorator
+
+def clear_memo(instance):
+    instance.__dict__.pop(MEMO_ATTRIBUTE, None)
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -30,26 +58,48 @@ class ParkingLot(db.Model):
     maximum_number_of_spots = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Denormalized spot counters, kept in sync by shift_spot_counts()
+    available_spots_count = db.Column(db.Integer, default=0, server_default=db.text('0'), nullable=False)
+    occupied_spots_count = db.Column(db.Integer, default=0, server_default=db.text('0'), nullable=False)
+    reserved_spots_count = db.Column(db.Integer, default=0, server_default=db.text('0'), nullable=False)
+    
+    # Optional daily peak window (UTC hours) priced at peak_multiplier; see billing
+    peak_start_hour = db.Column(db.Integer, nullable=True)
+    peak_end_hour = db.Column(db.Integer, nullable=True)
+    peak_multiplier = db.Column(db.Float, nullable=True)
+    
     # Relationships
     parking_spots = db.relationship('ParkingSpot', backref='parking_lot', lazy=True, cascade='all, delete-orphan')
+    pricing_tiers = db.relationship('PricingTier', lazy=True, cascade='all, delete-orphan',
+                                    order_by='PricingTier.from_hour')
     
-    @property
-    def available_spots_count(self):
-        return ParkingSpot.query.filter_by(lot_id=self.id, status='A').count()
-    
-    @property
-    def occupied_spots_count(self):
-        return ParkingSpot.query.filter_by(lot_id=self.id, status='O').count()
+    def __repr__(self):
+        return f'<ParkingLot {self.prime_location_name}>'
+
+class PricingTier(db.Model):
+    __tablename__ = 'pricing_tiers'
     
-    @property
-    def reserved_spots_count(self):
-        return ParkingSpot.query.filter_by(lot_id=self.id, status='R').count()
+    id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lots.id'), nullable=False, index=True)
+    # Hours of a stay from from_hour up to to_hour (open-ended if NULL) cost multiplier x the rate
+    from_hour = db.Column(db.Float, nullable=False)
+    to_hour = db.Column(db.Float, nullable=True)
+    multiplier = db.Column(db.Float, nullable=False)
     
     def __repr__(self):
-        return f'<ParkingLot {self.prime_location_name}>'
+        return f'<PricingTier lot {self.lot_id} from {self.from_hour}h x{self.multiplier}>'
 
 class ParkingSpot(db.Model):
     __tablename__ = 'parking_spots'
+    __table_args__ = (
+        # Serves first-available lookups: seek to (lot_id, 'A') and read in
+        # numeric spot order, which is length first (see spot_provisioning)
+        db.Index('ix_parking_spots_lot_status_number_order', 'lot_id', 'status',
+                 db.text('length(spot_number)'), 'spot_number'),
+        # search_spot looks spots up by number; search_by_status filters by status alone
+        db.Index('ix_parking_spots_spot_number', 'spot_number'),
+        db.Index('ix_parking_spots_status', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     lot_id = db.Column(db.Integer, db.ForeignKey('parking_lots.id'), nullable=False)
@@ -60,6 +110,7 @@ class ParkingSpot(db.Model):
     reservations = db.relationship('Reservation', backref='parking_spot', lazy=True)
     
     @property
+    @memoized('id')
     def current_reservation(self):
         return Reservation.query.filter_by(
             spot_id=self.id, 
@@ -71,34 +122,198 @@ class ParkingSpot(db.Model):
 
 class Reservation(db.Model):
     __tablename__ = 'reservations'
+    __table_args__ = (
+        # Open reservations are a tiny fraction of history, so the per-spot
+        # lookup used by spot searches gets a partial index
+        db.Index('ix_reservations_open_spot', 'spot_id',
+                 sqlite_where=db.text('leaving_timestamp IS NULL'),
+                 postgresql_where=db.text('leaving_timestamp IS NULL')),
+        # The expiry sweeper walks open reservations from the oldest booking
+        db.Index('ix_reservations_open_parking', 'parking_timestamp',
+                 sqlite_where=db.text('leaving_timestamp IS NULL'),
+                 postgresql_where=db.text('leaving_timestamp IS NULL')),
+        # A spot's full history: whether it was ever booked, and its stays by time
+        db.Index('ix_reservations_spot_leaving', 'spot_id', 'leaving_timestamp'),
+        # A user's active booking (leaving_timestamp IS NULL) and completed
+        # bookings by leaving time, then all bookings by start time
+        db.Index('ix_reservations_user_leaving', 'user_id', 'leaving_timestamp'),
+        db.Index('ix_reservations_user_parking', 'user_id', 'parking_timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     spot_id = db.Column(db.Integer, db.ForeignKey('parking_spots.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     parking_timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    leaving_timestamp = db.Column(db.DateTime, nullable=True)
+    leaving_timestamp = db.Column(db.DateTime, nullable=True, index=True)
     parking_cost_per_unit_time = db.Column(db.Float, nullable=False)
     total_cost = db.Column(db.Float, nullable=True)
+    # Closed by the sweeper because the driver never parked (see reservation_sweeper)
+    expired = db.Column(db.Boolean, default=False, server_default=db.text('false'), nullable=False)
     
     @property
+    @memoized('parking_timestamp', 'leaving_timestamp')
     def duration_hours(self):
         if self.leaving_timestamp:
             duration = self.leaving_timestamp - self.parking_timestamp
             return duration.total_seconds() / 3600
         return None
     
-    @property
-    def calculated_cost(self):
-        if self.duration_hours:
-            return round(self.duration_hours * self.parking_cost_per_unit_time, 2)
-        return 0
+    def __repr__(self):
+        return f'<Reservation {self.id} - User {self.user_id}>'
+
+class LotDailyStats(db.Model):
+    __tablename__ = 'lot_daily_stats'
     
-    @property
-    def current_cost(self):
-        end_time = self.leaving_timestamp or datetime.utcnow()
-        duration = end_time - self.parking_timestamp
-        hours = duration.total_seconds() / 3600
-        return round(hours * self.parking_cost_per_unit_time, 2)
+    # lot_id is deliberately not a foreign key so revenue history survives lot deletion
+    lot_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    revenue = db.Column(db.Float, default=0, nullable=False)
+    sessions = db.Column(db.Integer, default=0, nullable=False)
+    occupied_hours = db.Column(db.Float, default=0, nullable=False)
+    peak_occupancy = db.Column(db.Integer, default=0, nullable=False)
     
     def __repr__(self):
-        return f'<Reservation {self.id} - User {self.user_id}>'
+        return f'<LotDailyStats {self.lot_id} {self.day}>'
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Workers claim the oldest pending job whose run_after has passed
+        db.Index('ix_jobs_status_run_after', 'status', 'run_after'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), default='pending', nullable=False)  # pending, running, done, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
+
+class AuditEntry(db.Model):
+    __tablename__ = 'audit_entries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    action = db.Column(db.String(40), nullable=False, index=True)
+    # A username rather than a foreign key: the trail outlives the account
+    actor = db.Column(db.String(80), nullable=True)
+    details = db.Column(db.Text, nullable=False)  # JSON object
+    at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<AuditEntry {self.id} {self.action}>'
+
+class GateEvent(db.Model):
+    __tablename__ = 'gate_events'
+    
+    # Chosen by the gate; an event id seen before is a replay and is not applied again
+    event_id = db.Column(db.String(64), primary_key=True)
+    event_type = db.Column(db.String(10), nullable=False)  # park, release
+    # Not a foreign key, like lot_daily_stats: the record outlives the reservation
+    reservation_id = db.Column(db.Integer, nullable=False)
+    occurred_at = db.Column(db.DateTime, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<GateEvent {self.event_id} {self.event_type}>'
+
+class Invoice(db.Model):
+    __tablename__ = 'invoices'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', name='uq_invoices_user_period'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Not a foreign key, like lot_daily_stats: an issued invoice outlives the account
+    user_id = db.Column(db.Integer, nullable=False)
+    period = db.Column(db.String(7), nullable=False, index=True)  # YYYY-MM
+    reservations = db.Column(db.Integer, nullable=False)
+    hours = db.Column(db.Float, nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    issued_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<Invoice {self.user_id} {self.period}>'
+
+class InvoiceRun(db.Model):
+    __tablename__ = 'invoice_runs'
+    
+    # One run per billing period; it is the checkpoint a crashed run resumes from
+    period = db.Column(db.String(7), primary_key=True)
+    status = db.Column(db.String(10), nullable=False, default='rerating')  # rerating, invoicing, done
+    # Every user up to and including this id has been invoiced
+    last_user_id = db.Column(db.Integer, nullable=False, default=0)
+    invoices = db.Column(db.Integer, nullable=False, default=0)
+    reservations = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<InvoiceRun {self.period} {self.status}>'
+
+@event.listens_for(Session, 'after_flush')
+def _clear_spot_memos_on_reservation_write(session, flush_context):
+    # A spot's current reservation changes when any reservation of it is written
+    for instance in session.new | session.dirty | session.deleted:
+        if isinstance(instance, Reservation):
+            spot = session.identity_map.get(db.inspect(ParkingSpot).identity_key_from_primary_key([instance.spot_id]))
+            if spot is not None:
+                clear_memo(spot)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _clear_memos_on_bulk_write(orm_execute_state):
+    # Set-based UPDATE/DELETE/INSERT bypass the unit of work; drop everything
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        for instance in orm_execute_state.session.identity_map.values():
+            clear_memo(instance)
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _clear_memos_on_transaction_end(session):
+    for instance in session.identity_map.values():
+        clear_memo(instance)
+
+# Maps a spot status code to the ParkingLot counter column that tracks it
+SPOT_STATUS_COUNTERS = {
+    'A': 'available_spots_count',
+    'R': 'reserved_spots_count',
+    'O': 'occupied_spots_count',
+}
+
+def shift_spot_counts(lot_id, from_status=None, to_status=None, count=1):
+    """Move `count` spots of a lot from one status counter to another.
+
+    Runs as an UPDATE in the current session so the counters commit (or roll
+    back) together with the spot status change. Pass only `to_status` when
+    spots are added to a lot and only `from_status` when they are removed.
+    """
+    if from_status == to_status or count == 0:
+        return
+    values = {}
+    if from_status:
+        column = getattr(ParkingLot, SPOT_STATUS_COUNTERS[from_status])
+        values[column.key] = column - count
+    if to_status:
+        column = getattr(ParkingLot, SPOT_STATUS_COUNTERS[to_status])
+        values[column.key] = column + count
+    db.session.execute(db.update(ParkingLot).where(ParkingLot.id == lot_id).values(**values))
+    queue_occupancy_delta(db.session, lot_id, from_status, to_status, count)
+
+def reconcile_lot_counters():
+    """Rebuild every lot's spot counters from parking_spots in one statement."""
+    def spot_count(status):
+        return (db.select(func.count(ParkingSpot.id))
+                .where(ParkingSpot.lot_id == ParkingLot.id, ParkingSpot.status == status)
+                .scalar_subquery())
+    
+    values = {column: spot_count(status) for status, column in SPOT_STATUS_COUNTERS.items()}
+    db.session.execute(db.update(ParkingLot).values(**values).execution_options(synchronize_session=False))
+    db.session.commit()
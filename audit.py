@@ -0,0 +1,21 @@
+"""
+Audit trail of account, lot and parking actions.
+
+audit() adds a row to audit_entries in the current transaction, so an
+entry is kept exactly for the changes that commit and costs the request
+one INSERT. Entries are never purged, unlike finished jobs.
+"""
+
+import json
+from datetime import datetime
+
+from flask import has_request_context
+from flask_login import current_user
+from app import db
+from app_models import AuditEntry
+
+def audit(action, **details):
+    actor = None
+    if has_request_context() and current_user.is_authenticated:
+        actor = current_user.username
+    db.session.add(AuditEntry(action=action, actor=actor, details=json.dumps(details), at=datetime.utcnow()))
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+Rebuild the per-lot daily revenue and utilization rollup from reservation history
+"""
+
+from app import app
+from rollups import backfill_daily_stats
+
+def main():
+    with app.app_context():
+        print('Rebuilding lot_daily_stats from reservations...')
+        rows = backfill_daily_stats()
+        print(f'Rollup rebuilt: {rows} lot-day rows.')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the Parking Management System
+
+Generates a synthetic fleet (N lots x M spots, U users, R historical
+reservations) with bulk inserts, drives the Flask test client through the
+admin and user flows, and reports throughput and latency percentiles per
+endpoint. Results are written as JSON so runs can be compared:
+
+    python benchmark.py --lots 20 --spots 500 --users 2000 --reservations 200000
+    python benchmark.py --compare benchmark_results.json
+"""
+
+import argparse
+import json
+import logging
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from app_models import User, ParkingLot, ParkingSpot, Reservation, LotDailyStats
+from jobs import wait_for_jobs
+from spot_provisioning import add_spots
+from rollups import backfill_daily_stats
+from dashboard_stats import invalidate_dashboard_stats
+from perf import percentile
+
+PREFIX = 'bench'
+PASSWORD = 'benchmark'
+INSERT_BATCH = 10000
+SERVER_TIMING_QUERIES = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+def generate_fleet(lots, spots, users, reservations, seed=0):
+    """Bulk-insert the benchmark fleet and return its lot and user ids."""
+    rng = random.Random(seed)
+    
+    lot_rows = [ParkingLot(
+        prime_location_name=f'{PREFIX} lot {i}',
+        price=round(rng.uniform(1.0, 5.0), 2),
+        address=f'{i} Benchmark Avenue',
+        pin_code=f'{90000 + i:05d}',
+        maximum_number_of_spots=spots
+    ) for i in range(1, lots + 1)]
+    db.session.add_all(lot_rows)
+    db.session.flush()
+    for lot in lot_rows:
+        add_spots(lot.id, spots, spots)
+    lot_ids = [lot.id for lot in lot_rows]
+    prices = {lot.id: lot.price for lot in lot_rows}
+    
+    password_hash = generate_password_hash(PASSWORD)
+    for start in range(0, users, INSERT_BATCH):
+        db.session.execute(db.insert(User), [
+            {'username': f'{PREFIX}_{i}', 'email': f'{PREFIX}_{i}@example.com',
+             'password_hash': password_hash, 'is_admin': False}
+            for i in range(start, min(start + INSERT_BATCH, users))
+        ])
+    user_ids = db.session.scalars(
+        db.select(User.id).where(User.username.like(f'{PREFIX}\\_%', escape='\\')).order_by(User.id)
+    ).all()
+    
+    # Closed sessions laid back to back on each spot, walking back from now
+    spot_rows = db.session.execute(
+        db.select(ParkingSpot.id, ParkingSpot.lot_id).where(ParkingSpot.lot_id.in_(lot_ids))
+    ).all()
+    cursors = {spot_id: datetime.utcnow() - timedelta(hours=1) for spot_id, _ in spot_rows}
+    batch = []
+    for i in range(reservations):
+        spot_id, lot_id = spot_rows[i % len(spot_rows)]
+        leaving = cursors[spot_id] - timedelta(minutes=rng.expovariate(1 / 90))
+        parking = leaving - timedelta(minutes=rng.uniform(10, 600))
+        cursors[spot_id] = parking
+        batch.append({
+            'spot_id': spot_id,
+            'user_id': rng.choice(user_ids),
+            'parking_timestamp': parking,
+            'leaving_timestamp': leaving,
+            'parking_cost_per_unit_time': prices[lot_id],
+            'total_cost': round((leaving - parking).total_seconds() / 3600 * prices[lot_id], 2),
+        })
+        if len(batch) == INSERT_BATCH:
+            db.session.execute(db.insert(Reservation), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(Reservation), batch)
+    
+    db.session.commit()
+    backfill_daily_stats()
+    invalidate_dashboard_stats()
+    return lot_ids, list(user_ids)
+
+def remove_fleet(lot_ids, user_ids):
+    wait_for_jobs()
+    spot_ids = db.select(ParkingSpot.id).where(ParkingSpot.lot_id.in_(lot_ids))
+    Reservation.query.filter(
+        Reservation.spot_id.in_(spot_ids) | Reservation.user_id.in_(user_ids)
+    ).delete(synchronize_session=False)
+    ParkingSpot.query.filter(ParkingSpot.lot_id.in_(lot_ids)).delete(synchronize_session=False)
+    LotDailyStats.query.filter(LotDailyStats.lot_id.in_(lot_ids)).delete(synchronize_session=False)
+    ParkingLot.query.filter(ParkingLot.id.in_(lot_ids)).delete(synchronize_session=False)
+    User.query.filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+    db.session.commit()
+    invalidate_dashboard_stats()
+
+class Recorder:
+    """Collects latency and query counts per endpoint label."""
+    
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+    
+    def request(self, label, client, method, url, expect=(200, 302), **kwargs):
+        started = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        queries = None
+        for value in response.headers.getlist('Server-Timing'):
+            match = SERVER_TIMING_QUERIES.match(value)
+            if match:
+                queries = int(match.group(1))
+        self.samples[label].append((elapsed_ms, queries))
+        if response.status_code not in expect:
+            self.errors[label] += 1
+        return response
+    
+    def report(self, wall_seconds):
+        endpoints = {}
+        for label, samples in sorted(self.samples.items()):
+            durations = sorted(sample[0] for sample in samples)
+            queries = [sample[1] for sample in samples if sample[1] is not None]
+            endpoints[label] = {
+                'requests': len(samples),
+                'errors': self.errors[label],
+                'throughput_rps': round(len(samples) / (sum(durations) / 1000), 1),
+                'latency_ms': {
+                    'p50': round(percentile(durations, 0.50), 2),
+                    'p95': round(percentile(durations, 0.95), 2),
+                    'p99': round(percentile(durations, 0.99), 2),
+                    'max': round(durations[-1], 2),
+                },
+                'queries_avg': round(sum(queries) / len(queries), 2) if queries else None,
+            }
+        total = sum(len(samples) for samples in self.samples.values())
+        return {
+            'total_requests': total,
+            'wall_seconds': round(wall_seconds, 2),
+            'throughput_rps': round(total / wall_seconds, 1),
+            'endpoints': endpoints,
+        }
+
+def open_reservation_id(user_id):
+    with app.app_context():
+        return db.session.scalar(db.select(Reservation.id).where(
+            Reservation.user_id == user_id, Reservation.leaving_timestamp.is_(None)))
+
+def run_admin_scenario(recorder, lot_ids, rounds, rng):
+    client = app.test_client()
+    recorder.request('login', client, 'POST', '/login', data={'username': 'admin', 'password': 'admin123'})
+    
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+    month_ago = (datetime.utcnow() - timedelta(days=30)).strftime('%Y-%m-%d')
+    for _ in range(rounds):
+        lot_id = rng.choice(lot_ids)
+        recorder.request('admin_dashboard', client, 'GET', '/admin/dashboard')
+        recorder.request('view_users', client, 'GET', f'/admin/view_users?q={PREFIX}_1')
+        recorder.request('search_spot', client, 'GET', '/admin/search_spot?spot_number=S001')
+        recorder.request('search_by_lot', client, 'GET', f'/admin/search_by_lot?lot_id={lot_id}&limit=100')
+        recorder.request('search_by_status', client, 'GET', '/admin/search_by_status?status=O&limit=100')
+        recorder.request('admin_chart_data', client, 'GET', '/api/admin/chart_data')
+        recorder.request('admin_chart_data_month', client, 'GET',
+                         f'/api/admin/chart_data?start={month_ago}&end={today}&by_lot=1')
+        recorder.request('admin_chart_data_hourly', client, 'GET',
+                         f'/api/admin/chart_data?start={today}&end={today}&bucket=hour')
+
+def run_driver_scenario(recorder, username, user_id, lot_ids, rounds, rng):
+    client = app.test_client()
+    recorder.request('login', client, 'POST', '/login', data={'username': username, 'password': PASSWORD})
+    
+    for _ in range(rounds):
+        recorder.request('user_dashboard', client, 'GET', '/user/dashboard')
+        recorder.request('book_parking_quick', client, 'POST', f'/user/book_parking_quick/{rng.choice(lot_ids)}')
+        reservation_id = open_reservation_id(user_id)
+        if reservation_id is None:
+            recorder.errors['book_parking_quick'] += 1
+            continue
+        recorder.request('mark_parked', client, 'GET', f'/user/mark_parked/{reservation_id}')
+        recorder.request('release_parking', client, 'GET', f'/user/release_parking/{reservation_id}')
+        recorder.request('my_bookings', client, 'GET', '/user/my_bookings')
+        recorder.request('user_chart_data', client, 'GET', '/api/user/chart_data')
+    
+    recorder.request('logout', client, 'GET', '/logout')
+
+def compare(previous, current):
+    print(f'\n{"endpoint":<26}{"p95 before":>12}{"p95 now":>10}{"change":>9}')
+    for label, stats in current['endpoints'].items():
+        before = previous.get('endpoints', {}).get(label)
+        if not before:
+            continue
+        old, new = before['latency_ms']['p95'], stats['latency_ms']['p95']
+        change = (new - old) / old * 100 if old else 0
+        print(f'{label:<26}{old:>12.2f}{new:>10.2f}{change:>+8.0f}%')
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the parking app against a synthetic fleet')
+    parser.add_argument('--lots', type=int, default=10)
+    parser.add_argument('--spots', type=int, default=200, help='spots per lot')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--reservations', type=int, default=50000, help='historical reservations')
+    parser.add_argument('--drivers', type=int, default=50, help='users driven through the booking flow')
+    parser.add_argument('--rounds', type=int, default=5, help='scenario repetitions per driver')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', metavar='JSON', help='previous results to compare against')
+    parser.add_argument('--keep', action='store_true', help='keep the generated fleet afterwards')
+    args = parser.parse_args()
+    
+    app.config['WTF_CSRF_ENABLED'] = False
+    logging.getLogger().setLevel(logging.WARNING)
+    rng = random.Random(args.seed)
+    
+    print('🏁 Parking Management System benchmark')
+    print(f'   {args.lots} lots x {args.spots} spots, {args.users} users, '
+          f'{args.reservations} historical reservations')
+    
+    with app.app_context():
+        if User.query.filter(User.username.like(f'{PREFIX}\\_%', escape='\\')).first():
+            print(f'❌ Users named {PREFIX}_* already exist; remove the previous fleet first')
+            return 1
+        started = time.perf_counter()
+        lot_ids, user_ids = generate_fleet(args.lots, args.spots, args.users, args.reservations, args.seed)
+        setup_seconds = time.perf_counter() - started
+    print(f'   Fleet generated in {setup_seconds:.1f}s')
+    
+    recorder = Recorder()
+    try:
+        started = time.perf_counter()
+        run_admin_scenario(recorder, lot_ids, args.rounds, rng)
+        for i in range(min(args.drivers, len(user_ids))):
+            run_driver_scenario(recorder, f'{PREFIX}_{i}', user_ids[i], lot_ids, args.rounds, rng)
+        results = recorder.report(time.perf_counter() - started)
+    finally:
+        if not args.keep:
+            with app.app_context():
+                remove_fleet(lot_ids, user_ids)
+    
+    results = {
+        'generated_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'parameters': vars(args),
+        'setup_seconds': round(setup_seconds, 2),
+        **results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    
+    print(f'\n{"endpoint":<26}{"requests":>9}{"rps":>9}{"p50":>8}{"p95":>8}{"p99":>8}{"queries":>9}{"errors":>8}')
+    for label, stats in results['endpoints'].items():
+        latency = stats['latency_ms']
+        print(f'{label:<26}{stats["requests"]:>9}{stats["throughput_rps"]:>9}{latency["p50"]:>8}'
+              f'{latency["p95"]:>8}{latency["p99"]:>8}{str(stats["queries_avg"]):>9}{stats["errors"]:>8}')
+    print(f'\n   {results["total_requests"]} requests in {results["wall_seconds"]}s '
+          f'({results["throughput_rps"]} req/s), results saved to {args.output}')
+    
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    
+    return 1 if any(stats['errors'] for stats in results['endpoints'].values()) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
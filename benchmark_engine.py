@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Compare booking throughput across database engine settings
+
+Runs load_test.py once per configuration -- SQLite with its stock pragmas,
+SQLite with the tuned defaults from app.py, and optionally PostgreSQL --
+and prints bookings/sec, error rate and booking latency side by side.
+Extra arguments are passed on to load_test.py:
+
+    python benchmark_engine.py --postgres postgresql://localhost/parking -- --drivers 200 --workers 8
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# SQLite as it behaves without any tuning (journal_mode persists in the file,
+# so the stock run switches it back to DELETE explicitly)
+STOCK_SQLITE = {
+    'SQLITE_JOURNAL_MODE': 'DELETE',
+    'SQLITE_SYNCHRONOUS': 'FULL',
+    'SQLITE_BUSY_TIMEOUT_MS': '5000',
+    'SQLITE_MMAP_SIZE': '0',
+    'SQLITE_CACHE_SIZE': '-2000',
+}
+
+def run_load_test(name, env, load_test_args):
+    print(f'\n=== {name} ===', flush=True)
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as output:
+        path = output.name
+    try:
+        subprocess.run(
+            [sys.executable, 'load_test.py', '--output', path, *load_test_args],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env={**os.environ, **env},
+            check=False
+        )
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+    finally:
+        os.unlink(path)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare booking throughput across database settings')
+    parser.add_argument('--postgres', metavar='DATABASE_URL', help='also run against this PostgreSQL database')
+    parser.add_argument('load_test_args', nargs='*', help='arguments passed to load_test.py (after --)')
+    args = parser.parse_args()
+    
+    # The tuned run comes after the stock one so the file is left in WAL mode
+    configurations = [
+        ('SQLite, stock pragmas', STOCK_SQLITE),
+        ('SQLite, WAL + tuned pragmas', {}),
+    ]
+    if args.postgres:
+        configurations.append(('PostgreSQL', {'DATABASE_URL': args.postgres}))
+    
+    results = [(name, run_load_test(name, env, args.load_test_args)) for name, env in configurations]
+    
+    print(f'\n{"configuration":<30}{"bookings/s":>11}{"error %":>9}{"book p95 ms":>13}{"double":>8}')
+    for name, summary in results:
+        if summary is None:
+            print(f'{name:<30}{"run failed":>11}')
+            continue
+        book = summary['steps'].get('book', {})
+        print(f'{name:<30}{summary["bookings_per_sec"]:>11.2f}{summary["error_rate"] * 100:>8.2f}%'
+              f'{book.get("p95_ms", 0):>13.1f}'
+              f'{summary["double_allocations"] + summary["overlapping_reservations"]:>8}')
+    return 0 if all(summary for _, summary in results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
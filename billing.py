@@ -0,0 +1,186 @@
+"""
+Reservation pricing, computed in SQL over whole sets of reservations.
+
+A stay is charged at the hourly rate it was booked at
+(parking_cost_per_unit_time), shaped by the lot's current tariff:
+
+- Duration tiers (pricing_tiers): the hours of a stay between a tier's
+  from_hour and to_hour are charged at `multiplier` times the rate, e.g.
+  0.8 after the third hour and 0.5 after a day. Hours no tier covers are
+  charged at the plain rate, so a lot without tiers is flat-rate.
+- A daily peak window from peak_start_hour to peak_end_hour (UTC): each
+  hour of the stay inside the window adds (peak_multiplier - 1) times the
+  rate on top of its tier price.
+
+cost_expression() builds the price as one SQL expression, so pricing a
+release, a gate batch or a month of history is a single UPDATE or SELECT
+whatever the number of rows. Peak hours inside [start, end) are
+P(end) - P(start), where P(h) counts peak hours from the epoch to hour h
+in closed form, so no per-day iteration is needed.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Float, Integer, Numeric, cast, func, literal
+from app import app, db
+from app_models import ParkingLot, ParkingSpot, Reservation, PricingTier
+from rollups import refresh_daily_revenue
+
+# julianday() of 1970-01-01 00:00 UTC
+UNIX_EPOCH_JULIAN_DAY = 2440587.5
+
+def _postgresql():
+    return db.engine.dialect.name == 'postgresql'
+
+def _greatest(*values):
+    return func.greatest(*values) if _postgresql() else func.max(*values)
+
+def _least(*values):
+    return func.least(*values) if _postgresql() else func.min(*values)
+
+def _floor(value):
+    # Only applied to non-negative values, where truncation is the floor
+    return func.floor(value) if _postgresql() else cast(value, Integer)
+
+def epoch_hours(timestamp):
+    """Hours since 1970-01-01 of a naive UTC timestamp, as SQL."""
+    if _postgresql():
+        return func.extract('epoch', timestamp) / 3600
+    return (func.julianday(timestamp) - UNIX_EPOCH_JULIAN_DAY) * 24
+
+def peak_hours_until(hours, start_hour, end_hour):
+    """Peak-window hours from the epoch up to `hours`, as SQL."""
+    days = _floor(hours / 24)
+    hour_of_day = hours - days * 24
+    window = end_hour - start_hour
+    return days * window + _least(_greatest(hour_of_day - start_hour, 0), window)
+
+def cost_expression(end=None):
+    """SQL price of a reservation's stay from booking until `end`.
+    
+    `end` defaults to leaving_timestamp; pass a datetime to price open
+    reservations up to that moment. The enclosing statement must join
+    reservations to parking_spots and parking_lots.
+    """
+    if end is None:
+        end = Reservation.leaving_timestamp
+    elif isinstance(end, datetime):
+        end = literal(end, db.DateTime)
+    start_h, end_h = epoch_hours(Reservation.parking_timestamp), epoch_hours(end)
+    hours = end_h - start_h
+    
+    tier_adjustment = (
+        db.select(func.coalesce(func.sum(
+            (PricingTier.multiplier - 1)
+            * _greatest(_least(hours, func.coalesce(PricingTier.to_hour, hours)) - PricingTier.from_hour, 0)
+        ), 0))
+        .where(PricingTier.lot_id == ParkingLot.id)
+        .correlate_except(PricingTier)
+        .scalar_subquery()
+    )
+    
+    peak_start = func.coalesce(ParkingLot.peak_start_hour, 0)
+    peak_end = func.coalesce(ParkingLot.peak_end_hour, 0)
+    peak_adjustment = (func.coalesce(ParkingLot.peak_multiplier, 1) - 1) * (
+        peak_hours_until(end_h, peak_start, peak_end) - peak_hours_until(start_h, peak_start, peak_end))
+    
+    cost = Reservation.parking_cost_per_unit_time * (hours + tier_adjustment + peak_adjustment)
+    if _postgresql():
+        return cast(func.round(cast(cost, Numeric), 2), Float)
+    return func.round(cost, 2)
+
+def bill_reservations(*criteria):
+    """Set total_cost of the closed reservations matching `criteria` in one UPDATE.
+    
+    Expired reservations keep their zero cost. Returns the number billed.
+    """
+    result = db.session.execute(
+        db.update(Reservation)
+        .where(Reservation.spot_id == ParkingSpot.id,
+               ParkingSpot.lot_id == ParkingLot.id,
+               Reservation.leaving_timestamp.isnot(None),
+               Reservation.expired.is_(False),
+               *criteria)
+        .values(total_cost=cost_expression())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+def quote(reservation_ids, end=None):
+    """{reservation id: price of its stay until `end` (default: now)}.
+    
+    Closed reservations are priced until they left. One query whatever the
+    number of ids, so pages price all their rows in a single call.
+    """
+    if not reservation_ids:
+        return {}
+    end = func.coalesce(Reservation.leaving_timestamp, literal(end or datetime.utcnow(), db.DateTime))
+    return dict(db.session.execute(
+        db.select(Reservation.id, cost_expression(end))
+        .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+        .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)
+        .where(Reservation.id.in_(reservation_ids))
+    ).all())
+
+def rerate_reservations(start, end, lot_id=None, batch_size=None):
+    """Re-price reservations released in [start, end) with the current tariffs.
+    
+    Walks the range in id-ordered batches of RERATE_BATCH, one UPDATE and
+    one commit per batch, then refreshes the affected daily revenue
+    rollups. Returns the number of reservations re-priced.
+    """
+    batch_size = batch_size or app.config['RERATE_BATCH']
+    criteria = [Reservation.leaving_timestamp >= start, Reservation.leaving_timestamp < end]
+    if lot_id is not None:
+        criteria.append(ParkingSpot.lot_id == lot_id)
+    
+    rerated, last_id = 0, 0
+    while True:
+        upper_id = db.session.execute(
+            db.select(Reservation.id)
+            .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+            .where(Reservation.id > last_id, *criteria)
+            .order_by(Reservation.id)
+            .offset(batch_size - 1)
+            .limit(1)
+        ).scalar()
+        batch = [Reservation.id > last_id] + ([Reservation.id <= upper_id] if upper_id else [])
+        rerated += bill_reservations(*criteria, *batch)
+        db.session.commit()
+        if upper_id is None:
+            break
+        last_id = upper_id
+    
+    refresh_daily_revenue(start, end, lot_id)
+    return rerated
+
+def parse_tiers(text):
+    """Parse "3:0.8, 24:0.5" into [(from_hour, to_hour, multiplier), ...].
+    
+    Each entry starts a tier at that hour of the stay; it runs until the
+    next entry, the last one until the end of the stay. Raises ValueError.
+    """
+    starts = []
+    for entry in filter(None, (part.strip() for part in (text or '').split(','))):
+        hour, sep, multiplier = entry.partition(':')
+        try:
+            hour, multiplier = float(hour), float(multiplier)
+        except ValueError:
+            raise ValueError(f'"{entry}" is not hour:multiplier')
+        if not sep or hour < 0 or multiplier < 0:
+            raise ValueError(f'"{entry}" is not hour:multiplier')
+        starts.append((hour, multiplier))
+    
+    hours = [hour for hour, _ in starts]
+    if hours != sorted(set(hours)):
+        raise ValueError('Tier hours must be increasing')
+    ends = hours[1:] + [None]
+    return [(hour, to_hour, multiplier) for (hour, multiplier), to_hour in zip(starts, ends)]
+
+def format_tiers(tiers):
+    return ', '.join(f'{tier.from_hour:g}:{tier.multiplier:g}' for tier in tiers)
+
+def set_lot_tiers(lot, tiers):
+    """Replace a lot's duration tiers with parse_tiers() output."""
+    lot.pricing_tiers = [PricingTier(from_hour=from_hour, to_hour=to_hour, multiplier=multiplier)
+                         for from_hour, to_hour, multiplier in tiers]
@@ -79,6 +79,7 @@ def create_sample_data():
                     status='A'  # All spots start as available
                 )
                 db.session.add(spot)
+            lot.available_spots_count = lot.maximum_number_of_spots
         
         db.session.commit()
         
@@ -0,0 +1,66 @@
+"""
+Headline statistics for the admin dashboard.
+
+All numbers come from one SQL round-trip: spot totals are summed from the
+per-lot counters, with user and open-reservation counts as scalar
+subqueries. Results are cached per process for DASHBOARD_STATS_TTL seconds
+and dropped early by invalidate_dashboard_stats() after booking writes.
+"""
+
+import threading
+import time
+
+from sqlalchemy import func
+from app import app, db
+from app_models import User, ParkingLot, Reservation
+
+_cache_lock = threading.Lock()
+_cached_stats = None
+_cached_at = 0.0
+# Bumped by every invalidation; a computation that started before the
+# latest one may have read stale rows and is returned but not cached
+_generation = 0
+
+def compute_dashboard_stats():
+    total_users = (db.select(func.count(User.id))
+                   .where(User.is_admin.is_(False))
+                   .scalar_subquery())
+    active_reservations = (db.select(func.count(Reservation.id))
+                           .where(Reservation.leaving_timestamp.is_(None))
+                           .scalar_subquery())
+    row = db.session.execute(db.select(
+        func.count(ParkingLot.id).label('total_lots'),
+        func.coalesce(func.sum(ParkingLot.available_spots_count
+                               + ParkingLot.reserved_spots_count
+                               + ParkingLot.occupied_spots_count), 0).label('total_spots'),
+        func.coalesce(func.sum(ParkingLot.occupied_spots_count), 0).label('occupied_spots'),
+        total_users.label('total_users'),
+        active_reservations.label('active_reservations')
+    )).one()
+    
+    stats = dict(row._mapping)
+    stats['available_spots'] = stats['total_spots'] - stats['occupied_spots']
+    return stats
+
+def get_dashboard_stats():
+    """Return cached dashboard statistics, recomputing them once the TTL expires."""
+    global _cached_stats, _cached_at
+    
+    ttl = app.config.get('DASHBOARD_STATS_TTL', 0)
+    with _cache_lock:
+        if _cached_stats is not None and time.monotonic() - _cached_at < ttl:
+            return dict(_cached_stats)
+        generation = _generation
+    
+    stats = compute_dashboard_stats()
+    with _cache_lock:
+        if generation == _generation:
+            _cached_stats = stats
+            _cached_at = time.monotonic()
+    return dict(stats)
+
+def invalidate_dashboard_stats():
+    global _cached_stats, _generation
+    with _cache_lock:
+        _cached_stats = None
+        _generation += 1
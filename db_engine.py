@@ -0,0 +1,60 @@
+"""
+Database engine configuration.
+
+DATABASE_URL selects the database (SQLite by default, PostgreSQL or any
+other SQLAlchemy URL otherwise). Pool sizing and pre-ping settings become
+SQLALCHEMY_ENGINE_OPTIONS, and every new SQLite connection gets the
+configured pragmas: WAL lets readers proceed while a booking writes,
+synchronous=NORMAL is durable enough under WAL, and the busy timeout makes
+competing gunicorn workers wait for the write lock instead of failing
+with "database is locked".
+"""
+
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+SQLITE_PRAGMAS = {
+    'SQLITE_JOURNAL_MODE': 'journal_mode',
+    'SQLITE_SYNCHRONOUS': 'synchronous',
+    'SQLITE_BUSY_TIMEOUT_MS': 'busy_timeout',
+    'SQLITE_MMAP_SIZE': 'mmap_size',
+    'SQLITE_CACHE_SIZE': 'cache_size',
+}
+
+def database_url(url):
+    # Hosting platforms still hand out the postgres:// scheme SQLAlchemy dropped
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def is_memory_sqlite(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database URL."""
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+    # In-memory SQLite lives in a single connection, so it has no pool to size
+    if not is_memory_sqlite(config['SQLALCHEMY_DATABASE_URI']):
+        options['pool_size'] = config['DB_POOL_SIZE']
+        options['max_overflow'] = config['DB_MAX_OVERFLOW']
+        options['pool_recycle'] = config['DB_POOL_RECYCLE']
+    return options
+
+def register_sqlite_pragmas(config):
+    """Apply the configured pragmas to every new SQLite connection.
+
+    A pragma whose setting is empty is left at SQLite's default.
+    """
+    pragmas = [(pragma, config[key]) for key, pragma in SQLITE_PRAGMAS.items() if config.get(key) != '']
+
+    @event.listens_for(Engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas:
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+        cursor.close()
@@ -0,0 +1,64 @@
+"""
+Read/write splitting between the primary database and a read replica.
+
+When REPLICA_DATABASE_URL is configured it becomes the `replica` bind.
+Views decorated with @read_replica send their SELECTs there; flushes and
+every other statement stay on the primary, as do all reads once the
+request has written. A request that writes pins its browser session to
+the primary for REPLICA_PIN_SECONDS, so a user who has just booked or
+released reads their own change even while the replica lags behind.
+"""
+
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+REPLICA_BIND = 'replica'
+
+class RoutingSession(Session):
+    """Session that serves read-only views' SELECTs from the replica bind."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and isinstance(clause, Select) and self.reads_from_replica():
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def reads_from_replica(self):
+        return (has_app_context()
+                and g.get('read_replica', False)
+                and not g.get('wrote_primary', False)
+                and not self._flushing
+                and REPLICA_BIND in self._db.engines)
+
+def _mark_primary_written():
+    if has_app_context():
+        g.wrote_primary = True
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(session, flush_context):
+    _mark_primary_written()
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _after_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _mark_primary_written()
+
+def read_replica(view):
+    """Serve the view's reads from the replica unless the user just wrote."""
+    @wraps(view)
+    def decorated_view(*args, **kwargs):
+        g.read_replica = session.get('primary_until', 0) < time.time()
+        return view(*args, **kwargs)
+    return decorated_view
+
+def pin_primary_after_writes(response):
+    if g.get('wrote_primary') and REPLICA_BIND in current_app.config.get('SQLALCHEMY_BINDS', {}):
+        session['primary_until'] = time.time() + current_app.config['REPLICA_PIN_SECONDS']
+    return response
+
+def init_app(app):
+    app.after_request(pin_primary_after_writes)
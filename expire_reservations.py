@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Expire reservations that were never marked parked and return their spots
+
+job_worker.py already sweeps on a schedule; this runs a single sweep, for
+deployments that schedule it with cron instead.
+"""
+
+import argparse
+import sys
+
+from app import app
+from reservation_sweeper import expire_idle_reservations, reclaimed_spot_stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Expire idle reservations')
+    parser.add_argument('--grace', type=float, default=None,
+                        help='minutes a reservation may stay unparked (default RESERVATION_GRACE_MINUTES)')
+    args = parser.parse_args()
+    
+    with app.app_context():
+        grace = app.config['RESERVATION_GRACE_MINUTES'] if args.grace is None else args.grace
+        print(f'Expiring reservations not parked within {grace:g} minutes...')
+        reclaimed = expire_idle_reservations(grace)
+        for lot_id, count in sorted(reclaimed.items()):
+            print(f'   Lot {lot_id}: {count} spots reclaimed')
+        print(f'Reclaimed {sum(reclaimed.values())} spots; '
+              f'{reclaimed_spot_stats()["reclaimed"]} in the last 24 hours.')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+Streaming CSV and NDJSON exports of reservations and spots.
+
+An export is read through a server-side cursor EXPORT_FETCH_ROWS rows at a
+time and each batch is encoded and sent before the next one is fetched,
+so a year of reservations costs a worker one batch of memory and starts
+downloading at once. When the client accepts gzip the stream is
+compressed on the fly.
+
+Exports read from the read replica when one is configured (see
+db_routing). They use a connection of their own: the response body is
+generated after the view has returned and its session is gone.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from sqlalchemy import and_
+from app import app, db
+from app_models import User, ParkingLot, ParkingSpot, Reservation
+from db_routing import REPLICA_BIND
+from spot_provisioning import spot_number_order
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+def reservations_export_query(start=None, end=None, lot_id=None):
+    """Reservations with their user, lot and spot; [start, end) bounds the release time."""
+    query = (db.select(Reservation.id.label('reservation_id'),
+                       Reservation.user_id, User.username,
+                       ParkingSpot.lot_id, ParkingLot.prime_location_name.label('lot_name'),
+                       ParkingSpot.spot_number,
+                       Reservation.parking_timestamp, Reservation.leaving_timestamp,
+                       Reservation.parking_cost_per_unit_time, Reservation.total_cost, Reservation.expired)
+             .join(User, Reservation.user_id == User.id)
+             .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+             .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id))
+    if start is not None:
+        query = query.where(Reservation.leaving_timestamp >= start)
+    if end is not None:
+        query = query.where(Reservation.leaving_timestamp < end)
+    if lot_id is not None:
+        query = query.where(ParkingSpot.lot_id == lot_id)
+    if start is not None or end is not None:
+        return query.order_by(Reservation.leaving_timestamp, Reservation.id)
+    return query.order_by(Reservation.id)
+
+def spots_export_query(lot_id=None, status=None):
+    """Spots with their lot and the open reservation occupying them, if any."""
+    query = (db.select(ParkingSpot.id.label('spot_id'), ParkingSpot.lot_id,
+                       ParkingLot.prime_location_name.label('lot_name'),
+                       ParkingSpot.spot_number, ParkingSpot.status,
+                       Reservation.id.label('reservation_id'), Reservation.user_id,
+                       Reservation.parking_timestamp)
+             .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)
+             .outerjoin(Reservation, and_(Reservation.spot_id == ParkingSpot.id,
+                                          Reservation.leaving_timestamp.is_(None))))
+    if lot_id is not None:
+        query = query.where(ParkingSpot.lot_id == lot_id)
+    if status is not None:
+        query = query.where(ParkingSpot.status == status)
+    return query.order_by(ParkingSpot.lot_id, *spot_number_order())
+
+def export_engine():
+    return db.engines[REPLICA_BIND] if REPLICA_BIND in db.engines else db.engine
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def encode_batches(batches, columns, fmt):
+    """Encode batches of rows as CSV (with a header line) or NDJSON text."""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows([_plain(value) for value in row] for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        for rows in batches:
+            yield ''.join(json.dumps(dict(zip(columns, map(_plain, row)))) + '\n' for row in rows)
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def stream_export(query, fmt, gzip=False):
+    """Generate the export of `query` in `fmt`, optionally gzipped, as bytes.
+    
+    The engine and batch size are looked up now, so the generator can run
+    outside the request.
+    """
+    engine = export_engine()
+    fetch_rows = app.config['EXPORT_FETCH_ROWS']
+    
+    def generate():
+        with engine.connect() as conn:
+            result = conn.execution_options(yield_per=fetch_rows).execute(query)
+            chunks = (text.encode() for text in encode_batches(result.partitions(), list(result.keys()), fmt) if text)
+            yield from gzip_chunks(chunks) if gzip else chunks
+    
+    return generate()
@@ -1,7 +1,8 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, FloatField, IntegerField, TextAreaField, SelectField
-from wtforms.validators import DataRequired, Email, Length, NumberRange, ValidationError
+from wtforms.validators import DataRequired, Email, Length, NumberRange, Optional, ValidationError
 from app_models import User, ParkingLot
+from billing import parse_tiers
 
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=3, max=80)], 
@@ -42,8 +43,36 @@ class ParkingLotForm(FlaskForm):
                            render_kw={"placeholder": "Enter complete address", "class": "form-control", "rows": "3", "maxlength": "500"})
     pin_code = StringField('Pin Code', validators=[DataRequired(), Length(min=5, max=10)],
                           render_kw={"placeholder": "e.g., 12345", "class": "form-control", "pattern": "[0-9]{5,10}", "title": "Pin code must be 5-10 digits"})
-    maximum_number_of_spots = IntegerField('Maximum Number of Spots', validators=[DataRequired(), NumberRange(min=1, max=1000)],
-                                          render_kw={"placeholder": "e.g., 50", "class": "form-control", "min": "1", "max": "1000"})
+    maximum_number_of_spots = IntegerField('Maximum Number of Spots', validators=[DataRequired(), NumberRange(min=1, max=20000)],
+                                          render_kw={"placeholder": "e.g., 50", "class": "form-control", "min": "1", "max": "20000"})
+    peak_start_hour = IntegerField('Peak Starts (hour, UTC)', validators=[Optional(), NumberRange(min=0, max=23)],
+                                  render_kw={"placeholder": "e.g., 8", "class": "form-control", "min": "0", "max": "23"})
+    peak_end_hour = IntegerField('Peak Ends (hour, UTC)', validators=[Optional(), NumberRange(min=1, max=24)],
+                                render_kw={"placeholder": "e.g., 18", "class": "form-control", "min": "1", "max": "24"})
+    peak_multiplier = FloatField('Peak Price Multiplier', validators=[Optional(), NumberRange(min=0.1, max=10)],
+                                render_kw={"placeholder": "e.g., 1.5", "class": "form-control", "step": "0.05", "min": "0.1", "max": "10"})
+    duration_tiers = StringField('Duration Tiers', validators=[Optional(), Length(max=200)],
+                                render_kw={"placeholder": "e.g., 3:0.8, 24:0.5", "class": "form-control", "maxlength": "200"})
+    
+    def validate(self, extra_validators=None):
+        # Field validators are skipped for empty Optional fields, so the peak
+        # settings are checked together here
+        if not super().validate(extra_validators):
+            return False
+        peak = (self.peak_start_hour.data, self.peak_end_hour.data, self.peak_multiplier.data)
+        if any(value is not None for value in peak) and None in peak:
+            self.peak_end_hour.errors.append('Set the peak start, end and multiplier together, or leave all three empty.')
+            return False
+        if None not in peak and self.peak_end_hour.data <= self.peak_start_hour.data:
+            self.peak_end_hour.errors.append('The peak must end after it starts (windows cannot span midnight).')
+            return False
+        return True
+    
+    def validate_duration_tiers(self, duration_tiers):
+        try:
+            parse_tiers(duration_tiers.data)
+        except ValueError as e:
+            raise ValidationError(str(e))
 
 class BookParkingForm(FlaskForm):
     lot_id = SelectField('Parking Lot', coerce=int, validators=[DataRequired()])
@@ -51,5 +80,5 @@ class BookParkingForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(BookParkingForm, self).__init__(*args, **kwargs)
         # Populate choices with available parking lots
-        lots = ParkingLot.query.all()
-        self.lot_id.choices = [(lot.id, f"{lot.prime_location_name} - ${lot.price}/hr ({lot.available_spots_count} spots available)") for lot in lots if lot.available_spots_count > 0]
+        lots = ParkingLot.query.filter(ParkingLot.available_spots_count > 0).all()
+        self.lot_id.choices = [(lot.id, f"{lot.prime_location_name} - ${lot.price}/hr ({lot.available_spots_count} spots available)") for lot in lots]
@@ -0,0 +1,257 @@
+"""
+Batch ingestion of entry/exit events from gates and ANPR cameras.
+
+A gate posts many events at once, each with an event_id of its choosing
+and either the reservation or the spot it concerns:
+
+    {"event_id": "gate3-000123", "type": "park", "reservation_id": 42}
+    {"event_id": "gate3-000124", "type": "release", "spot_id": 17, "at": "2025-07-29T18:02:11"}
+
+A park moves the reservation's spot from 'R' to 'O'. A release closes the
+reservation at `at` (default: now) and frees the spot. An event naming a
+spot applies to that spot's open reservation.
+
+A batch is one transaction. One SELECT loads every reservation involved,
+the events are replayed in order in memory, and the outcome is written as
+one compare-and-set UPDATE of parking_spots per status transition, one
+executemany UPDATE of reservations plus one UPDATE pricing them all (see
+billing) and one INSERT into gate_events.
+Applied event ids are kept in gate_events, so a replayed event is
+reported as a duplicate instead of being applied twice. Rejected events
+are not recorded and may be sent again.
+
+If a browser click or the expiry sweeper changes one of the spots or
+closes one of the reservations while the batch is being applied, or a
+concurrent batch records the same event id, the batch is rolled back and
+re-read, up to GATE_BATCH_ATTEMPTS times.
+"""
+
+import json
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from app import app, db
+from app_models import ParkingSpot, Reservation, GateEvent, shift_spot_counts
+from audit import audit
+from billing import bill_reservations
+from jobs import enqueue
+
+EVENT_TYPES = ('park', 'release')
+EVENT_ID_MAX_LENGTH = 64
+# Bodies read_batch decodes; anything else is refused before it is read
+BATCH_MIMETYPES = ('application/json', 'application/x-ndjson', 'application/jsonl')
+
+class GateBatchConflict(Exception):
+    """The batch kept colliding with concurrent changes and was rolled back."""
+
+def read_batch(body, mimetype):
+    """Decode a request body into a list of raw events.
+    
+    Accepts NDJSON (one event per line) or JSON: a list of events or an
+    object with an "events" list. Raises ValueError for anything else.
+    """
+    try:
+        if mimetype in ('application/x-ndjson', 'application/jsonl'):
+            return [json.loads(line) for line in body.decode().splitlines() if line.strip()]
+        batch = json.loads(body or b'null')
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f'Invalid batch body: {e}')
+    if isinstance(batch, dict):
+        batch = batch.get('events')
+    if not isinstance(batch, list):
+        raise ValueError('Expected a list of events or {"events": [...]}')
+    return batch
+
+def parse_event(raw):
+    """Validate one raw event and return it normalized; raises ValueError."""
+    if not isinstance(raw, dict):
+        raise ValueError('event must be an object')
+    event_id = raw.get('event_id')
+    if not isinstance(event_id, str) or not 0 < len(event_id) <= EVENT_ID_MAX_LENGTH:
+        raise ValueError(f'event_id must be a string of 1 to {EVENT_ID_MAX_LENGTH} characters')
+    if raw.get('type') not in EVENT_TYPES:
+        raise ValueError("type must be 'park' or 'release'")
+    
+    targets = [key for key in ('reservation_id', 'spot_id') if raw.get(key) is not None]
+    if len(targets) != 1 or type(raw[targets[0]]) is not int:
+        raise ValueError('exactly one of reservation_id or spot_id is required, as an integer')
+    
+    at = raw.get('at')
+    if at is not None:
+        try:
+            at = datetime.fromisoformat(at)
+        except (TypeError, ValueError):
+            raise ValueError('at must be an ISO 8601 timestamp')
+        if at.tzinfo:
+            at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    
+    return {
+        'event_id': event_id,
+        'type': raw['type'],
+        'reservation_id': raw.get('reservation_id'),
+        'spot_id': raw.get('spot_id'),
+        'at': at,
+    }
+
+def open_reservations_query(reservation_ids, spot_ids):
+    """Open reservations named by id or by spot, with their spot's lot and status."""
+    return (db.select(Reservation.id, Reservation.spot_id, Reservation.parking_timestamp,
+                      ParkingSpot.lot_id, ParkingSpot.status)
+            .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+            .where(Reservation.leaving_timestamp.is_(None),
+                   or_(Reservation.id.in_(reservation_ids), Reservation.spot_id.in_(spot_ids))))
+
+def load_open_reservations(reservation_ids, spot_ids):
+    """In-memory state of the reservations a batch touches."""
+    rows = db.session.execute(open_reservations_query(reservation_ids, spot_ids)).all()
+    return [{
+        'id': row.id,
+        'spot_id': row.spot_id,
+        'lot_id': row.lot_id,
+        'parked_at': row.parking_timestamp,
+        'status_before': row.status,
+        'status': row.status,
+        'left_at': None,
+    } for row in rows]
+
+def apply_event(event, reservation, now):
+    """Apply one event to a reservation's in-memory state; return an error or None."""
+    if reservation is None or reservation['left_at']:
+        return 'no open reservation'
+    if event['type'] == 'park':
+        if reservation['status'] != 'R':
+            return 'already parked'
+        reservation['status'] = 'O'
+        return None
+    
+    left_at = min(event['at'] or now, now)
+    if left_at < reservation['parked_at']:
+        return 'release is earlier than the booking'
+    reservation['status'] = 'A'
+    reservation['left_at'] = left_at
+    return None
+
+def record_event_ids(applied):
+    """Insert applied events; False if a concurrent batch recorded one first."""
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    recorded = db.session.execute(
+        insert(GateEvent).on_conflict_do_nothing().returning(GateEvent.event_id),
+        applied
+    ).all()
+    return len(recorded) == len(applied)
+
+def apply_batch(raw_events):
+    now = datetime.utcnow()
+    results = [None] * len(raw_events)
+    events, seen = [], set()
+    for index, raw in enumerate(raw_events):
+        try:
+            event = parse_event(raw)
+        except ValueError as e:
+            event_id = raw.get('event_id') if isinstance(raw, dict) else None
+            results[index] = {'event_id': event_id, 'status': 'rejected', 'error': str(e)}
+            continue
+        if event['event_id'] in seen:
+            results[index] = {'event_id': event['event_id'], 'status': 'duplicate'}
+            continue
+        seen.add(event['event_id'])
+        events.append((index, event))
+    
+    replayed = dict(db.session.execute(
+        db.select(GateEvent.event_id, GateEvent.reservation_id).where(GateEvent.event_id.in_(seen))
+    ).all())
+    new_events = [event for _, event in events if event['event_id'] not in replayed]
+    reservations = load_open_reservations(
+        {event['reservation_id'] for event in new_events if event['reservation_id'] is not None},
+        {event['spot_id'] for event in new_events if event['spot_id'] is not None}
+    )
+    by_id = {reservation['id']: reservation for reservation in reservations}
+    by_spot = {reservation['spot_id']: reservation for reservation in reservations}
+    
+    applied = []
+    for index, event in events:
+        event_id = event['event_id']
+        if event_id in replayed:
+            results[index] = {'event_id': event_id, 'status': 'duplicate', 'reservation_id': replayed[event_id]}
+            continue
+        
+        if event['reservation_id'] is not None:
+            reservation = by_id.get(event['reservation_id'])
+        else:
+            reservation = by_spot.get(event['spot_id'])
+        error = apply_event(event, reservation, now)
+        if error:
+            results[index] = {'event_id': event_id, 'status': 'rejected', 'error': error}
+            continue
+        
+        results[index] = {'event_id': event_id, 'status': 'applied', 'reservation_id': reservation['id']}
+        applied.append({
+            'event_id': event_id,
+            'event_type': event['type'],
+            'reservation_id': reservation['id'],
+            'occurred_at': event['at'] or now,
+            'received_at': now,
+        })
+    
+    transitions = defaultdict(list)
+    for reservation in reservations:
+        if reservation['status'] != reservation['status_before']:
+            transitions[reservation['status_before'], reservation['status']].append(reservation)
+    for (from_status, to_status), moved in transitions.items():
+        result = db.session.execute(
+            db.update(ParkingSpot)
+            .where(ParkingSpot.id.in_([reservation['spot_id'] for reservation in moved]),
+                   ParkingSpot.status == from_status)
+            .values(status=to_status)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != len(moved):
+            return None
+        for lot_id, count in Counter(reservation['lot_id'] for reservation in moved).items():
+            shift_spot_counts(lot_id, from_status, to_status, count)
+    
+    released = [reservation for reservation in reservations if reservation['left_at']]
+    if released:
+        released_ids = [reservation['id'] for reservation in released]
+        # Compare-and-set like the spots: a reservation the sweeper or a
+        # release click closed meanwhile is not closed a second time
+        reservations_table = Reservation.__table__
+        result = db.session.execute(
+            db.update(reservations_table)
+            .where(reservations_table.c.id == bindparam('reservation_id'),
+                   reservations_table.c.leaving_timestamp.is_(None))
+            .values(leaving_timestamp=bindparam('left_at')),
+            [{'reservation_id': reservation['id'], 'left_at': reservation['left_at']} for reservation in released]
+        )
+        if db.engine.dialect.supports_sane_multi_rowcount and result.rowcount != len(released):
+            return None
+        bill_reservations(Reservation.id.in_(released_ids))
+        enqueue('record_releases', reservation_ids=released_ids)
+    
+    if applied and not record_event_ids(applied):
+        return None
+    
+    counts = Counter(result['status'] for result in results)
+    summary = {status: counts.get(status, 0) for status in ('applied', 'duplicate', 'rejected')}
+    if applied:
+        audit('gate_events', parked=sum(1 for event in applied if event['event_type'] == 'park'),
+              released=len(released), **summary)
+    db.session.commit()
+    summary['results'] = results
+    return summary
+
+def apply_gate_events(raw_events):
+    """Apply a batch of gate events in one transaction.
+    
+    Returns {'applied', 'duplicate', 'rejected', 'results'} with one result
+    per event, in order. Raises GateBatchConflict if concurrent changes
+    made every attempt fail.
+    """
+    for _ in range(app.config['GATE_BATCH_ATTEMPTS']):
+        summary = apply_batch(raw_events)
+        if summary is not None:
+            return summary
+        db.session.rollback()
+    raise GateBatchConflict('spots or event ids changed while the batch was applied; send it again')
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Issue monthly invoices for completed reservations
+
+    python generate_invoices.py                    # last month
+    python generate_invoices.py --period 2025-07 [--no-rerate] [--restart]
+
+Meant to run nightly from cron: the first run after a month ends re-rates
+and invoices it, later runs find the period done and exit. A run that was
+interrupted continues from its last checkpoint (see invoicing).
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+from app import app
+from invoicing import generate_invoices, period_bounds, previous_period
+
+def main():
+    parser = argparse.ArgumentParser(description='Issue monthly invoices')
+    parser.add_argument('--period', default=None, help='month to invoice, YYYY-MM (default: last month)')
+    parser.add_argument('--no-rerate', dest='rerate', action='store_false',
+                        help='invoice the stored costs without re-pricing the month first')
+    parser.add_argument('--restart', action='store_true', help='re-issue a period that was already invoiced')
+    args = parser.parse_args()
+    
+    period = args.period or previous_period()
+    try:
+        period_bounds(period)
+    except ValueError:
+        parser.error(f'--period must be YYYY-MM, not {period!r}')
+    
+    logging.getLogger().setLevel(logging.INFO)
+    with app.app_context():
+        print(f'Invoicing {period}...')
+        started = time.perf_counter()
+        run = generate_invoices(period, rerate=args.rerate, restart=args.restart)
+        elapsed = time.perf_counter() - started
+        print(f'{run.invoices} invoices for {run.reservations} reservations, '
+              f'${run.amount:.2f} in total ({elapsed:.1f}s).')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Monthly invoices: one row per user and period in the invoices table.
+
+generate_invoices() first re-prices the month with the current tariffs
+(billing.rerate_reservations), then streams the month's completed
+reservations ordered by user through a server-side cursor, INVOICE_FETCH_ROWS
+at a time, and sums each user's stays as they go by. Every
+INVOICE_CHECKPOINT_USERS users the invoices are upserted and the period's
+invoice_runs row records the last user done, in the same commit. Memory is
+bounded by one fetch plus one checkpoint of invoices whatever the size of
+the month, and a run that stops halfway resumes after the last checkpoint
+instead of starting over.
+
+The reservations are read on a connection of their own so the checkpoint
+commits do not close the cursor, and the cursor is closed as soon as the
+run stops: on SQLite a cursor left open keeps its read snapshot, and the
+connection would hand it to the next checkout.
+"""
+
+import logging
+from datetime import date, datetime
+from itertools import groupby
+
+from sqlalchemy.dialects import postgresql, sqlite
+from app import app, db
+from app_models import Reservation, Invoice, InvoiceRun
+from billing import epoch_hours, rerate_reservations
+
+logger = logging.getLogger('invoicing')
+
+def period_bounds(period):
+    """[start, end) of a "YYYY-MM" period; raises ValueError."""
+    start = datetime.strptime(period, '%Y-%m')
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, end
+
+def previous_period(today=None):
+    first_of_month = (today or date.today()).replace(day=1)
+    last_month = first_of_month.replace(year=first_of_month.year - 1, month=12) if first_of_month.month == 1 \
+        else first_of_month.replace(month=first_of_month.month - 1)
+    return last_month.strftime('%Y-%m')
+
+def billable_reservations_query(start, end, after_user_id=0):
+    """Completed, non-expired reservations released in [start, end), by user."""
+    return (db.select(Reservation.user_id,
+                      epoch_hours(Reservation.leaving_timestamp) - epoch_hours(Reservation.parking_timestamp),
+                      Reservation.total_cost)
+            .where(Reservation.leaving_timestamp >= start,
+                   Reservation.leaving_timestamp < end,
+                   Reservation.expired.is_(False),
+                   Reservation.user_id > after_user_id)
+            .order_by(Reservation.user_id))
+
+def save_checkpoint(run, invoices):
+    """Upsert a checkpoint's invoices and advance the run past their users."""
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    stmt = insert(Invoice)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['user_id', 'period'],
+        set_={
+            'reservations': stmt.excluded.reservations,
+            'hours': stmt.excluded.hours,
+            'amount': stmt.excluded.amount,
+            'issued_at': stmt.excluded.issued_at,
+        }
+    ), invoices)
+    run.last_user_id = invoices[-1]['user_id']
+    run.invoices += len(invoices)
+    run.reservations += sum(invoice['reservations'] for invoice in invoices)
+    run.amount += sum(invoice['amount'] for invoice in invoices)
+    db.session.commit()
+
+def generate_invoices(period, rerate=True, restart=False):
+    """Invoice every user's stays released in `period` ("YYYY-MM").
+    
+    Resumes an unfinished run of the period from its checkpoint; a finished
+    one is left alone unless `restart` is set, which re-rates and re-issues
+    the whole period. Returns the period's InvoiceRun.
+    """
+    start, end = period_bounds(period)
+    run = db.session.get(InvoiceRun, period)
+    if run is None:
+        run = InvoiceRun(period=period, status='rerating', last_user_id=0, invoices=0, reservations=0, amount=0)
+        db.session.add(run)
+        db.session.commit()
+    elif restart:
+        db.session.execute(db.delete(Invoice).where(Invoice.period == period))
+        run.status, run.last_user_id, run.invoices, run.reservations, run.amount = 'rerating', 0, 0, 0, 0
+        run.started_at, run.finished_at = datetime.utcnow(), None
+        db.session.commit()
+    elif run.status == 'done':
+        return run
+    elif run.last_user_id:
+        logger.info('Resuming invoices for %s after user %d', period, run.last_user_id)
+    
+    if run.status == 'rerating':
+        if rerate:
+            rerated = rerate_reservations(start, end)
+            logger.info('Re-rated %d reservations released in %s', rerated, period)
+        run.status = 'invoicing'
+        db.session.commit()
+    
+    checkpoint_users = app.config['INVOICE_CHECKPOINT_USERS']
+    issued_at = datetime.utcnow()
+    invoices = []
+    with db.engine.connect() as conn, conn.execution_options(yield_per=app.config['INVOICE_FETCH_ROWS']).execute(
+            billable_reservations_query(start, end, run.last_user_id)) as rows:
+        for user_id, stays in groupby(rows, key=lambda row: row[0]):
+            count = hours = amount = 0
+            for _, stay_hours, total_cost in stays:
+                count += 1
+                hours += stay_hours
+                amount += total_cost or 0
+            invoices.append({'user_id': user_id, 'period': period, 'reservations': count,
+                             'hours': round(hours, 2), 'amount': round(amount, 2), 'issued_at': issued_at})
+            if len(invoices) >= checkpoint_users:
+                save_checkpoint(run, invoices)
+                invoices = []
+    if invoices:
+        save_checkpoint(run, invoices)
+    
+    run.status = 'done'
+    run.finished_at = datetime.utcnow()
+    db.session.commit()
+    logger.info('Issued %d invoices for %s: %d reservations, %.2f', run.invoices, period,
+                run.reservations, run.amount)
+    return run
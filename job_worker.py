@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Background job worker for the Parking Management System
+
+Runs jobs from the jobs table, such as rollup updates and receipts after
+releases. Web processes already run their own jobs right after commit
+(JOBS_IN_PROCESS); this worker picks up retries, jobs from processes that
+stopped before running them, and everything when JOBS_IN_PROCESS=0.
+Every RESERVATION_SWEEP_SECONDS it also expires reservations that were
+never marked parked (see reservation_sweeper).
+
+    python job_worker.py          # run until interrupted
+    python job_worker.py --once   # sweep once, drain due jobs and exit
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+from app import app
+from jobs import requeue_stale_jobs, run_pending_jobs, job_stats
+from reservation_sweeper import expire_idle_reservations
+
+def main():
+    parser = argparse.ArgumentParser(description='Run background jobs')
+    parser.add_argument('--once', action='store_true', help='drain due jobs and exit')
+    parser.add_argument('--poll', type=float, default=1.0, help='seconds to sleep when no job is due')
+    args = parser.parse_args()
+    
+    logging.getLogger().setLevel(logging.INFO)
+    with app.app_context():
+        print(f"⚙️  Job worker started, queue: {job_stats()}")
+        next_sweep = 0.0
+        try:
+            while True:
+                if time.monotonic() >= next_sweep:
+                    expire_idle_reservations()
+                    next_sweep = time.monotonic() + app.config['RESERVATION_SWEEP_SECONDS']
+                requeued = requeue_stale_jobs()
+                if requeued:
+                    logging.warning('Requeued %d jobs whose worker stopped', requeued)
+                ran = run_pending_jobs()
+                if args.once and not ran:
+                    break
+                if not ran:
+                    time.sleep(args.poll)
+        except KeyboardInterrupt:
+            pass
+        print(f"⚙️  Job worker stopped, queue: {job_stats()}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+Background jobs backed by the jobs table.
+
+enqueue() adds a job row to the current session, so a job exists if and
+only if the request's state change commits. After that commit a small
+in-process thread pool picks the job up (JOBS_IN_PROCESS), and
+job_worker.py drains whatever is left: jobs enqueued while no pool was
+running, retries that are due, and jobs abandoned by a crashed process.
+
+A job is claimed with a compare-and-set UPDATE, so each attempt runs in
+exactly one thread. The handler's writes commit together with the job's
+'done' status, set by another compare-and-set on the claim: if the lease
+expired and another worker claimed the job meanwhile, the late attempt's
+writes are rolled back instead of being applied twice. A failure rolls
+them back too and the job is retried with exponential backoff until
+JOB_MAX_ATTEMPTS, then marked 'failed'.
+"""
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from app import app, db
+from app_models import Job
+
+logger = logging.getLogger('jobs')
+
+RETRY_BASE_SECONDS = 2
+
+_handlers = {}
+_executor = None
+_executor_lock = threading.Lock()
+_queued_drains = 0
+_last_purge = None
+
+def job(name):
+    """Register a function as the handler for jobs called `name`."""
+    def register(handler):
+        _handlers[name] = handler
+        return handler
+    return register
+
+def enqueue(name, **payload):
+    """Schedule a job to run after the current transaction commits."""
+    db.session.add(Job(
+        name=name,
+        payload=json.dumps(payload),
+        max_attempts=app.config['JOB_MAX_ATTEMPTS']
+    ))
+    db.session.info['jobs_enqueued'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_committed(session):
+    if session.info.pop('jobs_enqueued', False) and app.config['JOBS_IN_PROCESS']:
+        dispatch()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop('jobs_enqueued', None)
+
+def dispatch():
+    """Have the in-process pool drain due jobs, without piling up drains."""
+    global _executor, _queued_drains
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config['JOB_WORKERS'], thread_name_prefix='jobs')
+        if _queued_drains >= app.config['JOB_WORKERS']:
+            return
+        _queued_drains += 1
+    _executor.submit(_drain_in_app_context)
+
+def _drain_in_app_context():
+    global _queued_drains
+    with _executor_lock:
+        _queued_drains -= 1
+    with app.app_context():
+        run_pending_jobs()
+
+def claim_job():
+    """Mark the oldest due pending job as running; return its id or None."""
+    while True:
+        now = datetime.utcnow()
+        job_id = db.session.execute(
+            db.select(Job.id)
+            .where(Job.status == 'pending', Job.run_after <= now)
+            .order_by(Job.id)
+            .limit(1)
+        ).scalar()
+        if job_id is None:
+            return None
+        
+        result = db.session.execute(
+            db.update(Job)
+            .where(Job.id == job_id, Job.status == 'pending')
+            .values(status='running', attempts=Job.attempts + 1, locked_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if result.rowcount == 1:
+            return job_id
+
+def finish_job(job_id, claimed_at, **values):
+    """Update the job row of this attempt; False if its lease was lost.
+
+    requeue_stale_jobs() may have handed a slow job to another worker, which
+    claimed it with a new locked_at. The row then belongs to that attempt.
+    """
+    result = db.session.execute(
+        db.update(Job)
+        .where(Job.id == job_id, Job.status == 'running', Job.locked_at == claimed_at)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+def run_job(job_id):
+    job_row = db.session.get(Job, job_id, populate_existing=True)
+    name, claimed_at, attempts = job_row.name, job_row.locked_at, job_row.attempts
+    try:
+        handler = _handlers.get(name)
+        if handler is None:
+            raise LookupError(f'no handler registered for job {name!r}')
+        handler(**json.loads(job_row.payload))
+        if not finish_job(job_id, claimed_at, status='done', finished_at=datetime.utcnow(), last_error=None):
+            # Another worker owns the job now; its run is the one that counts
+            db.session.rollback()
+            logger.warning('Job %s (%s) lost its lease while running; discarded its writes', job_id, name)
+            return False
+        db.session.commit()
+        return True
+    except Exception as exc:
+        db.session.rollback()
+        if attempts >= job_row.max_attempts:
+            finished = finish_job(job_id, claimed_at, status='failed', finished_at=datetime.utcnow(),
+                                  last_error=repr(exc)[:1000])
+            if finished:
+                logger.error('Job %s (%s) failed after %d attempts: %r', job_id, name, attempts, exc)
+        else:
+            delay = RETRY_BASE_SECONDS ** attempts
+            finished = finish_job(job_id, claimed_at, status='pending', last_error=repr(exc)[:1000],
+                                  run_after=datetime.utcnow() + timedelta(seconds=delay))
+            if finished:
+                logger.warning('Job %s (%s) attempt %d failed, retrying in %ds: %r',
+                               job_id, name, attempts, delay, exc)
+                if app.config['JOBS_IN_PROCESS']:
+                    timer = threading.Timer(delay, dispatch)
+                    timer.daemon = True
+                    timer.start()
+        db.session.commit()
+        return False
+
+def run_pending_jobs(limit=None):
+    """Run due jobs until none are left (or `limit` ran); return how many ran."""
+    ran = 0
+    while limit is None or ran < limit:
+        job_id = claim_job()
+        if job_id is None:
+            break
+        run_job(job_id)
+        ran += 1
+    purge_finished_jobs()
+    return ran
+
+def requeue_stale_jobs():
+    """Return jobs whose worker died mid-run (lease expired) to the queue."""
+    expired = datetime.utcnow() - timedelta(seconds=app.config['JOB_LEASE_SECONDS'])
+    result = db.session.execute(
+        db.update(Job)
+        .where(Job.status == 'running', Job.locked_at < expired)
+        .values(status='pending', run_after=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+def purge_finished_jobs():
+    """Delete done jobs past JOB_RETENTION_HOURS, at most once a minute."""
+    global _last_purge
+    now = datetime.utcnow()
+    if _last_purge and now - _last_purge < timedelta(minutes=1):
+        return
+    _last_purge = now
+    db.session.execute(
+        db.delete(Job)
+        .where(Job.status == 'done', Job.finished_at < now - timedelta(hours=app.config['JOB_RETENTION_HOURS']))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+def wait_for_jobs(timeout=30):
+    """Block until no job is pending or running, e.g. before checking results."""
+    deadline = datetime.utcnow() + timedelta(seconds=timeout)
+    while datetime.utcnow() < deadline:
+        run_pending_jobs()
+        busy = db.session.execute(
+            db.select(func.count(Job.id))
+            .where(Job.status.in_(['pending', 'running']), Job.run_after <= datetime.utcnow())
+        ).scalar()
+        db.session.commit()
+        if not busy:
+            return True
+        time.sleep(0.05)
+    return False
+
+def job_stats():
+    counts = dict(db.session.execute(
+        db.select(Job.status, func.count(Job.id)).group_by(Job.status)
+    ).all())
+    return {status: counts.get(status, 0) for status in ('pending', 'running', 'done', 'failed')}
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Load test for the Parking Management System
+
+Starts the app under a local gunicorn and lets many simulated drivers loose
+on it. Every driver is an asyncio task with its own cookie jar: it
+registers, logs in, then repeatedly books via /user/book_parking_quick,
+marks the vehicle parked and releases it after a random dwell time. The run
+reports sustained bookings/sec, error rates per step and any spot that was
+handed to two drivers at once.
+
+    python load_test.py --drivers 200 --workers 4 --duration 120
+
+Pass --url to aim at an already running server instead of starting one.
+"""
+
+import argparse
+import asyncio
+import http.cookiejar
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from app import app, db
+from app_models import User, ParkingLot, ParkingSpot, Reservation, LotDailyStats
+from jobs import wait_for_jobs
+from spot_provisioning import add_spots
+from dashboard_stats import invalidate_dashboard_stats
+from perf import percentile
+
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+BOOKED_SPOT = re.compile(r'Parking spot (S\d+) reserved successfully')
+MARK_PARKED_LINK = re.compile(r'/user/mark_parked/(\d+)')
+NO_SPOTS = 'No available spots in selected parking lot.'
+
+class LoadStats:
+    """Outcome and latency of every HTTP step, shared by all drivers."""
+    
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bookings = []
+        self.lot_full = 0
+        self.held = {}
+        self.double_allocations = []
+        self.started = time.monotonic()
+    
+    def claim(self, lot_id, spot_number, driver):
+        holder = self.held.get((lot_id, spot_number))
+        if holder is not None and holder != driver:
+            self.double_allocations.append((lot_id, spot_number, holder, driver))
+        self.held[(lot_id, spot_number)] = driver
+    
+    def release(self, lot_id, spot_number, driver):
+        if self.held.get((lot_id, spot_number)) == driver:
+            del self.held[(lot_id, spot_number)]
+
+class Driver:
+    """One simulated driver: a cookie jar and the steps of a parking visit."""
+    
+    def __init__(self, base_url, name, stats):
+        self.base_url = base_url
+        self.name = name
+        self.stats = stats
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+    
+    def fetch(self, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        with self.opener.open(self.base_url + path, data=body, timeout=30) as response:
+            return response.read().decode()
+    
+    async def step(self, label, path, data=None):
+        """Run one request in the thread pool; None when it failed."""
+        started = time.perf_counter()
+        try:
+            page = await asyncio.get_running_loop().run_in_executor(None, self.fetch, path, data)
+        except (urllib.error.URLError, OSError):
+            self.stats.errors[label] += 1
+            page = None
+        self.stats.latencies[label].append((time.perf_counter() - started) * 1000)
+        return page
+    
+    async def submit_form(self, label, path, fields):
+        page = await self.step(f'{label}_form', path)
+        token = CSRF_TOKEN.search(page or '')
+        if not token:
+            return None
+        return await self.step(label, path, {'csrf_token': token.group(1), **fields})
+    
+    async def sign_up(self):
+        password = 'loadtest'
+        await self.submit_form('register', '/register', {
+            'username': self.name, 'email': f'{self.name}@example.com',
+            'password': password, 'confirm_password': password
+        })
+        page = await self.submit_form('login', '/login', {'username': self.name, 'password': password})
+        return page is not None and '/logout' in page
+    
+    async def visit(self, lot_id, rng, args):
+        """Book, park after arriving, release after the dwell time."""
+        page = await self.step('book', f'/user/book_parking_quick/{lot_id}', {})
+        if page is None:
+            return
+        if NO_SPOTS in page:
+            self.stats.lot_full += 1
+            return
+        spot = BOOKED_SPOT.search(page)
+        reservation = MARK_PARKED_LINK.search(page)
+        if not spot or not reservation:
+            self.stats.errors['book'] += 1
+            return
+        self.stats.claim(lot_id, spot.group(1), self.name)
+        self.stats.bookings.append(time.monotonic())
+        
+        await asyncio.sleep(rng.expovariate(1 / args.arrival))
+        await self.step('park', f'/user/mark_parked/{reservation.group(1)}')
+        await asyncio.sleep(rng.lognormvariate(0, 0.5) * args.dwell)
+        self.stats.release(lot_id, spot.group(1), self.name)
+        await self.step('release', f'/user/release_parking/{reservation.group(1)}')
+
+async def drive(driver, lot_ids, rng, args, deadline):
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+    if not await driver.sign_up():
+        driver.stats.errors['sign_up'] += 1
+        return
+    while time.monotonic() < deadline:
+        await driver.visit(rng.choice(lot_ids), rng, args)
+        await asyncio.sleep(rng.expovariate(1 / args.think))
+
+async def run_drivers(base_url, lot_ids, run_id, args):
+    stats = LoadStats()
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=args.drivers))
+    rng = random.Random(args.seed)
+    deadline = stats.started + args.ramp + args.duration
+    drivers = [Driver(base_url, f'load_{run_id}_{i}', stats) for i in range(args.drivers)]
+    await asyncio.gather(*(drive(driver, lot_ids, random.Random(rng.random()), args, deadline)
+                           for driver in drivers))
+    return stats
+
+def overlapping_reservations(lot_ids):
+    """Pairs of reservations that held the same spot at the same time."""
+    first, second = db.aliased(Reservation), db.aliased(Reservation)
+    now = datetime.utcnow()
+    return db.session.execute(
+        db.select(first.spot_id, first.id, second.id).join(
+            second, (second.spot_id == first.spot_id) & (second.id > first.id)
+        ).join(
+            ParkingSpot, ParkingSpot.id == first.spot_id
+        ).where(
+            ParkingSpot.lot_id.in_(lot_ids),
+            second.parking_timestamp < db.func.coalesce(first.leaving_timestamp, now),
+            first.parking_timestamp < db.func.coalesce(second.leaving_timestamp, now)
+        )
+    ).all()
+
+def create_lots(lots, spots):
+    lot_rows = [ParkingLot(prime_location_name=f'Load Test Lot {i}', price=2.0, address='Load test only',
+                           pin_code='00000', maximum_number_of_spots=spots) for i in range(1, lots + 1)]
+    db.session.add_all(lot_rows)
+    db.session.flush()
+    for lot in lot_rows:
+        add_spots(lot.id, spots, spots)
+    db.session.commit()
+    invalidate_dashboard_stats()
+    return [lot.id for lot in lot_rows]
+
+def remove_lots(lot_ids, run_id):
+    wait_for_jobs()
+    user_ids = db.select(User.id).where(User.username.like(f'load\\_{run_id}\\_%', escape='\\'))
+    Reservation.query.filter(Reservation.user_id.in_(user_ids)).delete(synchronize_session=False)
+    User.query.filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+    LotDailyStats.query.filter(LotDailyStats.lot_id.in_(lot_ids)).delete(synchronize_session=False)
+    for lot_id in lot_ids:
+        db.session.delete(db.session.get(ParkingLot, lot_id))
+    db.session.commit()
+    invalidate_dashboard_stats()
+
+def start_gunicorn(args):
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers), '--threads', str(args.threads),
+         '--bind', f'127.0.0.1:{args.port}', '--log-level', 'warning', 'main:app'],
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    base_url = f'http://127.0.0.1:{args.port}'
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base_url + '/login', timeout=1).close()
+            return server, base_url
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not come up')
+
+def summarize(stats, args, overlaps):
+    steps = {}
+    for label, durations in sorted(stats.latencies.items()):
+        durations = sorted(durations)
+        steps[label] = {
+            'requests': len(durations),
+            'errors': stats.errors[label],
+            'p50_ms': round(percentile(durations, 0.50), 1),
+            'p95_ms': round(percentile(durations, 0.95), 1),
+            'p99_ms': round(percentile(durations, 0.99), 1),
+        }
+    
+    # Sustained rate: bookings made once every driver has had the chance to start
+    steady = [at for at in stats.bookings if at >= stats.started + args.ramp]
+    requests = sum(step['requests'] for step in steps.values())
+    errors = sum(stats.errors.values())
+    return {
+        'parameters': vars(args),
+        'elapsed_seconds': round(time.monotonic() - stats.started, 1),
+        'bookings': len(stats.bookings),
+        'bookings_per_sec': round(len(steady) / args.duration, 2),
+        'lot_full': stats.lot_full,
+        'requests': requests,
+        'errors': errors,
+        'error_rate': round(errors / max(requests, 1), 4),
+        'double_allocations': len(stats.double_allocations),
+        'overlapping_reservations': len(overlaps),
+        'steps': steps,
+    }
+
+def report(summary):
+    print(f'\n{"step":<16}{"requests":>9}{"errors":>8}{"error %":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}')
+    for label, step in summary['steps'].items():
+        print(f'{label:<16}{step["requests"]:>9}{step["errors"]:>8}{step["errors"] / step["requests"] * 100:>8.1f}%'
+              f'{step["p50_ms"]:>9.1f}{step["p95_ms"]:>9.1f}{step["p99_ms"]:>9.1f}')
+    
+    print(f'\n   Bookings: {summary["bookings"]} in {summary["elapsed_seconds"]:.0f}s, '
+          f'{summary["bookings_per_sec"]:.1f}/s sustained after ramp-up')
+    print(f'   Lot full responses: {summary["lot_full"]}')
+    print(f'   Errors: {summary["errors"]} of {summary["requests"]} requests ({summary["error_rate"] * 100:.2f}%)')
+    print(f'   {"✓" if not summary["double_allocations"] else "✗"} '
+          f'Spots handed to two drivers (client view): {summary["double_allocations"]}')
+    print(f'   {"✓" if not summary["overlapping_reservations"] else "✗"} '
+          f'Overlapping reservations on one spot (database): {summary["overlapping_reservations"]}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate concurrent drivers against a local gunicorn')
+    parser.add_argument('--drivers', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=60, help='seconds of steady load after ramp-up')
+    parser.add_argument('--ramp', type=float, default=10, help='seconds over which drivers arrive')
+    parser.add_argument('--think', type=float, default=1.0, help='mean seconds between visits')
+    parser.add_argument('--arrival', type=float, default=0.5, help='mean seconds from booking to parking')
+    parser.add_argument('--dwell', type=float, default=3.0, help='median seconds parked')
+    parser.add_argument('--lots', type=int, default=3)
+    parser.add_argument('--spots', type=int, default=50, help='spots per load test lot')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=1, help='threads per gunicorn worker')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--url', help='use an already running server instead of starting gunicorn')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', action='store_true', help='keep the load test lots and users')
+    parser.add_argument('--output', help='also save the results as JSON')
+    args = parser.parse_args()
+    
+    run_id = int(time.time())
+    with app.app_context():
+        lot_ids = create_lots(args.lots, args.spots)
+    
+    server = None
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            server, base_url = start_gunicorn(args)
+        
+        print('🚗 Parking Management System load test')
+        print(f'   {args.drivers} drivers, {args.lots} lots x {args.spots} spots, '
+              f'{"external server" if args.url else f"{args.workers} gunicorn workers"} at {base_url}')
+        stats = asyncio.run(run_drivers(base_url, lot_ids, run_id, args))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    
+    with app.app_context():
+        overlaps = overlapping_reservations(lot_ids)
+        if not args.keep:
+            remove_lots(lot_ids, run_id)
+    
+    summary = summarize(stats, args, overlaps)
+    report(summary)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 0 if not summary['double_allocations'] and not summary['overlapping_reservations'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
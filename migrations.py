@@ -0,0 +1,67 @@
+"""
+Idempotent schema upgrades for existing database files.
+
+db.create_all() only creates missing tables and never alters tables that
+already exist, so columns and indexes added to the models later are applied
+here on startup.
+"""
+
+import logging
+
+from sqlalchemy import inspect
+from app import db
+
+# Indexes an older model defined and a newer one replaced, by table
+RETIRED_INDEXES = {
+    'parking_spots': ['ix_parking_spots_lot_status_number'],
+}
+
+def index_names(conn, inspector, table_name):
+    if conn.dialect.name == 'sqlite':
+        # SQLite reflection skips expression indexes, so read the catalog
+        return set(conn.execute(db.text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"
+        ), {'table': table_name}).scalars())
+    return {index['name'] for index in inspector.get_indexes(table_name)}
+
+def upgrade_schema():
+    """Add model columns and indexes missing from existing tables.
+
+    Returns the "table.column" names and index names that were added.
+    Indexes listed in RETIRED_INDEXES are dropped.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    added = []
+    
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}'
+                if column.server_default is not None:
+                    ddl += f' DEFAULT {column.server_default.arg.text}'
+                if not column.nullable:
+                    ddl += ' NOT NULL'
+                conn.execute(db.text(ddl))
+                added.append(f'{table.name}.{column.name}')
+            
+            existing_indexes = index_names(conn, inspector, table.name)
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
+                    added.append(index.name)
+            
+            for name in RETIRED_INDEXES.get(table.name, ()):
+                if name in existing_indexes:
+                    conn.execute(db.text(f'DROP INDEX {name}'))
+                    logging.info("Schema upgrade: dropped %s", name)
+    
+    for name in added:
+        logging.info("Schema upgrade: added %s", name)
+    return added
@@ -0,0 +1,105 @@
+"""
+In-process publish/subscribe of per-lot occupancy changes.
+
+shift_spot_counts() queues each counter change on the session; when the
+session commits, the changes are folded into one event per transaction
+and fanned out to every subscriber (the admin dashboards' SSE streams).
+Rolled-back changes are dropped. Each subscriber has a bounded queue: a
+client that falls behind is marked overflowed and resynchronised from a
+fresh snapshot instead of holding events in memory.
+
+Events only reach subscribers in the process that committed them. With
+several gunicorn workers each dashboard also receives a periodic snapshot
+(see OCCUPANCY_RESYNC_SECONDS in routes) that bounds how stale it can be.
+"""
+
+import queue
+import threading
+from collections import defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+STATUS_NAMES = {'A': 'available', 'R': 'reserved', 'O': 'occupied'}
+SUBSCRIBER_QUEUE_SIZE = 100
+
+class Subscription:
+    def __init__(self):
+        self.events = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+    
+    def put(self, occupancy_event):
+        try:
+            self.events.put_nowait(occupancy_event)
+        except queue.Full:
+            self.overflowed = True
+    
+    def get(self, timeout):
+        """Next event, or None when nothing arrived within `timeout` seconds."""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+    
+    def drain(self):
+        self.overflowed = False
+        while not self.events.empty():
+            self.events.get_nowait()
+
+_lock = threading.Lock()
+_subscribers = set()
+
+def subscribe():
+    subscription = Subscription()
+    with _lock:
+        _subscribers.add(subscription)
+    return subscription
+
+def unsubscribe(subscription):
+    with _lock:
+        _subscribers.discard(subscription)
+
+def subscriber_count():
+    with _lock:
+        return len(_subscribers)
+
+def publish(occupancy_event):
+    with _lock:
+        subscribers = list(_subscribers)
+    for subscription in subscribers:
+        subscription.put(occupancy_event)
+
+def queue_occupancy_delta(session, lot_id, from_status=None, to_status=None, count=1):
+    """Record a counter change to publish if `session` commits."""
+    deltas = session.info.setdefault('occupancy_deltas', defaultdict(lambda: defaultdict(int)))
+    if from_status:
+        deltas[lot_id][STATUS_NAMES[from_status]] -= count
+    if to_status:
+        deltas[lot_id][STATUS_NAMES[to_status]] += count
+
+@event.listens_for(Session, 'after_flush')
+def _queue_removed_lots(session, flush_context):
+    from app_models import ParkingLot
+    removed = [obj.id for obj in session.deleted if isinstance(obj, ParkingLot)]
+    if removed:
+        session.info.setdefault('occupancy_removed_lots', []).extend(removed)
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed(session):
+    deltas = session.info.pop('occupancy_deltas', None)
+    removed = session.info.pop('occupancy_removed_lots', None)
+    if not deltas and not removed:
+        return
+    
+    lots = {}
+    for lot_id, changes in (deltas or {}).items():
+        changes = {name: delta for name, delta in changes.items() if delta}
+        if changes:
+            lots[str(lot_id)] = changes
+    if lots or removed:
+        publish({'lots': lots, 'removed': removed or []})
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop('occupancy_deltas', None)
+    session.info.pop('occupancy_removed_lots', None)
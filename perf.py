@@ -0,0 +1,119 @@
+"""
+Per-request performance instrumentation.
+
+Cursor events on every engine count and time SQL statements for the
+current request. Each response gets a Server-Timing header and one
+structured log line, and the last PERF_SAMPLES_PER_ENDPOINT samples of
+every endpoint are kept in a bounded ring buffer for perf_summary().
+
+A streamed response is still running when after_request sees it, so its
+timings would only cover opening the stream: it is logged with
+"streamed": true and kept out of the headers and the percentiles.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app
+
+logger = logging.getLogger('perf')
+
+_lock = threading.Lock()
+_samples = {}
+
+# The start time lives on the statement's execution context, so a statement
+# that raises (and never reaches after_cursor_execute) leaves nothing behind
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._perf_start = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_perf_start', None)
+    if started is not None and has_request_context() and 'perf_started' in g:
+        g.perf_queries += 1
+        g.perf_db_seconds += time.perf_counter() - started
+
+@app.before_request
+def _start_request_timer():
+    g.perf_started = time.perf_counter()
+    g.perf_queries = 0
+    g.perf_db_seconds = 0.0
+
+@app.after_request
+def _record_request(response):
+    if 'perf_started' not in g:
+        return response
+    
+    total_ms = (time.perf_counter() - g.perf_started) * 1000
+    db_ms = g.perf_db_seconds * 1000
+    endpoint = request.endpoint or 'unmatched'
+    
+    if response.is_streamed:
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'streamed': True,
+        }))
+        return response
+    
+    response.headers.add('Server-Timing', f'db;dur={db_ms:.2f};desc="{g.perf_queries} queries"')
+    response.headers.add('Server-Timing', f'app;dur={total_ms - db_ms:.2f}')
+    response.headers.add('Server-Timing', f'total;dur={total_ms:.2f}')
+    
+    logger.info(json.dumps({
+        'method': request.method,
+        'path': request.path,
+        'endpoint': endpoint,
+        'status': response.status_code,
+        'duration_ms': round(total_ms, 2),
+        'db_ms': round(db_ms, 2),
+        'queries': g.perf_queries,
+    }))
+    
+    with _lock:
+        samples = _samples.get(endpoint)
+        if samples is None:
+            samples = _samples[endpoint] = deque(maxlen=app.config.get('PERF_SAMPLES_PER_ENDPOINT', 1000))
+        samples.append((total_ms, db_ms, g.perf_queries))
+    return response
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def perf_summary():
+    """Latency percentiles and query-count histograms per endpoint."""
+    with _lock:
+        snapshot = {endpoint: list(samples) for endpoint, samples in _samples.items()}
+    
+    summary = {}
+    for endpoint, samples in sorted(snapshot.items()):
+        durations = sorted(sample[0] for sample in samples)
+        summary[endpoint] = {
+            'requests': len(samples),
+            'latency_ms': {
+                'p50': round(percentile(durations, 0.50), 2),
+                'p95': round(percentile(durations, 0.95), 2),
+                'p99': round(percentile(durations, 0.99), 2),
+                'max': round(durations[-1], 2),
+            },
+            'db_ms_avg': round(sum(sample[1] for sample in samples) / len(samples), 2),
+            'queries_histogram': {str(count): frequency for count, frequency
+                                  in sorted(Counter(sample[2] for sample in samples).items())},
+        }
+    return summary
+
+def reset_perf_samples():
+    with _lock:
+        _samples.clear()
@@ -0,0 +1,53 @@
+"""
+Receipts for completed parking sessions.
+
+release_parking enqueues a 'send_receipt' job, so the driver gets an
+itemized receipt by email without the request waiting on a mail server.
+Receipts are sent through MAIL_SERVER when it is configured and written
+to the 'receipts' logger otherwise. A mail server that is down fails the
+attempt and the job is retried like any other.
+"""
+
+import logging
+import smtplib
+from email.message import EmailMessage
+
+from app import app, db
+from app_models import Reservation
+from jobs import job
+
+logger = logging.getLogger('receipts')
+
+def build_receipt(reservation):
+    spot = reservation.parking_spot
+    lot = spot.parking_lot
+    message = EmailMessage()
+    message['Subject'] = f'Parking receipt #{reservation.id}'
+    message['From'] = app.config['MAIL_SENDER']
+    message['To'] = reservation.user.email
+    message.set_content(
+        f'Hello {reservation.user.username},\n\n'
+        f'Thank you for parking with us.\n\n'
+        f'Reservation: #{reservation.id}\n'
+        f'Location:    {lot.prime_location_name}, {lot.address}\n'
+        f'Spot:        {spot.spot_number}\n'
+        f'Parked:      {reservation.parking_timestamp:%Y-%m-%d %H:%M} UTC\n'
+        f'Left:        {reservation.leaving_timestamp:%Y-%m-%d %H:%M} UTC\n'
+        f'Duration:    {reservation.duration_hours:.2f} hours\n'
+        f'Rate:        ${reservation.parking_cost_per_unit_time:.2f}/hour\n'
+        f'Total:       ${reservation.total_cost or 0:.2f}\n'
+    )
+    return message
+
+@job('send_receipt')
+def send_receipt(reservation_id):
+    reservation = db.session.get(Reservation, reservation_id)
+    if reservation is None or reservation.leaving_timestamp is None:
+        return
+    message = build_receipt(reservation)
+    
+    if not app.config['MAIL_SERVER']:
+        logger.info('Receipt for reservation %s to %s\n%s', reservation_id, message['To'], message.get_content())
+        return
+    with smtplib.SMTP(app.config['MAIL_SERVER'], app.config['MAIL_PORT'], timeout=30) as smtp:
+        smtp.send_message(message)
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Rebuild the denormalized per-lot spot counters from the parking_spots table
+"""
+
+from app import app
+from app_models import ParkingLot, reconcile_lot_counters
+
+def main():
+    with app.app_context():
+        print('Reconciling parking lot spot counters...')
+        reconcile_lot_counters()
+        
+        for lot in ParkingLot.query.order_by(ParkingLot.id).all():
+            print(f'   {lot.prime_location_name}: '
+                  f'{lot.available_spots_count} available, '
+                  f'{lot.reserved_spots_count} reserved, '
+                  f'{lot.occupied_spots_count} occupied')
+        print('Counters reconciled.')
+
+if __name__ == '__main__':
+    main()
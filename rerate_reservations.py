@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Re-price completed reservations with the lots' current tariffs
+
+    python rerate_reservations.py --start 2025-07-01 --end 2025-08-01 [--lot 3]
+
+Reservations released in [start, end) get a new total_cost computed in
+SQL batch by batch, and the daily revenue rollups of those days are
+refreshed. Expired reservations stay free.
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime
+
+from app import app
+from billing import rerate_reservations
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-price completed reservations')
+    parser.add_argument('--start', required=True, type=datetime.fromisoformat, help='first release date (YYYY-MM-DD)')
+    parser.add_argument('--end', required=True, type=datetime.fromisoformat, help='release date to stop before')
+    parser.add_argument('--lot', type=int, default=None, help='only this parking lot')
+    parser.add_argument('--batch', type=int, default=None, help='reservations per UPDATE (default RERATE_BATCH)')
+    args = parser.parse_args()
+    
+    with app.app_context():
+        print(f'Re-rating reservations released from {args.start:%Y-%m-%d} to {args.end:%Y-%m-%d}...')
+        started = time.perf_counter()
+        rerated = rerate_reservations(args.start, args.end, args.lot, args.batch)
+        elapsed = time.perf_counter() - started
+        print(f'Re-rated {rerated} reservations in {elapsed:.1f}s.')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Expiry of idle reservations.
+
+A booking holds its spot in 'R' until the driver marks it parked. Drivers
+who never arrive would hold the spot forever, so reservations still in 'R'
+RESERVATION_GRACE_MINUTES after booking are expired: the spot goes back to
+'A' and the reservation is closed at no cost with expired set.
+
+Each batch is two statements: an UPDATE of parking_spots whose target rows
+come from ix_reservations_open_parking (open reservations by booking time)
+and an UPDATE of the matching reservations. Only spots still in 'R' are
+reclaimed, so a driver who marks the spot parked at the same moment keeps
+it. job_worker.py sweeps every RESERVATION_SWEEP_SECONDS;
+expire_reservations.py runs one sweep, e.g. from cron.
+"""
+
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from app import app, db
+from app_models import ParkingLot, ParkingSpot, Reservation, shift_spot_counts
+from dashboard_stats import invalidate_dashboard_stats
+from jobs import enqueue
+
+logger = logging.getLogger('sweeper')
+
+_lock = threading.Lock()
+_stats = {'sweeps': 0, 'reclaimed': 0, 'last_sweep_at': None, 'last_reclaimed': 0}
+
+def idle_reservations_query(cutoff, limit):
+    """Spots of open reservations booked before `cutoff` that were never parked."""
+    return (db.select(Reservation.spot_id)
+            .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+            .where(Reservation.leaving_timestamp.is_(None),
+                   Reservation.parking_timestamp < cutoff,
+                   ParkingSpot.status == 'R')
+            .order_by(Reservation.parking_timestamp)
+            .limit(limit))
+
+def expire_batch(cutoff, limit, now):
+    """Expire up to `limit` idle reservations in one transaction.
+    
+    Returns {lot_id: spots reclaimed}.
+    """
+    reclaimed = db.session.execute(
+        db.update(ParkingSpot)
+        .where(ParkingSpot.id.in_(idle_reservations_query(cutoff, limit)), ParkingSpot.status == 'R')
+        .values(status='A')
+        .returning(ParkingSpot.id, ParkingSpot.lot_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not reclaimed:
+        db.session.commit()
+        return {}
+    
+    expired_ids = db.session.execute(
+        db.update(Reservation)
+        .where(Reservation.spot_id.in_([spot_id for spot_id, _ in reclaimed]),
+               Reservation.leaving_timestamp.is_(None))
+        .values(leaving_timestamp=now, total_cost=0, expired=True)
+        .returning(Reservation.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    
+    per_lot = Counter(lot_id for _, lot_id in reclaimed)
+    for lot_id, count in per_lot.items():
+        shift_spot_counts(lot_id, 'R', 'A', count)
+    enqueue('record_releases', reservation_ids=expired_ids)
+    db.session.commit()
+    return dict(per_lot)
+
+def expire_idle_reservations(grace_minutes=None, batch_size=None):
+    """Expire every reservation left in 'R' past the grace period.
+    
+    Commits after each batch so the write lock is held briefly. Returns
+    {lot_id: spots reclaimed} for the whole sweep.
+    """
+    if grace_minutes is None:
+        grace_minutes = app.config['RESERVATION_GRACE_MINUTES']
+    batch_size = batch_size or app.config['RESERVATION_SWEEP_BATCH']
+    now = datetime.utcnow()
+    cutoff = now - timedelta(minutes=grace_minutes)
+    
+    total = Counter()
+    while True:
+        per_lot = expire_batch(cutoff, batch_size, now)
+        total.update(per_lot)
+        if sum(per_lot.values()) < batch_size:
+            break
+    
+    reclaimed = sum(total.values())
+    with _lock:
+        _stats['sweeps'] += 1
+        _stats['reclaimed'] += reclaimed
+        _stats['last_sweep_at'] = now.isoformat()
+        _stats['last_reclaimed'] = reclaimed
+    if reclaimed:
+        invalidate_dashboard_stats()
+        logger.info('Expired %d idle reservations older than %s minutes: %s',
+                    reclaimed, grace_minutes, dict(total))
+    return dict(total)
+
+def reclaimed_spot_stats(hours=24):
+    """Spots reclaimed from expired reservations, per lot, over the last `hours`."""
+    since = datetime.utcnow() - timedelta(hours=hours)
+    rows = db.session.execute(
+        db.select(ParkingSpot.lot_id, ParkingLot.prime_location_name, func.count(Reservation.id))
+        .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+        .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)
+        .where(Reservation.expired.is_(True), Reservation.leaving_timestamp >= since)
+        .group_by(ParkingSpot.lot_id, ParkingLot.prime_location_name)
+        .order_by(ParkingSpot.lot_id)
+    ).all()
+    with _lock:
+        process = dict(_stats)
+    return {
+        'grace_minutes': app.config['RESERVATION_GRACE_MINUTES'],
+        'window_hours': hours,
+        'reclaimed': sum(count for _, _, count in rows),
+        'lots': [{'lot_id': lot_id, 'name': name, 'reclaimed': count} for lot_id, name, count in rows],
+        'this_process': process,
+    }
@@ -0,0 +1,116 @@
+"""
+Revenue time series for the admin charts.
+
+Revenue is booked on the day a reservation is released. Daily and weekly
+series read the lot_daily_stats rollup; hourly series range-scan
+reservations.leaving_timestamp (indexed). Either way a series is one
+grouped query, optionally split per parking lot, so a 90-day or one-year
+chart is still one round-trip.
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import TIMESTAMP, cast, func
+from app import db
+from app_models import ParkingLot, ParkingSpot, Reservation, LotDailyStats
+
+BUCKETS = ('hour', 'day', 'week')
+MAX_BUCKETS = 10000
+
+BUCKET_STEPS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+}
+
+BUCKET_LABELS = {
+    'hour': '%m/%d %H:00',
+    'day': '%m/%d',
+    'week': '%m/%d',
+}
+
+def bucket_start(moment, bucket):
+    """Floor a datetime to the start of its hour, day or ISO week (Monday)."""
+    if bucket == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+def bucket_expression(column, bucket, dialect=None):
+    """SQL expression flooring `column` to its bucket start, as a naive timestamp."""
+    if (dialect or db.engine.dialect.name) == 'postgresql':
+        # date_trunc() of a DATE returns timestamp with time zone; truncating
+        # a timestamp without time zone keeps the buckets naive like `starts`
+        return func.date_trunc(bucket, cast(column, TIMESTAMP(timezone=False)), type_=db.DateTime)
+    if bucket == 'hour':
+        return func.strftime('%Y-%m-%d %H:00:00', column)
+    if bucket == 'week':
+        return func.strftime('%Y-%m-%d 00:00:00', column, 'weekday 0', '-6 days')
+    return func.strftime('%Y-%m-%d 00:00:00', column)
+
+def revenue_series(start, end, bucket='day', by_lot=False):
+    """Revenue per bucket for reservations released in [start, end).
+
+    Returns a dict with bucket start datetimes, matching labels, the total
+    amount per bucket and, when `by_lot` is set, one amount list per lot.
+    Buckets without revenue are reported as 0.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f'bucket must be one of {", ".join(BUCKETS)}')
+    
+    first = bucket_start(start, bucket)
+    bucket_count = -(-(end - first) // BUCKET_STEPS[bucket])
+    if bucket_count > MAX_BUCKETS:
+        raise ValueError(f'range too large: {bucket_count} {bucket} buckets (max {MAX_BUCKETS})')
+    starts = [first + BUCKET_STEPS[bucket] * i for i in range(bucket_count)]
+    positions = {moment: i for i, moment in enumerate(starts)}
+    
+    if bucket == 'hour':
+        period = bucket_expression(Reservation.leaving_timestamp, bucket).label('period')
+        lot_id = ParkingSpot.lot_id
+        query = db.session.query(period, func.sum(Reservation.total_cost).label('amount')).filter(
+            Reservation.leaving_timestamp >= start,
+            Reservation.leaving_timestamp < end
+        )
+        if by_lot:
+            query = query.join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+    else:
+        period = bucket_expression(LotDailyStats.day, bucket).label('period')
+        lot_id = LotDailyStats.lot_id
+        query = db.session.query(period, func.sum(LotDailyStats.revenue).label('amount')).filter(
+            LotDailyStats.day >= first.date(),
+            LotDailyStats.day <= (end - timedelta(microseconds=1)).date()
+        )
+    
+    if by_lot:
+        query = query.add_columns(lot_id.label('lot_id')).group_by(period, lot_id)
+    else:
+        query = query.group_by(period)
+    
+    totals = [0.0] * len(starts)
+    lot_amounts = {}
+    for row in query:
+        moment = row.period if isinstance(row.period, datetime) else datetime.fromisoformat(row.period)
+        position = positions.get(moment)
+        if position is None:
+            continue
+        amount = float(row.amount or 0)
+        totals[position] += amount
+        if by_lot:
+            lot_amounts.setdefault(row.lot_id, [0.0] * len(starts))[position] += amount
+    
+    series = {
+        'buckets': starts,
+        'labels': [moment.strftime(BUCKET_LABELS[bucket]) for moment in starts],
+        'totals': [round(amount, 2) for amount in totals],
+    }
+    if by_lot:
+        names = dict(db.session.query(ParkingLot.id, ParkingLot.prime_location_name)
+                     .filter(ParkingLot.id.in_(lot_amounts)))
+        series['lots'] = [{
+            'lot_id': lot_id,
+            'name': names.get(lot_id, f'Lot {lot_id}'),
+            'amounts': [round(amount, 2) for amount in amounts]
+        } for lot_id, amounts in sorted(lot_amounts.items())]
+    return series
@@ -0,0 +1,186 @@
+"""
+Per-lot daily rollups of revenue and utilization.
+
+lot_daily_stats holds one row per lot and day: revenue and sessions of
+reservations released that day, hours spots were in use that day, and the
+peak number of spots in use when a booking was made. A booking raises the
+peak in its own transaction; releases enqueue record_release jobs
+(record_releases for reservations closed in bulk by the expiry sweeper
+and gate events) that add to the totals right after the change commits.
+Charts and reports read a few rows per day instead of rescanning
+reservations.
+backfill_daily_stats() rebuilds the table from history and
+refresh_daily_revenue() the revenue of a date range.
+"""
+
+import heapq
+from datetime import date, datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app_models import ParkingLot, ParkingSpot, Reservation, LotDailyStats
+from jobs import job
+
+BACKFILL_BATCH = 5000
+
+def upsert_daily_stats(lot_id, day, revenue=0, sessions=0, occupied_hours=0, peak_occupancy=0):
+    """Add to a lot's daily totals and raise its peak, creating the row if needed."""
+    dialect = db.engine.dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    greatest = func.greatest if dialect == 'postgresql' else func.max
+    
+    stmt = insert(LotDailyStats).values(
+        lot_id=lot_id,
+        day=day,
+        revenue=revenue,
+        sessions=sessions,
+        occupied_hours=occupied_hours,
+        peak_occupancy=peak_occupancy
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['lot_id', 'day'],
+        set_={
+            'revenue': LotDailyStats.revenue + stmt.excluded.revenue,
+            'sessions': LotDailyStats.sessions + stmt.excluded.sessions,
+            'occupied_hours': LotDailyStats.occupied_hours + stmt.excluded.occupied_hours,
+            'peak_occupancy': greatest(LotDailyStats.peak_occupancy, stmt.excluded.peak_occupancy),
+        }
+    )
+    db.session.execute(stmt)
+
+def refresh_daily_revenue(start, end, lot_id=None):
+    """Recompute revenue of the days in [start, end) from reservations, e.g. after re-rating."""
+    first_day = datetime.combine(start.date(), datetime.min.time())
+    released_on = func.date(Reservation.leaving_timestamp)
+    query = db.select(
+        ParkingSpot.lot_id, released_on, func.sum(Reservation.total_cost)
+    ).join(
+        ParkingSpot, Reservation.spot_id == ParkingSpot.id
+    ).where(
+        Reservation.leaving_timestamp >= first_day,
+        Reservation.leaving_timestamp < end
+    ).group_by(ParkingSpot.lot_id, released_on)
+    if lot_id is not None:
+        query = query.where(ParkingSpot.lot_id == lot_id)
+    
+    dialect = db.engine.dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    rows = [{
+        'lot_id': row_lot_id,
+        'day': day if isinstance(day, date) else date.fromisoformat(day),
+        'revenue': revenue or 0
+    } for row_lot_id, day, revenue in db.session.execute(query)]
+    if rows:
+        stmt = insert(LotDailyStats)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['lot_id', 'day'],
+            set_={'revenue': stmt.excluded.revenue}
+        ), rows)
+    db.session.commit()
+    return len(rows)
+
+def hours_per_day(start, end):
+    """Split the interval [start, end) into (day, hours) pieces."""
+    pieces = []
+    day_start = datetime.combine(start.date(), datetime.min.time())
+    while day_start < end:
+        next_day = day_start + timedelta(days=1)
+        overlap = min(end, next_day) - max(start, day_start)
+        pieces.append((day_start.date(), overlap.total_seconds() / 3600))
+        day_start = next_day
+    return pieces
+
+@job('record_release')
+def record_release_job(reservation_id, lot_id):
+    reservation = db.session.get(Reservation, reservation_id)
+    if reservation and reservation.leaving_timestamp:
+        record_release(reservation, lot_id)
+
+@job('record_releases')
+def record_releases_job(reservation_ids):
+    """Add a batch of closed reservations, summed per lot and day."""
+    totals = {}
+    def add(lot_id, day, revenue=0, sessions=0, hours=0):
+        row = totals.setdefault((lot_id, day), [0.0, 0, 0.0])
+        row[0] += revenue
+        row[1] += sessions
+        row[2] += hours
+    
+    rows = db.session.execute(
+        db.select(ParkingSpot.lot_id, Reservation.parking_timestamp,
+                  Reservation.leaving_timestamp, Reservation.total_cost)
+        .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+        .where(Reservation.id.in_(reservation_ids), Reservation.leaving_timestamp.isnot(None))
+    )
+    for lot_id, parked_at, left_at, total_cost in rows:
+        for day, hours in hours_per_day(parked_at, left_at):
+            add(lot_id, day, hours=hours)
+        add(lot_id, left_at.date(), revenue=total_cost or 0, sessions=1)
+    for (lot_id, day), (revenue, sessions, hours) in totals.items():
+        upsert_daily_stats(lot_id, day, revenue=revenue, sessions=sessions, occupied_hours=hours)
+
+def record_booking(lot_id, booked_at):
+    """Raise the day's peak to the lot's current in-use count after a booking."""
+    in_use = (db.select(ParkingLot.reserved_spots_count + ParkingLot.occupied_spots_count)
+              .where(ParkingLot.id == lot_id)
+              .scalar_subquery())
+    upsert_daily_stats(lot_id, booked_at.date(), peak_occupancy=in_use)
+
+def record_release(reservation, lot_id):
+    """Add a completed reservation's revenue, session and hours to the rollup."""
+    pieces = hours_per_day(reservation.parking_timestamp, reservation.leaving_timestamp)
+    for day, hours in pieces:
+        upsert_daily_stats(lot_id, day, occupied_hours=hours)
+    upsert_daily_stats(lot_id, reservation.leaving_timestamp.date(),
+                       revenue=reservation.total_cost or 0, sessions=1)
+
+def backfill_daily_stats():
+    """Rebuild lot_daily_stats from the full reservation history.
+
+    Streams reservations ordered by lot and start time and replays them
+    through a sweep line, so memory is bounded by the number of
+    simultaneously open sessions plus one row per lot and day.
+    """
+    db.session.query(LotDailyStats).delete()
+    
+    totals = {}
+    def add(lot_id, day, revenue=0, sessions=0, hours=0, peak=0):
+        row = totals.setdefault((lot_id, day), [0.0, 0, 0.0, 0])
+        row[0] += revenue
+        row[1] += sessions
+        row[2] += hours
+        row[3] = max(row[3], peak)
+    
+    current_lot, in_use = None, []
+    rows = db.session.query(
+        ParkingSpot.lot_id,
+        Reservation.parking_timestamp,
+        Reservation.leaving_timestamp,
+        Reservation.total_cost
+    ).join(
+        ParkingSpot, Reservation.spot_id == ParkingSpot.id
+    ).order_by(ParkingSpot.lot_id, Reservation.parking_timestamp).yield_per(BACKFILL_BATCH)
+    
+    for lot_id, parked_at, left_at, total_cost in rows:
+        if lot_id != current_lot:
+            current_lot, in_use = lot_id, []
+        while in_use and in_use[0] <= parked_at:
+            heapq.heappop(in_use)
+        heapq.heappush(in_use, left_at or datetime.max)
+        add(lot_id, parked_at.date(), peak=len(in_use))
+        
+        if left_at:
+            for day, hours in hours_per_day(parked_at, left_at):
+                add(lot_id, day, hours=hours)
+            add(lot_id, left_at.date(), revenue=total_cost or 0, sessions=1)
+    
+    db.session.bulk_insert_mappings(LotDailyStats, [{
+        'lot_id': lot_id,
+        'day': day,
+        'revenue': revenue,
+        'sessions': sessions,
+        'occupied_hours': hours,
+        'peak_occupancy': peak
+    } for (lot_id, day), (revenue, sessions, hours, peak) in totals.items()])
+    db.session.commit()
+    return len(totals)
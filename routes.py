@@ -1,10 +1,28 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify
+import hmac
+import json
+import time
+from flask import render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
 from app import app, db
-from app_models import User, ParkingLot, ParkingSpot, Reservation
+from app_models import User, ParkingLot, ParkingSpot, Reservation, Invoice, SPOT_STATUS_COUNTERS, shift_spot_counts
 from forms import LoginForm, RegisterForm, ParkingLotForm, BookParkingForm
+from spot_allocator import allocate_spot
+from spot_provisioning import add_spots, remove_spots
+from dashboard_stats import get_dashboard_stats, invalidate_dashboard_stats
+from revenue import revenue_series, bucket_start
+from jobs import enqueue
+from audit import audit
+from user_cache import active_reservation, forget_active_reservation, user_cache_stats
+from perf import perf_summary
+from db_routing import read_replica
+from occupancy_events import subscribe, unsubscribe
+from reservation_sweeper import reclaimed_spot_stats
+from gate_events import BATCH_MIMETYPES, GateBatchConflict, apply_gate_events, read_batch
+from billing import quote, parse_tiers, format_tiers, set_lot_tiers
+from exports import EXPORT_FORMATS, reservations_export_query, spots_export_query, stream_export
 from sqlalchemy import func
 
 @app.route('/')
@@ -42,7 +60,9 @@ def register():
         user.password_hash = generate_password_hash(form.password.data)
         user.is_admin = False
         db.session.add(user)
+        audit('register', username=user.username)
         db.session.commit()
+        invalidate_dashboard_stats()
         flash('Registration successful! Please log in.', 'success')
         return redirect(url_for('login'))
     return render_template('register.html', form=form)
@@ -63,22 +83,18 @@ def admin_dashboard():
         return redirect(url_for('user_dashboard'))
     
     # Statistics
-    total_lots = ParkingLot.query.count()
-    total_spots = ParkingSpot.query.count()
-    occupied_spots = ParkingSpot.query.filter_by(status='O').count()
-    total_users = User.query.filter_by(is_admin=False).count()
-    active_reservations = Reservation.query.filter_by(leaving_timestamp=None).count()
+    stats = get_dashboard_stats()
     
     # Recent lots
     recent_lots = ParkingLot.query.order_by(ParkingLot.created_at.desc()).limit(5).all()
     
     return render_template('admin/dashboard.html', 
-                         total_lots=total_lots,
-                         total_spots=total_spots,
-                         occupied_spots=occupied_spots,
-                         available_spots=total_spots - occupied_spots,
-                         total_users=total_users,
-                         active_reservations=active_reservations,
+                         total_lots=stats['total_lots'],
+                         total_spots=stats['total_spots'],
+                         occupied_spots=stats['occupied_spots'],
+                         available_spots=stats['available_spots'],
+                         total_users=stats['total_users'],
+                         active_reservations=stats['active_reservations'],
                          recent_lots=recent_lots)
 
 @app.route('/admin/create_lot', methods=['GET', 'POST'])
@@ -96,24 +112,29 @@ def create_lot():
         lot.address = form.address.data
         lot.pin_code = form.pin_code.data
         lot.maximum_number_of_spots = form.maximum_number_of_spots.data
+        apply_tariff(lot, form)
         db.session.add(lot)
         db.session.flush()  # Get the ID
         
         # Create parking spots
         if form.maximum_number_of_spots.data:
-            for i in range(1, form.maximum_number_of_spots.data + 1):
-                spot = ParkingSpot()
-                spot.lot_id = lot.id
-                spot.spot_number = f"S{i:03d}"
-                spot.status = 'A'
-                db.session.add(spot)
+            add_spots(lot.id, form.maximum_number_of_spots.data, form.maximum_number_of_spots.data)
         
+        audit('create_lot', lot_id=lot.id, spots=lot.maximum_number_of_spots)
         db.session.commit()
+        invalidate_dashboard_stats()
         flash(f'Parking lot "{lot.prime_location_name}" created successfully with {lot.maximum_number_of_spots} spots!', 'success')
         return redirect(url_for('admin_dashboard'))
     
     return render_template('admin/create_lot.html', form=form)
 
+def apply_tariff(lot, form):
+    """Copy the peak window and duration tiers from a validated lot form."""
+    lot.peak_start_hour = form.peak_start_hour.data
+    lot.peak_end_hour = form.peak_end_hour.data
+    lot.peak_multiplier = form.peak_multiplier.data
+    set_lot_tiers(lot, parse_tiers(form.duration_tiers.data))
+
 @app.route('/admin/edit_lot/<int:lot_id>', methods=['GET', 'POST'])
 @login_required
 def edit_lot(lot_id):
@@ -123,9 +144,11 @@ def edit_lot(lot_id):
     
     lot = ParkingLot.query.get_or_404(lot_id)
     form = ParkingLotForm(obj=lot)
+    if not form.is_submitted():
+        form.duration_tiers.data = format_tiers(lot.pricing_tiers)
     
     if form.validate_on_submit():
-        current_spots = len(lot.parking_spots)
+        current_spots = lot.available_spots_count + lot.reserved_spots_count + lot.occupied_spots_count
         new_spots = form.maximum_number_of_spots.data or 0
         
         lot.prime_location_name = form.prime_location_name.data
@@ -133,32 +156,24 @@ def edit_lot(lot_id):
         lot.address = form.address.data
         lot.pin_code = form.pin_code.data
         lot.maximum_number_of_spots = form.maximum_number_of_spots.data
+        apply_tariff(lot, form)
         
         # Adjust parking spots
         if new_spots > current_spots:
-            # Add new spots
-            for i in range(current_spots + 1, new_spots + 1):
-                spot = ParkingSpot()
-                spot.lot_id = lot.id
-                spot.spot_number = f"S{i:03d}"
-                spot.status = 'A'
-                db.session.add(spot)
+            add_spots(lot.id, new_spots - current_spots, new_spots)
         elif new_spots < current_spots:
             # Remove spots safely - only available ones, starting from highest numbered spots
             spots_to_remove_count = current_spots - new_spots
-            spots_to_remove = ParkingSpot.query.filter_by(
-                lot_id=lot.id, 
-                status='A'
-            ).order_by(ParkingSpot.spot_number.desc()).limit(spots_to_remove_count).all()
+            removed = remove_spots(lot.id, spots_to_remove_count)
             
-            if len(spots_to_remove) < spots_to_remove_count:
-                flash(f'Cannot reduce to {new_spots} spots. Only {len(spots_to_remove)} spots are available for removal.', 'error')
+            if removed < spots_to_remove_count:
+                db.session.rollback()
+                flash(f'Cannot reduce to {new_spots} spots. Only {removed} spots are available for removal.', 'error')
                 return redirect(url_for('edit_lot', lot_id=lot.id))
-            
-            for spot in spots_to_remove:
-                db.session.delete(spot)
         
+        audit('edit_lot', lot_id=lot.id, spots=new_spots)
         db.session.commit()
+        invalidate_dashboard_stats()
         flash(f'Parking lot "{lot.prime_location_name}" updated successfully!', 'success')
         return redirect(url_for('admin_dashboard'))
     
@@ -174,31 +189,68 @@ def delete_lot(lot_id):
     lot = ParkingLot.query.get_or_404(lot_id)
     
     # Check if any spots are not available (occupied or reserved)
-    non_available_spots = ParkingSpot.query.filter(
-        ParkingSpot.lot_id == lot.id,
-        ParkingSpot.status.in_(['O', 'R'])
-    ).count()
+    non_available_spots = lot.occupied_spots_count + lot.reserved_spots_count
     if non_available_spots > 0:
         flash(f'Cannot delete "{lot.prime_location_name}". {non_available_spots} spots are still occupied or reserved.', 'error')
         return redirect(url_for('admin_dashboard'))
     
     db.session.delete(lot)
+    audit('delete_lot', lot_id=lot.id)
     db.session.commit()
+    invalidate_dashboard_stats()
     flash(f'Parking lot "{lot.prime_location_name}" deleted successfully!', 'success')
     return redirect(url_for('admin_dashboard'))
 
+USERS_PER_PAGE = 50
+
 @app.route('/admin/view_users')
 @login_required
+@read_replica
 def view_users():
     if not current_user.is_admin:
         flash('Access denied. Admin privileges required.', 'error')
         return redirect(url_for('user_dashboard'))
     
-    users = User.query.filter_by(is_admin=False).all()
-    return render_template('admin/view_users.html', users=users)
+    search = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    
+    # One page of users with the overall match count as a window column
+    page_users = db.session.query(
+        User.id,
+        User.username,
+        User.email,
+        User.created_at,
+        func.count().over().label('total')
+    ).filter(User.is_admin.is_(False))
+    if search:
+        page_users = page_users.filter(
+            func.lower(User.username).contains(search.lower(), autoescape=True) |
+            func.lower(User.email).contains(search.lower(), autoescape=True)
+        )
+    page_users = page_users.order_by(User.id).limit(USERS_PER_PAGE).offset((page - 1) * USERS_PER_PAGE).subquery()
+    
+    # Reservation count and active spot per user on the page
+    users = db.session.query(
+        page_users,
+        func.count(Reservation.id).label('reservation_count'),
+        func.min(ParkingSpot.spot_number).label('active_spot')
+    ).outerjoin(
+        Reservation, Reservation.user_id == page_users.c.id
+    ).outerjoin(
+        ParkingSpot, (ParkingSpot.id == Reservation.spot_id) & Reservation.leaving_timestamp.is_(None)
+    ).group_by(*page_users.c).order_by(page_users.c.id).all()
+    
+    total_users = users[0].total if users else 0
+    return render_template('admin/view_users.html',
+                         users=users,
+                         search=search,
+                         page=page,
+                         pages=-(-total_users // USERS_PER_PAGE),
+                         total_users=total_users)
 
 @app.route('/admin/search_spot')
 @login_required
+@read_replica
 def search_spot():
     if not current_user.is_admin:
         return jsonify({'error': 'Access denied'}), 403
@@ -232,8 +284,100 @@ def search_spot():
     
     return jsonify(result)
 
+SPOT_STATUS_LABELS = {'A': 'Available', 'R': 'Reserved', 'O': 'Occupied'}
+SEARCH_PAGE_DEFAULT = 100
+SEARCH_PAGE_MAX = 1000
+SEARCH_STREAM_BATCH = 500
+
+def search_spot_query(*criteria):
+    """Query spots with their lot and open reservation's user in one statement.
+    
+    Each row carries id, spot_number, status, lot_name, lot_address,
+    parked_since and username; the last two are None for free spots.
+    Rows are ordered by spot id, which doubles as the pagination cursor.
+    """
+    return db.session.query(
+        ParkingSpot.id,
+        ParkingSpot.spot_number,
+        ParkingSpot.status,
+        ParkingLot.prime_location_name.label('lot_name'),
+        ParkingLot.address.label('lot_address'),
+        Reservation.parking_timestamp.label('parked_since'),
+        User.username
+    ).join(
+        ParkingLot, ParkingSpot.lot_id == ParkingLot.id
+    ).outerjoin(
+        Reservation, (Reservation.spot_id == ParkingSpot.id) & Reservation.leaving_timestamp.is_(None)
+    ).outerjoin(
+        User, Reservation.user_id == User.id
+    ).filter(*criteria).order_by(ParkingSpot.id)
+
+def search_spot_info(row, include_lot=True):
+    spot_info = {
+        'spot_number': row.spot_number,
+        'status': SPOT_STATUS_LABELS.get(row.status, 'Unknown'),
+        'status_code': row.status
+    }
+    if include_lot:
+        spot_info['lot_name'] = row.lot_name
+        spot_info['lot_address'] = row.lot_address
+    
+    if row.status == 'O' and row.username:
+        spot_info['user'] = row.username
+        spot_info['parked_since'] = row.parked_since.strftime('%Y-%m-%d %H:%M')
+    
+    return spot_info
+
+def counted_spots(status='', lot_id=''):
+    """Number of spots matching a search, read from the per-lot counters."""
+    if status:
+        if status not in SPOT_STATUS_COUNTERS:
+            return 0
+        total = getattr(ParkingLot, SPOT_STATUS_COUNTERS[status])
+    else:
+        total = sum(getattr(ParkingLot, column) for column in SPOT_STATUS_COUNTERS.values())
+    
+    query = db.session.query(func.coalesce(func.sum(total), 0))
+    if lot_id:
+        query = query.filter(ParkingLot.id == lot_id)
+    return query.scalar()
+
+def search_spot_response(query, payload, include_lot=True, total_spots=None):
+    """Render a spot search as JSON, a keyset-paginated page, or NDJSON.
+    
+    `after` resumes after a spot id. `limit` returns one page plus a
+    `next_cursor`, SEARCH_PAGE_DEFAULT spots when only `after` is given;
+    `total_spots` of a page counts the whole search, not what is left.
+    `format=ndjson` streams one spot per line from a cursor so memory
+    stays flat regardless of result size.
+    """
+    whole = query
+    after = request.args.get('after', type=int)
+    if after:
+        query = query.filter(ParkingSpot.id > after)
+    
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            for row in query.yield_per(SEARCH_STREAM_BATCH):
+                yield json.dumps(search_spot_info(row, include_lot)) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    limit = request.args.get('limit', type=int) or (SEARCH_PAGE_DEFAULT if after else None)
+    if limit:
+        limit = max(1, min(limit, SEARCH_PAGE_MAX))
+        rows = query.limit(limit).all()
+        payload['next_cursor'] = rows[-1].id if len(rows) == limit else None
+        payload['total_spots'] = total_spots() if total_spots else whole.order_by(None).count()
+    else:
+        rows = query.all()
+        payload['total_spots'] = len(rows)
+    
+    payload['spots'] = [search_spot_info(row, include_lot) for row in rows]
+    return jsonify(payload)
+
 @app.route('/admin/search_by_lot')
 @login_required
+@read_replica
 def search_by_lot():
     if not current_user.is_admin:
         return jsonify({'error': 'Access denied'}), 403
@@ -246,33 +390,16 @@ def search_by_lot():
     if not lot:
         return jsonify({'error': 'Parking lot not found'}), 404
     
-    spots = ParkingSpot.query.filter_by(lot_id=lot_id).all()
-    status_map = {'A': 'Available', 'R': 'Reserved', 'O': 'Occupied'}
-    
-    spot_data = []
-    for spot in spots:
-        spot_info = {
-            'spot_number': spot.spot_number,
-            'status': status_map.get(spot.status, 'Unknown'),
-            'status_code': spot.status
-        }
-        
-        if spot.status == 'O' and spot.current_reservation:
-            reservation = spot.current_reservation
-            spot_info['user'] = reservation.user.username
-            spot_info['parked_since'] = reservation.parking_timestamp.strftime('%Y-%m-%d %H:%M')
-        
-        spot_data.append(spot_info)
-    
-    return jsonify({
-        'lot_name': lot.prime_location_name,
-        'lot_address': lot.address,
-        'total_spots': len(spots),
-        'spots': spot_data
-    })
+    return search_spot_response(
+        search_spot_query(ParkingSpot.lot_id == lot.id),
+        {'lot_name': lot.prime_location_name, 'lot_address': lot.address},
+        include_lot=False,
+        total_spots=lambda: lot.available_spots_count + lot.reserved_spots_count + lot.occupied_spots_count
+    )
 
 @app.route('/admin/search_by_status')
 @login_required
+@read_replica
 def search_by_status():
     if not current_user.is_admin:
         return jsonify({'error': 'Access denied'}), 403
@@ -280,36 +407,75 @@ def search_by_status():
     status = request.args.get('status', '')
     lot_id = request.args.get('lot_id', '')
     
-    query = ParkingSpot.query
+    criteria = []
     if status:
-        query = query.filter_by(status=status)
+        criteria.append(ParkingSpot.status == status)
     if lot_id:
-        query = query.filter_by(lot_id=lot_id)
-    
-    spots = query.all()
-    status_map = {'A': 'Available', 'R': 'Reserved', 'O': 'Occupied'}
-    
-    spot_data = []
-    for spot in spots:
-        spot_info = {
-            'spot_number': spot.spot_number,
-            'status': status_map.get(spot.status, 'Unknown'),
-            'status_code': spot.status,
-            'lot_name': spot.parking_lot.prime_location_name,
-            'lot_address': spot.parking_lot.address
-        }
-        
-        if spot.status == 'O' and spot.current_reservation:
-            reservation = spot.current_reservation
-            spot_info['user'] = reservation.user.username
-            spot_info['parked_since'] = reservation.parking_timestamp.strftime('%Y-%m-%d %H:%M')
-        
-        spot_data.append(spot_info)
+        criteria.append(ParkingSpot.lot_id == lot_id)
     
-    return jsonify({
-        'total_spots': len(spots),
-        'spots': spot_data
-    })
+    return search_spot_response(
+        search_spot_query(*criteria),
+        {},
+        total_spots=lambda: counted_spots(status, lot_id)
+    )
+
+def export_response(name, query, fmt):
+    """Stream an export as a download, gzipped when the client accepts it."""
+    gzip = request.accept_encodings['gzip'] > 0
+    headers = {
+        'Content-Disposition': f'attachment; filename={name}.{fmt}',
+        'Vary': 'Accept-Encoding',
+        'X-Accel-Buffering': 'no',
+    }
+    if gzip:
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_export(query, fmt, gzip), mimetype=EXPORT_FORMATS[fmt], headers=headers)
+
+def export_lot_id():
+    lot_id = request.args.get('lot_id', '')
+    if not lot_id:
+        return None
+    if not lot_id.isdigit():
+        raise ValueError('lot_id must be a lot id')
+    return int(lot_id)
+
+@app.route('/admin/export/reservations')
+@login_required
+def export_reservations():
+    """Reservations released between start and end (YYYY-MM-DD, inclusive), or all."""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    fmt = request.args.get('format', 'csv')
+    try:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f'format must be one of {", ".join(EXPORT_FORMATS)}')
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d') if request.args.get('start') else None
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d') + timedelta(days=1) if request.args.get('end') else None
+        lot_id = export_lot_id()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return export_response('reservations', reservations_export_query(start, end, lot_id), fmt)
+
+@app.route('/admin/export/spots')
+@login_required
+def export_spots():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    fmt = request.args.get('format', 'csv')
+    status = request.args.get('status') or None
+    try:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f'format must be one of {", ".join(EXPORT_FORMATS)}')
+        if status is not None and status not in SPOT_STATUS_COUNTERS:
+            raise ValueError(f'status must be one of {", ".join(SPOT_STATUS_COUNTERS)}')
+        lot_id = export_lot_id()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return export_response('spots', spots_export_query(lot_id, status), fmt)
 
 # User Routes
 @app.route('/user/dashboard')
@@ -319,7 +485,7 @@ def user_dashboard():
         return redirect(url_for('admin_dashboard'))
     
     # User's current reservation
-    current_reservation = Reservation.query.filter_by(user_id=current_user.id, leaving_timestamp=None).first()
+    current_reservation = active_reservation(current_user.id)
     
     # User's completed reservations
     completed_reservations = Reservation.query.filter(
@@ -327,12 +493,17 @@ def user_dashboard():
         Reservation.leaving_timestamp.isnot(None)
     ).order_by(Reservation.leaving_timestamp.desc()).limit(5).all()
     
+    # Price the open stay so far and any unbilled ones in one query
+    costs = quote([reservation.id for reservation in [current_reservation, *completed_reservations]
+                   if reservation is not None and reservation.total_cost is None])
+    
     # Available parking lots
     available_lots = ParkingLot.query.all()
     
     return render_template('user/dashboard.html',
                          current_reservation=current_reservation,
                          completed_reservations=completed_reservations,
+                         costs=costs,
                          available_lots=available_lots)
 
 @app.route('/user/book_parking', methods=['GET', 'POST'])
@@ -342,37 +513,30 @@ def book_parking():
         return redirect(url_for('admin_dashboard'))
     
     # Check if user already has an active reservation
-    active_reservation = Reservation.query.filter_by(user_id=current_user.id, leaving_timestamp=None).first()
-    if active_reservation:
+    if active_reservation(current_user.id):
         flash('You already have an active parking reservation. Please release it first.', 'warning')
         return redirect(url_for('user_dashboard'))
     
     form = BookParkingForm()
     if form.validate_on_submit():
-        # Find first available spot in selected lot
-        available_spot = ParkingSpot.query.filter_by(lot_id=form.lot_id.data, status='A').first()
-        
-        if not available_spot:
-            flash('No available spots in selected parking lot.', 'error')
-            return redirect(url_for('book_parking'))
-        
         # Get parking lot for pricing
         parking_lot = ParkingLot.query.get(form.lot_id.data)
         if not parking_lot:
             flash('Parking lot not found.', 'error')
             return redirect(url_for('book_parking'))
         
-        # Create reservation
-        reservation = Reservation()
-        reservation.spot_id = available_spot.id
-        reservation.user_id = current_user.id
-        reservation.parking_cost_per_unit_time = parking_lot.price  # Fix: Add cost per unit time
-        available_spot.status = 'R'  # Reserved status initially
+        # Reserve first available spot in selected lot
+        reservation = allocate_spot(parking_lot, current_user.id)
+        if not reservation:
+            flash('No available spots in selected parking lot.', 'error')
+            return redirect(url_for('book_parking'))
         
-        db.session.add(reservation)
+        audit('book', lot_id=parking_lot.id, spot_id=reservation.spot_id)
         db.session.commit()
+        forget_active_reservation(current_user.id)
+        invalidate_dashboard_stats()
         
-        flash(f'Parking spot {available_spot.spot_number} reserved successfully at {available_spot.parking_lot.prime_location_name}! Please park your vehicle and mark as occupied.', 'success')
+        flash(f'Parking spot {reservation.parking_spot.spot_number} reserved successfully at {parking_lot.prime_location_name}! Please park your vehicle and mark as occupied.', 'success')
         return redirect(url_for('user_dashboard'))
     
     return render_template('user/book_parking.html', form=form)
@@ -384,30 +548,27 @@ def book_parking_quick(lot_id):
         return redirect(url_for('admin_dashboard'))
     
     # Check if user already has an active reservation
-    active_reservation = Reservation.query.filter_by(user_id=current_user.id, leaving_timestamp=None).first()
-    if active_reservation:
+    if active_reservation(current_user.id):
         flash('You already have an active parking reservation. Please release it first.', 'warning')
         return redirect(url_for('user_dashboard'))
     
-    # Find first available spot in selected lot
-    available_spot = ParkingSpot.query.filter_by(lot_id=lot_id, status='A').first()
+    lot = ParkingLot.query.get(lot_id)
+    if not lot:
+        flash('Parking lot not found.', 'error')
+        return redirect(url_for('user_dashboard'))
     
-    if not available_spot:
+    # Reserve first available spot in selected lot
+    reservation = allocate_spot(lot, current_user.id)
+    if not reservation:
         flash('No available spots in selected parking lot.', 'error')
         return redirect(url_for('user_dashboard'))
     
-    # Create reservation
-    reservation = Reservation()
-    reservation.spot_id = available_spot.id
-    reservation.user_id = current_user.id
-    reservation.parking_cost_per_unit_time = available_spot.parking_lot.price
-    available_spot.status = 'R'  # Reserved status initially
-    
-    db.session.add(reservation)
+    audit('book', lot_id=lot.id, spot_id=reservation.spot_id)
     db.session.commit()
+    forget_active_reservation(current_user.id)
+    invalidate_dashboard_stats()
     
-    lot = available_spot.parking_lot
-    flash(f'Parking spot {available_spot.spot_number} reserved successfully at {lot.prime_location_name}! Please park your vehicle and mark as occupied.', 'success')
+    flash(f'Parking spot {reservation.parking_spot.spot_number} reserved successfully at {lot.prime_location_name}! Please park your vehicle and mark as occupied.', 'success')
     return redirect(url_for('user_dashboard'))
 
 @app.route('/user/mark_parked/<int:reservation_id>')
@@ -418,9 +579,23 @@ def mark_parked(reservation_id):
     
     reservation = Reservation.query.filter_by(id=reservation_id, user_id=current_user.id, leaving_timestamp=None).first_or_404()
     
-    # Mark spot as occupied
-    reservation.parking_spot.status = 'O'
+    # Mark spot as occupied; compare-and-set, since the expiry sweeper may
+    # have handed the spot back since the reservation was loaded
+    spot = reservation.parking_spot
+    if spot.status == 'R':
+        result = db.session.execute(
+            db.update(ParkingSpot)
+            .where(ParkingSpot.id == spot.id, ParkingSpot.status == 'R')
+            .values(status='O')
+        )
+        if result.rowcount != 1:
+            db.session.rollback()
+            flash('This reservation expired because the vehicle was not parked in time. Please book again.', 'warning')
+            return redirect(url_for('user_dashboard'))
+        shift_spot_counts(spot.lot_id, 'R', 'O')
+    audit('park', reservation_id=reservation.id, spot_id=spot.id)
     db.session.commit()
+    invalidate_dashboard_stats()
     
     flash(f'Vehicle marked as parked in spot {reservation.parking_spot.spot_number}. Billing has started.', 'success')
     return redirect(url_for('user_dashboard'))
@@ -432,21 +607,45 @@ def release_parking(reservation_id):
         return redirect(url_for('admin_dashboard'))
     
     reservation = Reservation.query.filter_by(id=reservation_id, user_id=current_user.id, leaving_timestamp=None).first_or_404()
+    spot = reservation.parking_spot
+    spot_id, lot_id, loaded_status = spot.id, spot.lot_id, spot.status
+    
+    # Close the reservation, priced with the lot's tariff, and free the spot.
+    # Both are compare-and-set: the expiry sweeper or a gate batch may have
+    # closed the reservation since it was loaded
+    left_at = datetime.utcnow()
+    cost = quote([reservation.id], left_at)[reservation.id]
+    closed = db.session.execute(
+        db.update(Reservation)
+        .where(Reservation.id == reservation.id, Reservation.leaving_timestamp.is_(None))
+        .values(leaving_timestamp=left_at, total_cost=cost)
+    )
+    freed = db.session.execute(
+        db.update(ParkingSpot)
+        .where(ParkingSpot.id == spot_id, ParkingSpot.status == loaded_status)
+        .values(status='A')
+    )
+    if closed.rowcount != 1 or freed.rowcount != 1:
+        db.session.rollback()
+        forget_active_reservation(current_user.id)
+        flash('This reservation was already closed, e.g. because it expired or a gate reported the exit.', 'warning')
+        return redirect(url_for('user_dashboard'))
     
-    # Update reservation
-    reservation.leaving_timestamp = datetime.utcnow()
-    reservation.total_cost = reservation.calculated_cost
-    
-    # Update spot status
-    reservation.parking_spot.status = 'A'
+    shift_spot_counts(lot_id, loaded_status, 'A')
+    enqueue('record_release', reservation_id=reservation_id, lot_id=lot_id)
+    enqueue('send_receipt', reservation_id=reservation_id)
+    audit('release', reservation_id=reservation_id, spot_id=spot_id, cost=cost)
     
     db.session.commit()
+    forget_active_reservation(current_user.id)
+    invalidate_dashboard_stats()
     
-    flash(f'Parking spot released successfully. Total cost: ${reservation.total_cost:.2f}', 'success')
+    flash(f'Parking spot released successfully. Total cost: ${cost:.2f}', 'success')
     return redirect(url_for('user_dashboard'))
 
 @app.route('/user/my_bookings')
 @login_required
+@read_replica
 def my_bookings():
     if current_user.is_admin:
         return redirect(url_for('admin_dashboard'))
@@ -454,47 +653,130 @@ def my_bookings():
     reservations = Reservation.query.filter_by(user_id=current_user.id).order_by(Reservation.parking_timestamp.desc()).all()
     return render_template('user/my_bookings.html', reservations=reservations)
 
+@app.route('/user/invoices')
+@login_required
+@read_replica
+def my_invoices():
+    if current_user.is_admin:
+        return redirect(url_for('admin_dashboard'))
+    
+    invoices = Invoice.query.filter_by(user_id=current_user.id).order_by(Invoice.period.desc()).all()
+    return render_template('user/invoices.html', invoices=invoices)
+
 # API Routes for Charts
 @app.route('/api/admin/chart_data')
 @login_required
+@read_replica
 def admin_chart_data():
     if not current_user.is_admin:
         return jsonify({'error': 'Access denied'}), 403
     
     # Parking lots data
     lots = ParkingLot.query.all()
+    lot_ids = [lot.id for lot in lots]
     lot_names = [lot.prime_location_name for lot in lots]
     occupied_counts = [lot.occupied_spots_count for lot in lots]
     available_counts = [lot.available_spots_count for lot in lots]
     
-    # Revenue data (last 7 days)
-    from datetime import timedelta
-    today = datetime.utcnow().date()
-    revenue_data = []
-    dates = []
-    
-    for i in range(6, -1, -1):
-        date = today - timedelta(days=i)
-        daily_revenue = db.session.query(func.sum(Reservation.total_cost)).filter(
-            func.date(Reservation.leaving_timestamp) == date
-        ).scalar() or 0
-        revenue_data.append(float(daily_revenue))
-        dates.append(date.strftime('%m/%d'))
+    # Revenue data (last 7 days by default)
+    bucket = request.args.get('bucket', 'day')
+    try:
+        if request.args.get('end'):
+            end = datetime.strptime(request.args['end'], '%Y-%m-%d') + timedelta(days=1)
+        else:
+            end = bucket_start(datetime.utcnow(), 'day') + timedelta(days=1)
+        if request.args.get('start'):
+            start = datetime.strptime(request.args['start'], '%Y-%m-%d')
+        else:
+            start = end - timedelta(days=7)
+        series = revenue_series(start, end, bucket, by_lot=request.args.get('by_lot') == '1')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    revenue = {
+        'dates': series['labels'],
+        'amounts': series['totals']
+    }
+    if 'lots' in series:
+        revenue['lots'] = series['lots']
     
     return jsonify({
         'lots': {
+            'ids': lot_ids,
             'names': lot_names,
             'occupied': occupied_counts,
             'available': available_counts
         },
-        'revenue': {
-            'dates': dates,
-            'amounts': revenue_data
-        }
+        'revenue': revenue
     })
 
+OCCUPANCY_HEARTBEAT_SECONDS = 15
+OCCUPANCY_RESYNC_SECONDS = 60
+
+def lot_occupancy():
+    """Every lot's counters, shaped like the `lots` part of admin chart data."""
+    lots = db.session.query(
+        ParkingLot.id,
+        ParkingLot.prime_location_name,
+        ParkingLot.occupied_spots_count,
+        ParkingLot.available_spots_count
+    ).order_by(ParkingLot.id).all()
+    return {
+        'ids': [lot.id for lot in lots],
+        'names': [lot.prime_location_name for lot in lots],
+        'occupied': [lot.occupied_spots_count for lot in lots],
+        'available': [lot.available_spots_count for lot in lots]
+    }
+
+def server_sent_event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+@app.route('/api/admin/occupancy_stream')
+@login_required
+def occupancy_stream():
+    """Server-Sent Events: a snapshot of every lot, then per-lot deltas.
+    
+    Deltas come from the in-process publisher, so an open dashboard costs
+    no queries between the periodic resync snapshots. A stream holds its
+    worker, so it ends after OCCUPANCY_STREAM_SECONDS and EventSource
+    reconnects; with OCCUPANCY_STREAM off the 204 tells it not to.
+    """
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    if not app.config['OCCUPANCY_STREAM']:
+        return '', 204
+    
+    subscription = subscribe()
+    snapshot = lot_occupancy()
+    db.session.remove()
+    closes_at = time.monotonic() + app.config['OCCUPANCY_STREAM_SECONDS']
+    
+    def generate():
+        try:
+            yield server_sent_event('snapshot', snapshot)
+            snapshot_at = time.monotonic()
+            while time.monotonic() < closes_at:
+                occupancy_event = subscription.get(
+                    timeout=min(OCCUPANCY_HEARTBEAT_SECONDS, max(closes_at - time.monotonic(), 0)))
+                if subscription.overflowed or time.monotonic() - snapshot_at >= OCCUPANCY_RESYNC_SECONDS:
+                    subscription.drain()
+                    with app.app_context():
+                        resync = lot_occupancy()
+                    yield server_sent_event('snapshot', resync)
+                    snapshot_at = time.monotonic()
+                elif occupancy_event:
+                    yield server_sent_event('occupancy', occupancy_event)
+                else:
+                    yield ': keepalive\n\n'
+        finally:
+            unsubscribe(subscription)
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/user/chart_data')
 @login_required
+@read_replica
 def user_chart_data():
     if current_user.is_admin:
         return jsonify({'error': 'Access denied'}), 403
@@ -515,6 +797,71 @@ def user_chart_data():
         'durations': durations
     })
 
+@app.route('/api/admin/cache_stats')
+@login_required
+def admin_cache_stats():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(user_cache_stats())
+
+@app.route('/api/admin/reclaimed_spots')
+@login_required
+def admin_reclaimed_spots():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    hours = request.args.get('hours', 24, type=float)
+    return jsonify(reclaimed_spot_stats(hours))
+
+@app.route('/admin/perf')
+@login_required
+def admin_perf():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(perf_summary())
+
+def gate_authorized():
+    """Gate devices presenting GATE_API_TOKEN as a bearer token.
+    
+    Session cookies are not accepted: the endpoint has no CSRF token, so
+    a page an admin visits could otherwise post events in their name.
+    """
+    token = app.config.get('GATE_API_TOKEN')
+    scheme, _, presented = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(presented.encode(), token.encode())
+
+@app.route('/api/gate/events', methods=['POST'])
+def ingest_gate_events():
+    """Apply a JSON or NDJSON batch of park/release events from gates.
+    
+    Returns per-event results in request order; see gate_events.
+    """
+    if not gate_authorized():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    if request.mimetype not in BATCH_MIMETYPES:
+        return jsonify({'error': f'Content-Type must be one of {", ".join(BATCH_MIMETYPES)}'}), 415
+    
+    request.max_content_length = app.config['GATE_BATCH_MAX_BYTES']
+    try:
+        events = read_batch(request.get_data(), request.mimetype)
+    except RequestEntityTooLarge:
+        return jsonify({'error': f'At most {app.config["GATE_BATCH_MAX_BYTES"]} bytes per batch'}), 413
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if len(events) > app.config['GATE_BATCH_MAX_EVENTS']:
+        return jsonify({'error': f'At most {app.config["GATE_BATCH_MAX_EVENTS"]} events per batch'}), 413
+    
+    try:
+        summary = apply_gate_events(events)
+    except GateBatchConflict as e:
+        return jsonify({'error': str(e)}), 409
+    if summary['applied']:
+        invalidate_dashboard_stats()
+    return jsonify(summary)
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
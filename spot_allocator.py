@@ -0,0 +1,89 @@
+"""
+Spot allocation for parking lots.
+
+Users cannot pick a spot; they always get the lowest-numbered available spot
+of the lot they choose. Both booking routes go through allocate_spot().
+
+Several workers may book the same lot at once, so a spot is never taken by
+reading it and then assigning status in Python. claim_spot() moves it from
+'A' to 'R' with a compare-and-set UPDATE (or a SKIP LOCKED row lock on
+PostgreSQL) so exactly one transaction wins each spot.
+"""
+
+from datetime import datetime
+from app import db
+from app_models import ParkingSpot, Reservation, shift_spot_counts
+from spot_provisioning import spot_number_order
+from rollups import record_booking
+
+def first_available_spot(lot_id):
+    """Return the lowest-numbered available spot in a lot, or None.
+
+    Resolved by ix_parking_spots_lot_status_number_order as a single index seek,
+    so the cost does not grow with the number of spots in the lot.
+    """
+    return ParkingSpot.query.filter_by(
+        lot_id=lot_id,
+        status='A'
+    ).order_by(*spot_number_order()).first()
+
+def claim_spot(lot_id):
+    """Atomically move the first available spot of a lot to reserved.
+
+    Returns the claimed spot, or None when the lot is full. The status
+    change is part of the current transaction and is not committed.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        # Concurrent claimers skip rows locked by each other instead of queueing
+        spot = ParkingSpot.query.filter_by(
+            lot_id=lot_id,
+            status='A'
+        ).order_by(*spot_number_order()).with_for_update(skip_locked=True).first()
+        if spot:
+            spot.status = 'R'
+        return spot
+    
+    # Compare-and-set: the UPDATE only matches while the spot is still
+    # available. Losing the race means another booking took that spot, so
+    # retry with the next candidate; this terminates once the lot is full.
+    while True:
+        spot_id = db.session.execute(
+            db.select(ParkingSpot.id)
+            .where(ParkingSpot.lot_id == lot_id, ParkingSpot.status == 'A')
+            .order_by(*spot_number_order())
+            .limit(1)
+        ).scalar()
+        if spot_id is None:
+            return None
+        
+        result = db.session.execute(
+            db.update(ParkingSpot)
+            .where(ParkingSpot.id == spot_id, ParkingSpot.status == 'A')
+            .values(status='R')
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            return db.session.get(ParkingSpot, spot_id, populate_existing=True)
+
+def allocate_spot(lot, user_id):
+    """Reserve the first available spot of `lot` for a user.
+
+    Adds the reservation to the session without committing and returns it,
+    or returns None when the lot is full.
+    """
+    spot = claim_spot(lot.id)  # Reserved status initially
+    if not spot:
+        return None
+    
+    reservation = Reservation()
+    reservation.spot_id = spot.id
+    reservation.user_id = user_id
+    reservation.parking_timestamp = datetime.utcnow()
+    reservation.parking_cost_per_unit_time = lot.price
+    shift_spot_counts(lot.id, 'A', 'R')
+    # The peak is the in-use count as of this booking, so it is raised in
+    # the booking's own transaction rather than by a job that runs later
+    record_booking(lot.id, reservation.parking_timestamp)
+    
+    db.session.add(reservation)
+    return reservation
@@ -0,0 +1,88 @@
+"""
+Bulk creation and removal of the spots of a parking lot.
+
+Spots are numbered S001, S002, ... and zero-padded to the width of the
+lot's size when it is created. Spots are never renamed: drivers and spot
+searches know them by number. When a lot later grows past that width the
+new numbers are simply longer (S999, S1000), so numeric order is length
+first, then spot_number; see spot_number_order(). The allocator and lot
+shrinking both rely on that order. All writes here are set-based and keep
+the lot's counters in step; nothing is committed.
+"""
+
+from sqlalchemy import func
+from app import db
+from app_models import ParkingSpot, Reservation, shift_spot_counts
+
+MIN_NUMBER_WIDTH = 3
+
+def spot_number_width(spot_count):
+    return max(MIN_NUMBER_WIDTH, len(str(spot_count)))
+
+def spot_number_order(descending=False):
+    """ORDER BY terms for numeric spot order: shorter numbers first.
+
+    They match ix_parking_spots_lot_status_number_order, so first-available
+    lookups stay a single index seek.
+    """
+    terms = (func.length(ParkingSpot.spot_number), ParkingSpot.spot_number)
+    return tuple(term.desc() for term in terms) if descending else terms
+
+def add_spots(lot_id, count, total):
+    """Add `count` available spots to a lot that will have `total` spots.
+
+    New spots take the lowest unused numbers, padded like the lot's
+    existing spots (or to the width of `total` for a new lot). Existing
+    spots keep their numbers.
+    """
+    if count <= 0:
+        return
+    
+    existing = db.session.scalars(
+        db.select(ParkingSpot.spot_number).where(ParkingSpot.lot_id == lot_id)
+    ).all()
+    used = {int(spot_number[1:]) for spot_number in existing}
+    # The shortest number of a lot is padded to its width; longer ones outgrew it
+    width = min(len(spot_number) - 1 for spot_number in existing) if existing else spot_number_width(total)
+    
+    numbers = []
+    candidate = 1
+    while len(numbers) < count:
+        if candidate not in used:
+            numbers.append(candidate)
+        candidate += 1
+    
+    db.session.execute(db.insert(ParkingSpot), [
+        {'lot_id': lot_id, 'spot_number': f"S{number:0{width}d}", 'status': 'A'}
+        for number in numbers
+    ])
+    shift_spot_counts(lot_id, to_status='A', count=count)
+
+def removable_spots_query(lot_id, count):
+    """Ids of up to `count` of a lot's highest-numbered available spots that were never booked.
+
+    The history check is a seek on ix_reservations_spot_leaving per candidate spot.
+    """
+    has_history = db.select(Reservation.id).where(Reservation.spot_id == ParkingSpot.id).exists()
+    return db.select(ParkingSpot.id).where(
+        ParkingSpot.lot_id == lot_id,
+        ParkingSpot.status == 'A',
+        ~has_history
+    ).order_by(*spot_number_order(descending=True)).limit(count)
+
+def remove_spots(lot_id, count):
+    """Delete up to `count` of a lot's highest-numbered removable spots.
+
+    Only available spots without any reservation history are removable.
+    Returns the number of spots actually deleted.
+    """
+    if count <= 0:
+        return 0
+    
+    result = db.session.execute(
+        db.delete(ParkingSpot)
+        .where(ParkingSpot.id.in_(removable_spots_query(lot_id, count).scalar_subquery()))
+        .execution_options(synchronize_session=False)
+    )
+    shift_spot_counts(lot_id, from_status='A', count=result.rowcount)
+    return result.rowcount
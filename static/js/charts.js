@@ -38,6 +38,9 @@ function loadAdminCharts() {
         .catch(error => {
             console.error('Error loading admin chart data:', error);
         });
+    
+    // Keep occupancy live from server-pushed events
+    subscribeOccupancy();
 }
 
 function loadParkingSpotsChart() {
@@ -178,20 +181,19 @@ function loadRevenueChart() {
     });
 }
 
+// Lot ids in the order of the lots chart bars
+let adminLotIds = [];
+
 function updateAdminCharts(data) {
     // Update spots chart
-    const spotsChart = Chart.getChart('spotsChart');
-    if (spotsChart && data.lots) {
-        const totalOccupied = data.lots.occupied.reduce((a, b) => a + b, 0);
-        const totalAvailable = data.lots.available.reduce((a, b) => a + b, 0);
-        
-        spotsChart.data.datasets[0].data = [totalAvailable, totalOccupied];
-        spotsChart.update();
+    if (data.lots) {
+        updateSpotsChart(data.lots.occupied, data.lots.available);
     }
     
     // Update lots chart
     const lotsChart = Chart.getChart('lotsChart');
     if (lotsChart && data.lots) {
+        adminLotIds = data.lots.ids || [];
         lotsChart.data.labels = data.lots.names;
         lotsChart.data.datasets[0].data = data.lots.occupied;
         lotsChart.data.datasets[1].data = data.lots.available;
@@ -207,6 +209,90 @@ function updateAdminCharts(data) {
     }
 }
 
+function updateSpotsChart(occupied, available) {
+    const spotsChart = Chart.getChart('spotsChart');
+    if (!spotsChart) return;
+    
+    const totalOccupied = occupied.reduce((a, b) => a + b, 0);
+    const totalAvailable = available.reduce((a, b) => a + b, 0);
+    
+    spotsChart.data.datasets[0].data = [totalAvailable, totalOccupied];
+    spotsChart.update();
+}
+
+// Live occupancy: a snapshot on connect, then per-lot deltas as bookings,
+// parking and releases commit. The server ends each stream after a while
+// and EventSource reconnects on its own; when the stream is turned off
+// (204) the source closes and the dashboard polls instead
+const OCCUPANCY_POLL_MS = 60000;
+
+function subscribeOccupancy() {
+    if (!document.getElementById('lotsChart')) return;
+    if (!window.EventSource) {
+        pollOccupancy();
+        return;
+    }
+    
+    const source = new EventSource('/api/admin/occupancy_stream');
+    source.addEventListener('snapshot', function(event) {
+        updateAdminCharts({ lots: JSON.parse(event.data) });
+    });
+    source.addEventListener('occupancy', function(event) {
+        applyOccupancyDelta(JSON.parse(event.data));
+    });
+    source.addEventListener('error', function() {
+        if (source.readyState === EventSource.CLOSED) pollOccupancy();
+    });
+}
+
+function pollOccupancy() {
+    setInterval(function() {
+        fetch('/api/admin/chart_data')
+            .then(response => response.json())
+            .then(data => updateAdminCharts({ lots: data.lots }))
+            .catch(error => {
+                console.error('Error polling admin chart data:', error);
+            });
+    }, OCCUPANCY_POLL_MS);
+}
+
+function applyOccupancyDelta(delta) {
+    const lotsChart = Chart.getChart('lotsChart');
+    if (!lotsChart) return;
+    
+    const occupied = lotsChart.data.datasets[0].data;
+    const available = lotsChart.data.datasets[1].data;
+    
+    // A lot created since the last snapshot needs its name, so reload once
+    if (Object.keys(delta.lots).some(id => !adminLotIds.includes(Number(id)))) {
+        fetch('/api/admin/chart_data')
+            .then(response => response.json())
+            .then(data => updateAdminCharts({ lots: data.lots }))
+            .catch(error => {
+                console.error('Error reloading admin chart data:', error);
+            });
+        return;
+    }
+    
+    delta.removed.forEach(id => {
+        const index = adminLotIds.indexOf(id);
+        if (index === -1) return;
+        adminLotIds.splice(index, 1);
+        lotsChart.data.labels.splice(index, 1);
+        occupied.splice(index, 1);
+        available.splice(index, 1);
+    });
+    
+    Object.entries(delta.lots).forEach(([id, changes]) => {
+        const index = adminLotIds.indexOf(Number(id));
+        occupied[index] += changes.occupied || 0;
+        available[index] += changes.available || 0;
+    });
+    
+    lotsChart.update();
+    updateSpotsChart(occupied, available);
+}
+
 // User Charts
 function loadUserCharts() {
     // Load user costs chart
@@ -401,4 +487,5 @@ window.addEventListener('resize', function() {
 window.loadAdminCharts = loadAdminCharts;
 window.loadUserCharts = loadUserCharts;
 window.updateAdminCharts = updateAdminCharts;
+window.subscribeOccupancy = subscribeOccupancy;
 window.updateUserCharts = updateUserCharts;
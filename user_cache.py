@@ -0,0 +1,92 @@
+"""
+Caches for the logged-in user.
+
+Flask-Login reloads the user on every authenticated request. The user's
+column values are kept in a per-process cache for USER_CACHE_TTL seconds
+and re-attached to the request's session without a query. Any ORM update
+or delete of a User drops its entry, and a set-based UPDATE or DELETE of
+users drops them all; other worker processes see the change once the TTL
+expires.
+
+active_reservation() memoizes the user's open reservation for the rest of
+the request.
+"""
+
+import threading
+import time
+
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+from app import app, db
+from app_models import User, Reservation
+
+_lock = threading.Lock()
+_users = {}
+_stats = {'user_hits': 0, 'user_misses': 0, 'reservation_hits': 0, 'reservation_misses': 0}
+
+def _count(key):
+    with _lock:
+        _stats[key] += 1
+
+def get_cached_user(user_id):
+    """Return the user for `user_id` bound to the current session, or None."""
+    with _lock:
+        entry = _users.get(user_id)
+        if entry and entry[1] > time.monotonic():
+            values = entry[0]
+        else:
+            values = None
+    
+    if values is not None:
+        _count('user_hits')
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+    
+    _count('user_misses')
+    user = db.session.get(User, user_id)
+    if user is not None:
+        values = {column.key: getattr(user, column.key) for column in User.__mapper__.column_attrs}
+        with _lock:
+            _users[user_id] = (values, time.monotonic() + app.config.get('USER_CACHE_TTL', 0))
+    return user
+
+def invalidate_user(user_id=None):
+    """Drop one cached user, or all of them when no id is given."""
+    with _lock:
+        if user_id is None:
+            _users.clear()
+        else:
+            _users.pop(user_id, None)
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    invalidate_user(target.id)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _users_bulk_changed(orm_execute_state):
+    # Set-based writes bypass the mapper events and may touch any user
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and orm_execute_state.bind_mapper is User.__mapper__:
+        invalidate_user()
+
+def active_reservation(user_id):
+    """Return the user's open reservation, queried at most once per request."""
+    cache = g.setdefault('active_reservations', {})
+    if user_id in cache:
+        _count('reservation_hits')
+    else:
+        _count('reservation_misses')
+        cache[user_id] = Reservation.query.filter_by(user_id=user_id, leaving_timestamp=None).first()
+    return cache[user_id]
+
+def forget_active_reservation(user_id):
+    """Discard the request's memoized open reservation after booking or release."""
+    g.setdefault('active_reservations', {}).pop(user_id, None)
+
+def user_cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats['cached_users'] = len(_users)
+    return stats
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Background job check: jobs exist only for committed transactions, run in
+the web process right after commit, are retried with backoff, roll back
+their writes when they fail, are requeued when their worker dies and
+only count once when a requeued job was still running;
+audit entries are rows of the request's own transaction, not jobs
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+
+from app import app, db
+from app_models import AuditEntry, Job, LotDailyStats
+from audit import audit
+from jobs import job, enqueue, requeue_stale_jobs, run_pending_jobs, wait_for_jobs
+from rollups import upsert_daily_stats
+
+# Rollup rows for a lot id no real lot has; lot_daily_stats has no foreign key
+CHECK_LOT_ID = -1
+attempts = {}
+
+@job('verify_ok')
+def verify_ok(key):
+    upsert_daily_stats(CHECK_LOT_ID, datetime.utcnow().date(), sessions=1)
+
+@job('verify_flaky')
+def verify_flaky(key):
+    attempts[key] = attempts.get(key, 0) + 1
+    if attempts[key] == 1:
+        raise RuntimeError('first attempt fails')
+
+@job('verify_broken')
+def verify_broken(key):
+    upsert_daily_stats(CHECK_LOT_ID, datetime.utcnow().date(), revenue=1000)
+    raise RuntimeError('always fails')
+
+@job('verify_reclaimed')
+def verify_reclaimed(key):
+    # Meanwhile the lease expired and another worker claimed the job again
+    with db.engine.begin() as other:
+        other.execute(db.update(Job).where(Job.name == 'verify_reclaimed').values(
+            locked_at=datetime.utcnow() + timedelta(seconds=1)))
+    upsert_daily_stats(CHECK_LOT_ID, datetime.utcnow().date(), revenue=500)
+
+def job_row(name):
+    db.session.commit()
+    return Job.query.filter_by(name=name).order_by(Job.id.desc()).first()
+
+def wait_for_status(name, status, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        row = job_row(name)
+        if row and row.status == status:
+            return row
+        time.sleep(0.05)
+    return job_row(name)
+
+def cleanup():
+    Job.query.filter(Job.name.like('verify\\_%', escape='\\')).delete(synchronize_session=False)
+    LotDailyStats.query.filter_by(lot_id=CHECK_LOT_ID).delete()
+    AuditEntry.query.filter(AuditEntry.action.like('verify\\_%', escape='\\')).delete(synchronize_session=False)
+    db.session.commit()
+
+def verify_background_jobs():
+    print('VERIFICATION: Background Jobs')
+    print('=' * 50)
+    checks = []
+    
+    with app.app_context():
+        wait_for_jobs()
+        cleanup()
+        
+        enqueue('verify_ok', key='rolled back')
+        db.session.rollback()
+        checks.append(('a rolled-back transaction leaves no job', job_row('verify_ok') is None))
+        
+        enqueue('verify_ok', key='committed')
+        db.session.commit()
+        row = wait_for_status('verify_ok', 'done')
+        stats = db.session.get(LotDailyStats, (CHECK_LOT_ID, datetime.utcnow().date()))
+        checks.append(('a committed job runs in-process after commit',
+                       row.status == 'done' and stats is not None and stats.sessions == 1))
+        
+        enqueue('verify_flaky', key='flaky')
+        db.session.commit()
+        row = wait_for_status('verify_flaky', 'done')
+        checks.append(('a failed attempt is retried after backoff', row.status == 'done' and row.attempts == 2))
+        
+        app.config['JOB_MAX_ATTEMPTS'], max_attempts = 2, app.config['JOB_MAX_ATTEMPTS']
+        enqueue('verify_broken', key='broken')
+        db.session.commit()
+        app.config['JOB_MAX_ATTEMPTS'] = max_attempts
+        row = wait_for_status('verify_broken', 'failed')
+        stats = db.session.get(LotDailyStats, (CHECK_LOT_ID, datetime.utcnow().date()), populate_existing=True)
+        checks.append(('a job is marked failed after its last attempt',
+                       row.status == 'failed' and row.attempts == 2 and 'always fails' in row.last_error))
+        checks.append(("a failed job's writes are rolled back", stats.revenue == 0))
+        
+        app.config['JOBS_IN_PROCESS'] = False
+        enqueue('verify_ok', key='stale')
+        db.session.commit()
+        stale = job_row('verify_ok')
+        stale.status, stale.locked_at = 'running', datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+        requeued = requeue_stale_jobs()
+        run_pending_jobs()
+        app.config['JOBS_IN_PROCESS'] = True
+        checks.append(('a job abandoned mid-run is requeued and run',
+                       requeued == 1 and job_row('verify_ok').status == 'done'))
+        
+        jobs_before = Job.query.count()
+        audit('verify_audit', key='rolled back')
+        db.session.rollback()
+        audit('verify_audit', key='committed')
+        db.session.commit()
+        entries = [entry.details for entry in AuditEntry.query.filter_by(action='verify_audit')]
+        checks.append(('audit entries are kept only for committed work, without a job',
+                       entries == ['{"key": "committed"}'] and Job.query.count() == jobs_before))
+        
+        app.config['JOBS_IN_PROCESS'] = False
+        enqueue('verify_reclaimed', key='reclaimed')
+        db.session.commit()
+        run_pending_jobs()
+        app.config['JOBS_IN_PROCESS'] = True
+        stats = db.session.get(LotDailyStats, (CHECK_LOT_ID, datetime.utcnow().date()), populate_existing=True)
+        checks.append(('a run that lost its lease to another worker leaves no writes',
+                       job_row('verify_reclaimed').status == 'running' and stats.revenue == 0))
+        
+        cleanup()
+    
+    for label, passed in checks:
+        print(f'   {"✓" if passed else "✗"} {label}')
+    
+    return all(passed for _, passed in checks)
+
+if __name__ == '__main__':
+    sys.exit(0 if verify_background_jobs() else 1)
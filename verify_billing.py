@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Billing check: SQL pricing with duration tiers and a peak window matches a
+straightforward Python implementation, powers the dashboard,
+release_parking and its receipt, and re-rates a large history in set-based batches with the
+rollups refreshed
+"""
+
+import logging
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from app_models import User, ParkingLot, ParkingSpot, Reservation, LotDailyStats, shift_spot_counts
+from billing import parse_tiers, set_lot_tiers, rerate_reservations
+from jobs import wait_for_jobs
+from rollups import hours_per_day
+from spot_provisioning import add_spots
+
+HISTORY = 50000
+TIERS = '2:0.8, 24:0.5'
+PEAK = (8, 18, 1.5)
+
+def reference_cost(parked_at, left_at, rate, tiers, peak):
+    """Price a stay hour-slice by hour-slice, the slow and obvious way."""
+    hours = (left_at - parked_at).total_seconds() / 3600
+    charged = hours
+    for from_hour, to_hour, multiplier in tiers:
+        covered = max(min(hours, hours if to_hour is None else to_hour) - from_hour, 0)
+        charged += (multiplier - 1) * covered
+    
+    peak_start, peak_end, peak_multiplier = peak
+    for day, _ in hours_per_day(parked_at, left_at):
+        midnight = datetime.combine(day, datetime.min.time())
+        window_start = max(parked_at, midnight + timedelta(hours=peak_start))
+        window_end = min(left_at, midnight + timedelta(hours=peak_end))
+        if window_end > window_start:
+            charged += (peak_multiplier - 1) * (window_end - window_start).total_seconds() / 3600
+    return round(rate * charged, 2)
+
+def create_fixture():
+    lot = ParkingLot(prime_location_name='Billing Check Lot', price=4.0, address='Billing verification only',
+                     pin_code='00000', maximum_number_of_spots=2,
+                     peak_start_hour=PEAK[0], peak_end_hour=PEAK[1], peak_multiplier=PEAK[2])
+    set_lot_tiers(lot, parse_tiers(TIERS))
+    user = User(username='billing_check_user', email='billing_check_user@example.com',
+                password_hash=generate_password_hash('billing-check'))
+    db.session.add_all([lot, user])
+    db.session.flush()
+    add_spots(lot.id, 2, 2)
+    spot_id = db.session.scalars(db.select(ParkingSpot.id).filter_by(lot_id=lot.id)).first()
+    
+    rng = random.Random(23)
+    first = datetime(2025, 3, 1)
+    stays = []
+    for _ in range(HISTORY):
+        parked_at = first + timedelta(seconds=rng.randrange(30 * 24 * 3600))
+        left_at = parked_at + timedelta(minutes=rng.choice([rng.randrange(1, 240), rng.randrange(1, 4320)]))
+        stays.append({'spot_id': spot_id, 'user_id': user.id, 'parking_timestamp': parked_at,
+                      'leaving_timestamp': left_at, 'parking_cost_per_unit_time': lot.price})
+    stays[0]['expired'], stays[0]['total_cost'] = True, 0
+    db.session.bulk_insert_mappings(Reservation, stays)
+    db.session.commit()
+    return lot.id, user.id
+
+def remove_fixture(lot_id, user_id):
+    wait_for_jobs()
+    Reservation.query.filter_by(user_id=user_id).delete()
+    LotDailyStats.query.filter_by(lot_id=lot_id).delete()
+    db.session.delete(db.session.get(User, user_id))
+    db.session.delete(db.session.get(ParkingLot, lot_id))
+    db.session.commit()
+
+def verify_billing():
+    print('VERIFICATION: Billing Engine')
+    print('=' * 50)
+    checks = []
+    tiers = parse_tiers(TIERS)
+    
+    with app.app_context():
+        lot_id, user_id = create_fixture()
+        
+        started = time.perf_counter()
+        rerated = rerate_reservations(datetime(2025, 1, 1), datetime(2026, 1, 1), lot_id, batch_size=20000)
+        elapsed = time.perf_counter() - started
+        print(f'   re-rated {rerated} reservations in {elapsed:.2f}s ({rerated / elapsed:,.0f}/s)')
+        
+        rows = db.session.execute(
+            db.select(Reservation.parking_timestamp, Reservation.leaving_timestamp,
+                      Reservation.parking_cost_per_unit_time, Reservation.total_cost, Reservation.expired)
+            .filter_by(user_id=user_id)
+        ).all()
+        mismatches = [row for row in rows if not row.expired and abs(
+            row.total_cost - reference_cost(row.parking_timestamp, row.leaving_timestamp,
+                                            row.parking_cost_per_unit_time, tiers, PEAK)) > 0.011]
+        checks.append((f'all {HISTORY - 1} stays priced like the reference implementation',
+                       rerated == HISTORY - 1 and not mismatches))
+        checks.append(('expired reservations stay free', any(row.expired and row.total_cost == 0 for row in rows)))
+        
+        by_day = {}
+        for row in rows:
+            by_day[row.leaving_timestamp.date()] = by_day.get(row.leaving_timestamp.date(), 0) + row.total_cost
+        rollup = dict(db.session.query(LotDailyStats.day, LotDailyStats.revenue).filter_by(lot_id=lot_id).all())
+        checks.append(('re-rating refreshes the daily revenue rollup',
+                       rollup.keys() == by_day.keys()
+                       and all(abs(rollup[day] - revenue) < 0.01 for day, revenue in by_day.items())))
+        
+        lot = db.session.get(ParkingLot, lot_id)
+        lot.peak_start_hour = lot.peak_end_hour = lot.peak_multiplier = None
+        set_lot_tiers(lot, [])
+        db.session.commit()
+        rerate_reservations(datetime(2025, 1, 1), datetime(2026, 1, 1), lot_id)
+        flat = db.session.execute(
+            db.select(Reservation.parking_timestamp, Reservation.leaving_timestamp, Reservation.total_cost)
+            .filter_by(user_id=user_id, expired=False).limit(1000)
+        ).all()
+        checks.append(('without a tariff a stay costs hours x rate',
+                       all(abs(cost - round((left - parked).total_seconds() / 3600 * 4.0, 2)) < 0.011
+                           for parked, left, cost in flat)))
+        
+        lot.peak_start_hour, lot.peak_end_hour, lot.peak_multiplier = PEAK
+        set_lot_tiers(lot, tiers)
+        spot = ParkingSpot.query.filter_by(lot_id=lot_id, status='A').first()
+        spot.status = 'O'
+        shift_spot_counts(lot_id, 'A', 'O')
+        parked_at = datetime.utcnow() - timedelta(hours=30)
+        open_reservation = Reservation(spot_id=spot.id, user_id=user_id, parking_timestamp=parked_at,
+                                       parking_cost_per_unit_time=4.0)
+        db.session.add(open_reservation)
+        db.session.commit()
+        open_id = open_reservation.id
+    
+    driver = app.test_client()
+    with driver.session_transaction() as s:
+        s['_user_id'] = str(user_id)
+    pricing = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'julianday' in statement:
+            pricing.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    dashboard = driver.get('/user/dashboard').get_data(as_text=True)
+    event.remove(engine, 'before_cursor_execute', record)
+    shown = re.search(r'Current Cost:</strong> \$([0-9.]+)', dashboard)
+    so_far = reference_cost(parked_at, datetime.utcnow(), 4.0, tiers, PEAK)
+    checks.append(('the dashboard prices the open stay with the tariff in one query',
+                   shown is not None and abs(float(shown.group(1)) - so_far) < 0.05 and len(pricing) == 1))
+    
+    receipts = []
+    handler = logging.Handler()
+    handler.emit = lambda record: receipts.append(record.getMessage())
+    logging.getLogger('receipts').addHandler(handler)
+    driver.get(f'/user/release_parking/{open_id}')
+    
+    with app.app_context():
+        wait_for_jobs()
+        logging.getLogger('receipts').removeHandler(handler)
+        released = db.session.get(Reservation, open_id)
+        expected = reference_cost(released.parking_timestamp, released.leaving_timestamp, 4.0, tiers, PEAK)
+        checks.append(('release_parking bills with the lot tariff', abs(released.total_cost - expected) < 0.011))
+        checks.append(('the driver gets a receipt with the billed total',
+                       len(receipts) == 1 and f'#{open_id}' in receipts[0]
+                       and f'${released.total_cost:.2f}' in receipts[0]))
+        remove_fixture(lot_id, user_id)
+    
+    for label, passed in checks:
+        print(f'   {"✓" if passed else "✗"} {label}')
+    
+    return all(passed for _, passed in checks)
+
+if __name__ == '__main__':
+    sys.exit(0 if verify_billing() else 1)
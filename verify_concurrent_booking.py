@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress check for spot allocation: fires many parallel bookings
+at one lot and verifies that no spot is ever handed out twice, and that
+each booking raises the daily peak in its own transaction
+"""
+
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from app_models import User, ParkingLot, ParkingSpot, Reservation, LotDailyStats, shift_spot_counts
+from jobs import wait_for_jobs
+from spot_allocator import allocate_spot
+
+LOT_SIZE = 50
+BOOKINGS = 300
+
+def create_fixture():
+    lot = ParkingLot(
+        prime_location_name='Concurrency Check Lot',
+        price=1.0,
+        address='Concurrency verification only',
+        pin_code='00000',
+        maximum_number_of_spots=LOT_SIZE
+    )
+    db.session.add(lot)
+    db.session.flush()
+    for i in range(1, LOT_SIZE + 1):
+        db.session.add(ParkingSpot(lot_id=lot.id, spot_number=f"S{i:03d}", status='A'))
+    shift_spot_counts(lot.id, to_status='A', count=LOT_SIZE)
+    
+    password_hash = generate_password_hash('concurrency')
+    users = [User(username=f'concurrency_{i}', email=f'concurrency_{i}@example.com', password_hash=password_hash)
+             for i in range(BOOKINGS)]
+    db.session.add_all(users)
+    db.session.commit()
+    return lot.id, [user.id for user in users]
+
+def remove_fixture(lot_id, user_ids):
+    wait_for_jobs()  # rollup jobs of the fixture must not land after its removal
+    Reservation.query.filter(Reservation.user_id.in_(user_ids)).delete(synchronize_session=False)
+    User.query.filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+    LotDailyStats.query.filter_by(lot_id=lot_id).delete()
+    db.session.delete(db.session.get(ParkingLot, lot_id))
+    db.session.commit()
+
+def book(lot_id, user_id, barrier, results, errors):
+    barrier.wait()
+    with app.app_context():
+        try:
+            lot = db.session.get(ParkingLot, lot_id)
+            reservation = allocate_spot(lot, user_id)
+            db.session.commit()
+            results.append(reservation.spot_id if reservation else None)
+        except Exception as exc:
+            db.session.rollback()
+            errors.append(repr(exc))
+
+def verify_concurrent_booking():
+    with app.app_context():
+        lot_id, user_ids = create_fixture()
+    
+    print('VERIFICATION: Concurrent Spot Allocation')
+    print('=' * 50)
+    print(f'   {BOOKINGS} parallel bookings against a lot with {LOT_SIZE} spots')
+    
+    # No jobs run during the bookings, so the peak must come from the bookings themselves
+    app.config['JOBS_IN_PROCESS'], jobs_in_process = False, app.config['JOBS_IN_PROCESS']
+    results, errors = [], []
+    barrier = threading.Barrier(BOOKINGS)
+    threads = [threading.Thread(target=book, args=(lot_id, user_id, barrier, results, errors))
+               for user_id in user_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    app.config['JOBS_IN_PROCESS'] = jobs_in_process
+    
+    with app.app_context():
+        claimed = [spot_id for spot_id in results if spot_id is not None]
+        duplicates = [spot_id for spot_id, count in Counter(claimed).items() if count > 1]
+        open_reservations = Reservation.query.filter(
+            Reservation.user_id.in_(user_ids),
+            Reservation.leaving_timestamp.is_(None)
+        ).count()
+        reserved_spots = ParkingSpot.query.filter_by(lot_id=lot_id, status='R').count()
+        lot = db.session.get(ParkingLot, lot_id)
+        stats = db.session.get(LotDailyStats, (lot_id, datetime.utcnow().date()))
+        
+        checks = [
+            ('no spot allocated twice', not duplicates),
+            ('every booking completed without error', not errors),
+            ('lot filled exactly', len(claimed) == LOT_SIZE),
+            ('one open reservation per reserved spot', open_reservations == reserved_spots == len(claimed)),
+            ('lot counters match spot table', lot.reserved_spots_count == reserved_spots
+                and lot.available_spots_count == LOT_SIZE - reserved_spots),
+            ('the daily peak is recorded by the bookings', stats is not None and stats.peak_occupancy == LOT_SIZE),
+        ]
+        for label, passed in checks:
+            print(f'   {"✓" if passed else "✗"} {label}')
+        for error in errors[:5]:
+            print(f'     {error}')
+        
+        remove_fixture(lot_id, user_ids)
+    
+    return all(passed for _, passed in checks)
+
+if __name__ == '__main__':
+    sys.exit(0 if verify_concurrent_booking() else 1)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Gate event batch check: thousands of park/release events are applied in
+one transaction with set-based statements, each event gets a result, and
+replaying a batch applies nothing twice
+"""
+
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, func
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from app_models import User, ParkingLot, ParkingSpot, Reservation, LotDailyStats, GateEvent, shift_spot_counts
+from billing import quote
+from jobs import wait_for_jobs
+from spot_provisioning import add_spots
+
+DRIVERS = 1000
+TOKEN = 'verify-gate-token'
+EVENT_PREFIX = 'verify-gate-'
+
+def create_fixture():
+    """A lot with one booked (reserved) spot per driver, booked two hours ago."""
+    lot = ParkingLot(prime_location_name='Gate Check Lot', price=3.0, address='Gate verification only',
+                     pin_code='00000', maximum_number_of_spots=DRIVERS)
+    db.session.add(lot)
+    db.session.flush()
+    add_spots(lot.id, DRIVERS, DRIVERS)
+    password_hash = generate_password_hash('gate-check')
+    db.session.bulk_insert_mappings(User, [{
+        'username': f'gate_check_user_{n}',
+        'email': f'gate_check_user_{n}@example.com',
+        'password_hash': password_hash
+    } for n in range(DRIVERS)])
+    user_ids = db.session.scalars(
+        db.select(User.id).where(User.username.like('gate\\_check\\_user\\_%', escape='\\')).order_by(User.id)).all()
+    spot_ids = db.session.scalars(
+        db.select(ParkingSpot.id).where(ParkingSpot.lot_id == lot.id).order_by(ParkingSpot.id)).all()
+    
+    booked_at = datetime.utcnow() - timedelta(hours=2)
+    db.session.bulk_insert_mappings(Reservation, [{
+        'spot_id': spot_id,
+        'user_id': user_id,
+        'parking_timestamp': booked_at,
+        'parking_cost_per_unit_time': lot.price
+    } for spot_id, user_id in zip(spot_ids, user_ids)])
+    db.session.execute(db.update(ParkingSpot).where(ParkingSpot.lot_id == lot.id).values(status='R'))
+    shift_spot_counts(lot.id, 'A', 'R', DRIVERS)
+    db.session.commit()
+    
+    reservations = db.session.execute(
+        db.select(Reservation.id, Reservation.spot_id).where(Reservation.user_id.in_(user_ids)).order_by(Reservation.id)
+    ).all()
+    return lot.id, user_ids, reservations
+
+def remove_fixture(lot_id, user_ids):
+    wait_for_jobs()
+    GateEvent.query.filter(GateEvent.event_id.like(EVENT_PREFIX + '%')).delete(synchronize_session=False)
+    Reservation.query.filter(Reservation.user_id.in_(user_ids)).delete(synchronize_session=False)
+    LotDailyStats.query.filter_by(lot_id=lot_id).delete()
+    User.query.filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+    db.session.delete(db.session.get(ParkingLot, lot_id))
+    db.session.commit()
+
+def lot_state(lot_id):
+    lot = db.session.get(ParkingLot, lot_id, populate_existing=True)
+    actual = dict(db.session.query(ParkingSpot.status, func.count(ParkingSpot.id))
+                  .filter_by(lot_id=lot_id).group_by(ParkingSpot.status).all())
+    counters = {'A': lot.available_spots_count, 'R': lot.reserved_spots_count, 'O': lot.occupied_spots_count}
+    db.session.commit()
+    return counters, {status: actual.get(status, 0) for status in counters}
+
+def gate_event(n, kind, **target):
+    return {'event_id': f'{EVENT_PREFIX}{n}', 'type': kind, **target}
+
+def verify_gate_events():
+    print('VERIFICATION: Gate Event Batches')
+    print('=' * 50)
+    checks = []
+    app.config['GATE_API_TOKEN'] = TOKEN
+    
+    with app.app_context():
+        lot_id, user_ids, reservations = create_fixture()
+        admin_id = User.query.filter_by(is_admin=True).first().id
+        engine = db.engine
+    
+    gate = app.test_client()
+    headers = {'Authorization': f'Bearer {TOKEN}'}
+    checks.append(('a batch without the gate token is refused',
+                   gate.post('/api/gate/events', json=[]).status_code == 403))
+    admin = app.test_client()
+    with admin.session_transaction() as s:
+        s['_user_id'] = str(admin_id)
+    checks.append(('an admin session alone cannot post events',
+                   admin.post('/api/gate/events', json=[]).status_code == 403))
+    checks.append(('a body that is not JSON or NDJSON is refused unread',
+                   gate.post('/api/gate/events', data='[]', content_type='text/plain',
+                             headers=headers).status_code == 415))
+    checks.append(('a malformed body is rejected',
+                   gate.post('/api/gate/events', data='{"events": 5}', content_type='application/json',
+                             headers=headers).status_code == 400))
+    app.config['GATE_BATCH_MAX_BYTES'], max_bytes = 64, app.config['GATE_BATCH_MAX_BYTES']
+    checks.append(('an oversized body is refused',
+                   gate.post('/api/gate/events', data='[' + ' ' * 64 + ']', content_type='application/json',
+                             headers=headers).status_code == 413))
+    app.config['GATE_BATCH_MAX_BYTES'] = max_bytes
+    
+    # Every driver parks (by reservation id); the first half also leave (by
+    # spot id), some reporting the exit time. Then a few events that must fail.
+    half = DRIVERS // 2
+    left_at = (datetime.utcnow() - timedelta(hours=1)).isoformat()
+    batch = [gate_event(n, 'park', reservation_id=reservation_id)
+             for n, (reservation_id, _) in enumerate(reservations)]
+    batch += [gate_event(DRIVERS + n, 'release', spot_id=spot_id, **({'at': left_at} if n % 2 else {}))
+              for n, (_, spot_id) in enumerate(reservations[:half])]
+    invalid = [
+        gate_event(3 * DRIVERS, 'park', reservation_id=reservations[-1][0]),  # already parked
+        gate_event(3 * DRIVERS + 1, 'release', reservation_id=reservations[0][0]),  # already released
+        gate_event(3 * DRIVERS + 2, 'leave', spot_id=1),
+        gate_event(0, 'park', reservation_id=reservations[0][0]),  # repeated id in the batch
+    ]
+    batch += invalid
+    
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.lstrip().split(None, 2)[:2])
+    event.listen(engine, 'before_cursor_execute', record)
+    started = time.perf_counter()
+    response = gate.post('/api/gate/events', json={'events': batch}, headers=headers)
+    elapsed = time.perf_counter() - started
+    event.remove(engine, 'before_cursor_execute', record)
+    summary = response.get_json()
+    
+    print(f'   {len(batch)} events processed in {elapsed * 1000:.0f} ms')
+    checks.append(('every event gets a result, in order',
+                   response.status_code == 200 and [r['event_id'] for r in summary['results']]
+                   == [e['event_id'] for e in batch]))
+    checks.append(('valid events apply, invalid ones are rejected individually',
+                   summary['applied'] == DRIVERS + half and summary['rejected'] == 3 and summary['duplicate'] == 1))
+    checks.append(('spots and reservations are read once and written set-based',
+                   statements.count(['SELECT', 'reservations.id,']) == 1
+                   and statements.count(['UPDATE', 'parking_spots']) == 2
+                   and statements.count(['UPDATE', 'reservations']) == 2))
+    
+    with app.app_context():
+        counters, actual = lot_state(lot_id)
+        checks.append(('spots and lot counters reflect the batch',
+                       actual == {'A': half, 'R': 0, 'O': DRIVERS - half} and counters == actual))
+        
+        released = Reservation.query.filter(Reservation.user_id.in_(user_ids),
+                                            Reservation.leaving_timestamp.isnot(None)).all()
+        reported = [r for r in released if abs((r.parking_timestamp + timedelta(hours=1) - r.leaving_timestamp).total_seconds()) < 2]
+        quoted = quote([r.id for r in released])
+        checks.append(('releases are billed up to the reported exit time',
+                       len(released) == half and len(reported) == half // 2
+                       and all(r.total_cost == quoted[r.id] for r in released)))
+        
+        wait_for_jobs()
+        revenue, sessions = db.session.query(func.sum(LotDailyStats.revenue), func.sum(LotDailyStats.sessions)).filter_by(
+            lot_id=lot_id).one()
+        checks.append(('the daily rollup picks up the released reservations',
+                       sessions == half and abs(revenue - sum(r.total_cost for r in released)) < 0.01))
+    
+    replay = gate.post('/api/gate/events', data='\n'.join(json.dumps(e) for e in batch[:DRIVERS + half]),
+                       content_type='application/x-ndjson', headers=headers).get_json()
+    with app.app_context():
+        checks.append(('replaying the batch as NDJSON applies nothing again',
+                       replay['duplicate'] == DRIVERS + half and replay['applied'] == 0
+                       and lot_state(lot_id)[1] == actual))
+    
+    app.config['GATE_BATCH_MAX_EVENTS'], max_events = 10, app.config['GATE_BATCH_MAX_EVENTS']
+    checks.append(('oversized batches are refused',
+                   gate.post('/api/gate/events', json=batch[:11], headers=headers).status_code == 413))
+    app.config['GATE_BATCH_MAX_EVENTS'] = max_events
+    
+    # Close a parked driver's reservation after the batch has loaded it but
+    # before it writes, as a release click on another worker could
+    parked_id = reservations[-1][0]
+    closed_at = datetime.utcnow() - timedelta(minutes=5)
+    raced_writes = []
+    def close_concurrently(conn, cursor, statement, parameters, context, executemany):
+        if raced_writes or not statement.lstrip().startswith('UPDATE parking_spots'):
+            return
+        raced_writes.append(statement)
+        with engine.begin() as other:
+            other.execute(db.update(Reservation).where(Reservation.id == parked_id).values(
+                leaving_timestamp=closed_at, total_cost=0))
+    event.listen(engine, 'before_cursor_execute', close_concurrently)
+    raced = gate.post('/api/gate/events', json=[gate_event(4 * DRIVERS, 'release', reservation_id=parked_id)],
+                      headers=headers).get_json()
+    event.remove(engine, 'before_cursor_execute', close_concurrently)
+    with app.app_context():
+        closed = db.session.get(Reservation, parked_id)
+        checks.append(('a reservation closed while the batch runs is not closed again',
+                       raced_writes and raced['rejected'] == 1 and closed.leaving_timestamp == closed_at
+                       and closed.total_cost == 0))
+    
+    with app.app_context():
+        remove_fixture(lot_id, user_ids)
+    
+    for label, passed in checks:
+        print(f'   {"✓" if passed else "✗"} {label}')
+    
+    return all(passed for _, passed in checks)
+
+if __name__ == '__main__':
+    sys.exit(0 if verify_gate_events() else 1)
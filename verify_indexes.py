@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+EXPLAIN-based verification that every hot query in routes.py is served by
+an index rather than a full table scan
+"""
+
+import sys
+from datetime import datetime, date
+
+from app import app, db
+from app_models import ParkingSpot, Reservation, LotDailyStats
+from routes import search_spot_query
+from revenue import bucket_expression
+from reservation_sweeper import idle_reservations_query
+from gate_events import open_reservations_query
+from invoicing import billable_reservations_query
+from spot_provisioning import removable_spots_query, spot_number_order
+from sqlalchemy import func
+
+def hot_queries():
+    user_id, lot_id, spot_id = 2, 1, 1
+    start, end = datetime(2025, 1, 1), datetime(2025, 4, 1)
+    hourly = bucket_expression(Reservation.leaving_timestamp, 'hour')
+    daily = bucket_expression(LotDailyStats.day, 'day')
+    
+    return [
+        ('active reservation of a user', Reservation.query.filter_by(
+            user_id=user_id, leaving_timestamp=None)),
+        ('completed reservations of a user', Reservation.query.filter(
+            Reservation.user_id == user_id,
+            Reservation.leaving_timestamp.isnot(None)
+        ).order_by(Reservation.leaving_timestamp.desc()).limit(5)),
+        ('booking history of a user', Reservation.query.filter_by(
+            user_id=user_id).order_by(Reservation.parking_timestamp.desc())),
+        ('open reservation of a spot', Reservation.query.filter_by(
+            spot_id=spot_id, leaving_timestamp=None)),
+        ('reservation history of a spot', Reservation.query.filter_by(
+            spot_id=spot_id).order_by(Reservation.leaving_timestamp.desc())),
+        ('idle reservations to expire', idle_reservations_query(start, 500)),
+        ('open reservations named by a gate batch', open_reservations_query([1, 2], [spot_id])),
+        ('billable reservations of a month', billable_reservations_query(
+            datetime(2025, 7, 1), datetime(2025, 8, 1), user_id)),
+        ('first available spot in a lot', ParkingSpot.query.filter_by(
+            lot_id=lot_id, status='A').order_by(*spot_number_order()).limit(1)),
+        ('removable spots when shrinking a lot', removable_spots_query(lot_id, 10)),
+        ('spot by number', ParkingSpot.query.filter_by(spot_number='S001')),
+        ('spot search by lot', search_spot_query(ParkingSpot.lot_id == lot_id)),
+        ('spot search by status', search_spot_query(ParkingSpot.status == 'O')),
+        ('spot search by status and lot', search_spot_query(
+            ParkingSpot.status == 'O', ParkingSpot.lot_id == lot_id)),
+        ('hourly revenue range', db.session.query(hourly, func.sum(Reservation.total_cost)).filter(
+            Reservation.leaving_timestamp >= start,
+            Reservation.leaving_timestamp < end
+        ).group_by(hourly)),
+        ('daily revenue rollup range', db.session.query(daily, func.sum(LotDailyStats.revenue)).filter(
+            LotDailyStats.day >= start.date(),
+            LotDailyStats.day < end.date()
+        ).group_by(daily)),
+    ]
+
+def full_scans(query):
+    """Return the tables a query reads in full, by table or whole-index scan."""
+    statement = getattr(query, 'statement', query)
+    sql = str(statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text('SET LOCAL enable_seqscan = off'))
+        plan = [row[0] for row in db.session.execute(db.text('EXPLAIN ' + sql))]
+        return [line.split('Seq Scan on ')[1].split()[0] for line in plan if 'Seq Scan on ' in line]
+    
+    plan = [row[3] for row in db.session.execute(db.text('EXPLAIN QUERY PLAN ' + sql))]
+    return [detail.split()[1] for detail in plan if detail.startswith('SCAN ')]
+
+def verify_indexes():
+    with app.app_context():
+        print('VERIFICATION: Hot Query Index Usage')
+        print('=' * 50)
+        
+        all_indexed = True
+        for label, query in hot_queries():
+            scanned = full_scans(query)
+            all_indexed = all_indexed and not scanned
+            if scanned:
+                print(f'   ✗ {label}: full scan of {", ".join(scanned)}')
+            else:
+                print(f'   ✓ {label}')
+        db.session.rollback()
+        
+        return all_indexed
+
+if __name__ == '__main__':
+    sys.exit(0 if verify_indexes() else 1)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Invoicing check: a month of reservations is invoiced per user from a
+streamed cursor, the totals match the reservations, and a run that crashes
+halfway resumes from its checkpoint instead of starting over
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, func
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from app_models import User, ParkingLot, ParkingSpot, Reservation, Invoice, InvoiceRun, LotDailyStats
+from invoicing import generate_invoices, period_bounds
+from jobs import wait_for_jobs
+from spot_provisioning import add_spots
+
+PERIOD = '2024-02'
+USERS = 2000
+STAYS_PER_USER = 25
+CHECKPOINT_USERS = 250
+
+class SimulatedCrash(Exception):
+    pass
+
+def create_fixture():
+    lot = ParkingLot(prime_location_name='Invoice Check Lot', price=2.0, address='Invoicing verification only',
+                     pin_code='00000', maximum_number_of_spots=1)
+    db.session.add(lot)
+    db.session.flush()
+    add_spots(lot.id, 1, 1)
+    spot_id = db.session.scalars(db.select(ParkingSpot.id).filter_by(lot_id=lot.id)).one()
+    password_hash = generate_password_hash('invoice-check')
+    db.session.bulk_insert_mappings(User, [{
+        'username': f'invoice_check_user_{n}',
+        'email': f'invoice_check_user_{n}@example.com',
+        'password_hash': password_hash
+    } for n in range(USERS)])
+    user_ids = db.session.scalars(
+        db.select(User.id).where(User.username.like('invoice\\_check\\_user\\_%', escape='\\')).order_by(User.id)).all()
+    
+    # Stays spread over the month and the days around it; every 7th expired
+    start, _ = period_bounds(PERIOD)
+    stays = []
+    for n, user_id in enumerate(user_ids):
+        for k in range(STAYS_PER_USER):
+            parked_at = start + timedelta(hours=(n * 7 + k * 31) % (31 * 24) - 24, minutes=k)
+            stays.append({'spot_id': spot_id, 'user_id': user_id, 'parking_timestamp': parked_at,
+                          'leaving_timestamp': parked_at + timedelta(minutes=30 + (n + k) % 300),
+                          'parking_cost_per_unit_time': 2.0, 'expired': (n + k) % 7 == 0})
+            if stays[-1]['expired']:
+                stays[-1]['total_cost'] = 0
+    db.session.bulk_insert_mappings(Reservation, stays)
+    db.session.commit()
+    return lot.id, user_ids
+
+def remove_fixture(lot_id, user_ids):
+    wait_for_jobs()
+    Invoice.query.filter(Invoice.user_id.in_(user_ids)).delete(synchronize_session=False)
+    db.session.execute(db.delete(InvoiceRun).where(InvoiceRun.period == PERIOD))
+    Reservation.query.filter(Reservation.user_id.in_(user_ids)).delete(synchronize_session=False)
+    LotDailyStats.query.filter_by(lot_id=lot_id).delete()
+    User.query.filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+    db.session.delete(db.session.get(ParkingLot, lot_id))
+    db.session.commit()
+
+def expected_invoices(user_ids):
+    start, end = period_bounds(PERIOD)
+    rows = db.session.query(Reservation.user_id, func.count(Reservation.id), func.sum(Reservation.total_cost)).filter(
+        Reservation.user_id.in_(user_ids), Reservation.expired.is_(False),
+        Reservation.leaving_timestamp >= start, Reservation.leaving_timestamp < end
+    ).group_by(Reservation.user_id).all()
+    return {user_id: (count, round(amount, 2)) for user_id, count, amount in rows}
+
+def verify_invoicing():
+    print('VERIFICATION: Invoicing')
+    print('=' * 50)
+    checks = []
+    app.config['INVOICE_CHECKPOINT_USERS'], checkpoint_users = CHECKPOINT_USERS, app.config['INVOICE_CHECKPOINT_USERS']
+    app.config['INVOICE_FETCH_ROWS'], fetch_rows = 1000, app.config['INVOICE_FETCH_ROWS']
+    
+    with app.app_context():
+        db.session.execute(db.delete(Invoice).where(Invoice.period == PERIOD))
+        db.session.execute(db.delete(InvoiceRun).where(InvoiceRun.period == PERIOD))
+        db.session.commit()
+        lot_id, user_ids = create_fixture()
+        engine = db.engine
+        
+        # Crash while writing the fourth checkpoint
+        writes = []
+        def crash(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().startswith('INSERT INTO invoices'):
+                writes.append(len(parameters))
+                if len(writes) == 4:
+                    raise SimulatedCrash()
+        event.listen(engine, 'before_cursor_execute', crash)
+        try:
+            generate_invoices(PERIOD)
+            crashed = False
+        except Exception as e:
+            crashed = isinstance(getattr(e, 'orig', e), SimulatedCrash)
+        event.remove(engine, 'before_cursor_execute', crash)
+        db.session.rollback()
+        
+        run = db.session.get(InvoiceRun, PERIOD)
+        checks.append(('a crash leaves the last checkpoint committed',
+                       crashed and run.status == 'invoicing' and run.invoices == 3 * CHECKPOINT_USERS
+                       and Invoice.query.filter_by(period=PERIOD).count() == 3 * CHECKPOINT_USERS))
+        resume_after = run.last_user_id
+        
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+        event.listen(engine, 'before_cursor_execute', record)
+        started = time.perf_counter()
+        run = generate_invoices(PERIOD)
+        elapsed = time.perf_counter() - started
+        event.remove(engine, 'before_cursor_execute', record)
+        print(f'   resumed run finished in {elapsed:.2f}s')
+        
+        reads = [parameters for statement, parameters in statements if 'FROM reservations' in statement]
+        rerated = [statement for statement, _ in statements if statement.lstrip().startswith('UPDATE reservations')]
+        invoice_writes = [parameters for statement, parameters in statements
+                          if statement.lstrip().startswith('INSERT INTO invoices')]
+        checks.append(('the resumed run skips re-rating and users already invoiced',
+                       not rerated and len(reads) == 1 and resume_after in reads[0]
+                       and sum(len(batch) for batch in invoice_writes) == USERS - 3 * CHECKPOINT_USERS))
+        
+        expected = expected_invoices(user_ids)
+        invoices = {invoice.user_id: (invoice.reservations, invoice.amount)
+                    for invoice in Invoice.query.filter_by(period=PERIOD).filter(Invoice.user_id.in_(user_ids))}
+        checks.append(('one invoice per user, matching their stays released in the month',
+                       invoices.keys() == expected.keys()
+                       and all(invoices[u][0] == expected[u][0] and abs(invoices[u][1] - expected[u][1]) < 0.011
+                               for u in expected)))
+        checks.append(('expired stays and stays outside the month are not invoiced',
+                       0 < sum(count for count, _ in expected.values()) < USERS * STAYS_PER_USER))
+        billed = db.session.query(func.count(Reservation.id)).filter(
+            Reservation.user_id.in_(user_ids), Reservation.total_cost.is_(None),
+            Reservation.leaving_timestamp >= period_bounds(PERIOD)[0],
+            Reservation.leaving_timestamp < period_bounds(PERIOD)[1]).scalar()
+        checks.append(('the month is re-rated before invoicing', billed == 0))
+        checks.append(('the run is marked done with its totals',
+                       run.status == 'done' and run.reservations == sum(c for c, _ in expected.values())))
+        
+        again = generate_invoices(PERIOD)
+        checks.append(('a finished period is not invoiced twice',
+                       again.finished_at == run.finished_at
+                       and Invoice.query.filter_by(period=PERIOD).count() == USERS))
+        
+        driver = app.test_client()
+        with driver.session_transaction() as s:
+            s['_user_id'] = str(user_ids[0])
+        page = driver.get('/user/invoices')
+        checks.append(("the invoices page lists the driver's invoice",
+                       page.status_code == 200 and PERIOD in page.get_data(as_text=True)))
+        
+        remove_fixture(lot_id, user_ids)
+    
+    app.config['INVOICE_CHECKPOINT_USERS'], app.config['INVOICE_FETCH_ROWS'] = checkpoint_users, fetch_rows
+    
+    for label, passed in checks:
+        print(f'   {"✓" if passed else "✗"} {label}')
+    
+    return all(passed for _, passed in checks)
+
+if __name__ == '__main__':
+    sys.exit(0 if verify_invoicing() else 1)
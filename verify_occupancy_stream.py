@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Live occupancy check: the admin SSE stream starts with a snapshot, then
+delivers each committed booking, park and release as per-lot deltas to
+every open dashboard without running queries per dashboard, and streams
+end after OCCUPANCY_STREAM_SECONDS or are refused when turned off
+"""
+
+import json
+import sys
+import time
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from app_models import User, ParkingLot, Reservation, LotDailyStats, shift_spot_counts
+from jobs import wait_for_jobs
+from spot_provisioning import add_spots
+from occupancy_events import subscriber_count
+from routes import OCCUPANCY_HEARTBEAT_SECONDS
+
+DASHBOARDS = 3
+
+def create_fixture():
+    lot = ParkingLot(prime_location_name='Occupancy Stream Lot', price=1.0, address='Stream verification only',
+                     pin_code='00000', maximum_number_of_spots=5)
+    user = User(username='occupancy_stream_user', email='occupancy_stream_user@example.com',
+                password_hash=generate_password_hash('occupancy-stream'))
+    db.session.add_all([lot, user])
+    db.session.flush()
+    add_spots(lot.id, 5, 5)
+    db.session.commit()
+    return lot.id, user.id
+
+def remove_fixture(lot_id, user_id):
+    wait_for_jobs()
+    Reservation.query.filter_by(user_id=user_id).delete()
+    LotDailyStats.query.filter_by(lot_id=lot_id).delete()
+    db.session.delete(db.session.get(User, user_id))
+    db.session.delete(db.session.get(ParkingLot, lot_id))
+    db.session.commit()
+
+def read_event(stream):
+    chunk = next(stream)
+    if isinstance(chunk, bytes):
+        chunk = chunk.decode()
+    name, data = chunk.strip().split('\n')
+    return name[len('event: '):], json.loads(data[len('data: '):])
+
+def verify_occupancy_stream():
+    with app.app_context():
+        admin_id = User.query.filter_by(username='admin').first().id
+        lot_id, user_id = create_fixture()
+        engine = db.engine
+    
+    print('VERIFICATION: Live Occupancy Stream')
+    print('=' * 50)
+    checks = []
+    
+    responses, streams = [], []
+    for _ in range(DASHBOARDS):
+        admin = app.test_client()
+        with admin.session_transaction() as s:
+            s['_user_id'] = str(admin_id)
+        response = admin.get('/api/admin/occupancy_stream', buffered=False)
+        responses.append(response)
+        streams.append(iter(response.response))
+    
+    snapshots = [read_event(stream) for stream in streams]
+    name, snapshot = snapshots[0]
+    index = snapshot['ids'].index(lot_id) if lot_id in snapshot['ids'] else None
+    checks.append(('stream opens with a snapshot of every lot',
+                   name == 'snapshot' and index is not None and snapshot['available'][index] == 5))
+    checks.append((f'{DASHBOARDS} dashboards subscribed', subscriber_count() == DASHBOARDS))
+    
+    driver = app.test_client()
+    with driver.session_transaction() as s:
+        s['_user_id'] = str(user_id)
+    
+    with app.app_context():
+        shift_spot_counts(lot_id, 'A', 'O')
+        db.session.rollback()
+    
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    key = str(lot_id)
+    driver.post(f'/user/book_parking_quick/{lot_id}')
+    with app.app_context():
+        wait_for_jobs()  # keep the booking's background jobs out of the query count
+    event.listen(engine, 'before_cursor_execute', record)
+    booked = [read_event(stream) for stream in streams]
+    event.remove(engine, 'before_cursor_execute', record)
+    checks.append(('rolled-back changes are not published; booking fans out to every dashboard',
+                   all(event_ == ('occupancy', {'lots': {key: {'available': -1, 'reserved': 1}}, 'removed': []})
+                       for event_ in booked)))
+    checks.append(('delivering deltas runs no queries', not statements))
+    
+    with app.app_context():
+        reservation_id = Reservation.query.filter_by(user_id=user_id, leaving_timestamp=None).first().id
+    driver.get(f'/user/mark_parked/{reservation_id}')
+    checks.append(('park moves a spot from reserved to occupied',
+                   read_event(streams[0])[1]['lots'] == {key: {'reserved': -1, 'occupied': 1}}))
+    driver.get(f'/user/release_parking/{reservation_id}')
+    checks.append(('release moves a spot from occupied to available',
+                   read_event(streams[0])[1]['lots'] == {key: {'occupied': -1, 'available': 1}}))
+    
+    with app.app_context():
+        remove_fixture(lot_id, user_id)
+    checks.append(('deleting the lot is published as removed', read_event(streams[0])[1]['removed'] == [lot_id]))
+    
+    for response in responses:
+        response.close()
+    checks.append(('closed streams unsubscribe', subscriber_count() == 0))
+    
+    app.config['OCCUPANCY_STREAM_SECONDS'], stream_seconds = 0.5, app.config['OCCUPANCY_STREAM_SECONDS']
+    started = time.monotonic()
+    response = admin.get('/api/admin/occupancy_stream', buffered=False)
+    stream = iter(response.response)
+    opened = read_event(stream)[0] == 'snapshot'
+    rest = list(stream)
+    elapsed = time.monotonic() - started
+    checks.append(('a stream ends by itself after its lifetime and unsubscribes',
+                   opened and all(chunk.startswith(b': ') for chunk in rest)
+                   and elapsed < OCCUPANCY_HEARTBEAT_SECONDS and subscriber_count() == 0))
+    response.close()
+    app.config['OCCUPANCY_STREAM_SECONDS'] = stream_seconds
+    
+    app.config['OCCUPANCY_STREAM'] = False
+    response = admin.get('/api/admin/occupancy_stream')
+    checks.append(('with the stream turned off the endpoint answers 204 and subscribes nobody',
+                   response.status_code == 204 and subscriber_count() == 0))
+    app.config['OCCUPANCY_STREAM'] = True
+    
+    for label, passed in checks:
+        print(f'   {"✓" if passed else "✗"} {label}')
+    
+    return all(passed for _, passed in checks)
+
+if __name__ == '__main__':
+    sys.exit(0 if verify_occupancy_stream() else 1)
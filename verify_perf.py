@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Request instrumentation check: a plain response gets Server-Timing headers
+and a latency sample, while a streamed response, still running when it
+is recorded, is only logged and flagged as streamed
+"""
+
+import json
+import logging
+import sys
+
+from app import app
+from app_models import User
+from perf import perf_summary, reset_perf_samples
+
+def verify_perf():
+    print('VERIFICATION: Request Instrumentation')
+    print('=' * 50)
+    checks = []
+    
+    with app.app_context():
+        admin_id = User.query.filter_by(username='admin').first().id
+    admin = app.test_client()
+    with admin.session_transaction() as s:
+        s['_user_id'] = str(admin_id)
+    
+    lines = []
+    handler = logging.Handler()
+    handler.emit = lambda record: lines.append(json.loads(record.getMessage()))
+    logging.getLogger('perf').addHandler(handler)
+    reset_perf_samples()
+    
+    page = admin.get('/login')
+    stream = admin.get('/api/admin/occupancy_stream', buffered=False)
+    stream.close()
+    logging.getLogger('perf').removeHandler(handler)
+    summary = perf_summary()
+    
+    checks.append(('a plain response is timed in its headers and sampled',
+                   len(page.headers.getlist('Server-Timing')) == 3 and summary.get('login', {}).get('requests') == 1))
+    streamed = [line for line in lines if line['endpoint'] == 'occupancy_stream']
+    checks.append(('a streamed response is logged as streamed with no timings',
+                   len(streamed) == 1 and streamed[0].get('streamed') and 'duration_ms' not in streamed[0]
+                   and not stream.headers.getlist('Server-Timing')))
+    checks.append(('a streamed response adds no latency sample', 'occupancy_stream' not in summary))
+    
+    reset_perf_samples()
+    
+    for label, passed in checks:
+        print(f'   {"✓" if passed else "✗"} {label}')
+    
+    return all(passed for _, passed in checks)
+
+if __name__ == '__main__':
+    sys.exit(0 if verify_perf() else 1)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Query-count regression check for the admin spot search APIs: the number of
+SQL statements per request must not grow with the number of spots, and
+keyset pages default to SEARCH_PAGE_DEFAULT spots and report the full total
+"""
+
+import sys
+from datetime import datetime
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from app_models import User, ParkingLot, ParkingSpot, Reservation, shift_spot_counts
+from routes import SEARCH_PAGE_DEFAULT
+
+def create_lot(name, spot_count, user):
+    lot = ParkingLot(
+        prime_location_name=name,
+        price=1.0,
+        address='Query count verification only',
+        pin_code='00000',
+        maximum_number_of_spots=spot_count
+    )
+    db.session.add(lot)
+    db.session.flush()
+    spots = [ParkingSpot(lot_id=lot.id, spot_number=f"S{i:03d}", status='A') for i in range(1, spot_count + 1)]
+    db.session.add_all(spots)
+    db.session.flush()
+    shift_spot_counts(lot.id, to_status='A', count=spot_count)
+    
+    # Occupy every other spot so the reservation/user joins are exercised
+    for spot in spots[::2]:
+        spot.status = 'O'
+        db.session.add(Reservation(spot_id=spot.id, user_id=user.id, parking_timestamp=datetime.utcnow(),
+                                   parking_cost_per_unit_time=lot.price))
+        shift_spot_counts(lot.id, 'A', 'O')
+    return lot
+
+def count_queries(client, url):
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    with app.app_context():
+        engine = db.engine
+    client.get(url)  # warm per-process caches such as the logged-in user
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 200, f'{url} returned {response.status_code}'
+    return len(statements)
+
+def verify_query_counts():
+    with app.app_context():
+        admin = User.query.filter_by(username='admin', is_admin=True).first()
+        user = User(username='query_count_user', email='query_count_user@example.com',
+                    password_hash=generate_password_hash('query-count'))
+        db.session.add(user)
+        db.session.flush()
+        small = create_lot('Query Count Small Lot', 4, user)
+        large = create_lot('Query Count Large Lot', 200, user)
+        db.session.commit()
+        admin_id, user_id, small_id, large_id = admin.id, user.id, small.id, large.id
+    
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+    
+    print('VERIFICATION: Spot Search Query Counts')
+    print('=' * 50)
+    all_passed = True
+    for endpoint in ['/admin/search_by_lot?lot_id={}', '/admin/search_by_status?status=O&lot_id={}']:
+        small_count = count_queries(client, endpoint.format(small_id))
+        large_count = count_queries(client, endpoint.format(large_id))
+        passed = small_count == large_count
+        all_passed = all_passed and passed
+        print(f'   {"✓" if passed else "✗"} {endpoint.split("?")[0]}: '
+              f'{small_count} statements for 4 spots, {large_count} for 200 spots')
+    
+    # Walk the large lot a default-sized page at a time from its first spot
+    first = client.get(f'/admin/search_by_lot?lot_id={large_id}&limit=1').get_json()
+    pages, cursor = [first], first['next_cursor']
+    while cursor:
+        pages.append(client.get(f'/admin/search_by_lot?lot_id={large_id}&after={cursor}').get_json())
+        cursor = pages[-1].get('next_cursor')
+    passed = (len(pages[1]['spots']) == SEARCH_PAGE_DEFAULT and sum(len(page['spots']) for page in pages) == 200
+              and all(page['total_spots'] == 200 for page in pages))
+    all_passed = all_passed and passed
+    print(f'   {"✓" if passed else "✗"} after= without limit pages by {SEARCH_PAGE_DEFAULT}, '
+          f'each page reporting the lot total')
+    
+    with app.app_context():
+        Reservation.query.filter_by(user_id=user_id).delete()
+        for lot_id in (small_id, large_id):
+            db.session.delete(db.session.get(ParkingLot, lot_id))
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+    
+    return all_passed
+
+if __name__ == '__main__':
+    sys.exit(0 if verify_query_counts() else 1)
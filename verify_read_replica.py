@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Read/write splitting check: read-only views query the replica bind, writes
+and the reads right after them stay on the primary
+
+Without REPLICA_DATABASE_URL a snapshot of the SQLite primary is used as
+the replica, so anything written after the snapshot is visible on the
+primary only.
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+from werkzeug.security import generate_password_hash
+
+SNAPSHOT = not os.environ.get('REPLICA_DATABASE_URL')
+if SNAPSHOT:
+    replica_path = os.path.join(tempfile.mkdtemp(), 'replica.db')
+    os.environ['REPLICA_DATABASE_URL'] = f'sqlite:///{replica_path}'
+
+from sqlalchemy import event
+from app import app, db
+from app_models import User, ParkingLot, Reservation, LotDailyStats
+from jobs import wait_for_jobs
+from spot_provisioning import add_spots
+
+def create_fixture():
+    lot = ParkingLot(prime_location_name='Replica Check Lot', price=1.0, address='Replica verification only',
+                     pin_code='00000', maximum_number_of_spots=5)
+    user = User(username='replica_check_user', email='replica_check_user@example.com',
+                password_hash=generate_password_hash('replica-check'))
+    db.session.add_all([lot, user])
+    db.session.flush()
+    add_spots(lot.id, 5, 5)
+    db.session.commit()
+    return lot.id, user.id
+
+def remove_fixture(lot_id, user_id):
+    wait_for_jobs()
+    Reservation.query.filter_by(user_id=user_id).delete()
+    LotDailyStats.query.filter_by(lot_id=lot_id).delete()
+    db.session.delete(db.session.get(User, user_id))
+    db.session.delete(db.session.get(ParkingLot, lot_id))
+    db.session.commit()
+
+def snapshot_primary():
+    primary = sqlite3.connect(db.engine.url.database)
+    replica = sqlite3.connect(replica_path)
+    primary.backup(replica)
+    replica.close()
+    primary.close()
+
+class StatementLog:
+    def __init__(self, engine):
+        self.statements = []
+        self.writes = []
+        event.listen(engine, 'before_cursor_execute', self.record)
+    
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+        if not statement.lstrip().upper().startswith('SELECT'):
+            self.writes.append(statement)
+    
+    def take(self):
+        statements, self.statements = self.statements, []
+        return statements
+
+def verify_read_replica():
+    with app.app_context():
+        if SNAPSHOT and db.engine.url.get_backend_name() != 'sqlite':
+            print('Set REPLICA_DATABASE_URL to check a non-SQLite primary')
+            return False
+        admin_id = User.query.filter_by(username='admin').first().id
+        lot_id, user_id = create_fixture()
+        if SNAPSHOT:
+            snapshot_primary()
+        primary = StatementLog(db.engines[None])
+        replica = StatementLog(db.engines['replica'])
+    
+    print('VERIFICATION: Read Replica Routing')
+    print('=' * 50)
+    checks = []
+    
+    admin = app.test_client()
+    with admin.session_transaction() as s:
+        s['_user_id'] = str(admin_id)
+    for url in ['/api/admin/chart_data', f'/admin/search_by_status?lot_id={lot_id}', '/admin/view_users']:
+        admin.get(url)  # warm the per-process user cache
+        primary.take(), replica.take()
+        response = admin.get(url)
+        checks.append((f'{url} reads from the replica',
+                       response.status_code == 200 and replica.take() and not primary.take()))
+    
+    driver = app.test_client()
+    with driver.session_transaction() as s:
+        s['_user_id'] = str(user_id)
+    driver.get('/user/dashboard')
+    primary.take(), replica.take()
+    driver.post(f'/user/book_parking_quick/{lot_id}')
+    checks.append(('booking writes to the primary only',
+                   any(statement.startswith('INSERT') for statement in primary.take()) and not replica.take()))
+    with app.app_context():
+        wait_for_jobs()  # the booking's background jobs also run on the primary
+    primary.take()
+    
+    response = driver.get('/user/my_bookings')
+    checks.append(('my_bookings right after booking reads the primary',
+                   'Replica Check Lot' in response.get_data(as_text=True) and not replica.take()))
+    
+    with driver.session_transaction() as s:
+        s['primary_until'] = 0
+    primary.take()
+    response = driver.get('/user/my_bookings')
+    checks.append(('my_bookings reads the replica once the pin expires', replica.take() and not primary.take()))
+    if SNAPSHOT:
+        checks.append(('the replica snapshot does not have the new booking',
+                       'Replica Check Lot' not in response.get_data(as_text=True)))
+    
+    with app.app_context():
+        remove_fixture(lot_id, user_id)
+    checks.append(('no write ever reached the replica', not replica.writes))
+    
+    for label, passed in checks:
+        print(f'   {"✓" if passed else "✗"} {label}')
+    
+    if SNAPSHOT:
+        os.remove(replica_path)
+    return all(passed for _, passed in checks)
+
+if __name__ == '__main__':
+    sys.exit(0 if verify_read_replica() else 1)
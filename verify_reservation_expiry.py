@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Idle reservation expiry check: reservations never marked parked within the
+grace period give their spot back in set-based batches, with the lot
+counters, live occupancy, rollups and reclaimed-spot metrics kept in step
+"""
+
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import event, func
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from app_models import User, ParkingLot, ParkingSpot, Reservation, LotDailyStats, shift_spot_counts
+from jobs import wait_for_jobs
+from occupancy_events import subscribe, unsubscribe
+from reservation_sweeper import expire_idle_reservations, reclaimed_spot_stats
+from spot_allocator import allocate_spot
+from spot_provisioning import add_spots
+
+GRACE_MINUTES = 30
+DRIVERS = 4
+
+def create_fixture():
+    lot = ParkingLot(prime_location_name='Expiry Check Lot', price=2.0, address='Expiry verification only',
+                     pin_code='00000', maximum_number_of_spots=5)
+    users = [User(username=f'expiry_check_user_{n}', email=f'expiry_check_user_{n}@example.com',
+                  password_hash=generate_password_hash('expiry-check')) for n in range(DRIVERS)]
+    db.session.add_all([lot] + users)
+    db.session.flush()
+    add_spots(lot.id, 5, 5)
+    db.session.commit()
+    return lot.id, [user.id for user in users]
+
+def remove_fixture(lot_id, user_ids):
+    wait_for_jobs()
+    Reservation.query.filter(Reservation.user_id.in_(user_ids)).delete()
+    LotDailyStats.query.filter_by(lot_id=lot_id).delete()
+    User.query.filter(User.id.in_(user_ids)).delete()
+    db.session.delete(db.session.get(ParkingLot, lot_id))
+    db.session.commit()
+
+def book(lot_id, user_id, age_minutes, parked=False):
+    reservation = allocate_spot(db.session.get(ParkingLot, lot_id), user_id)
+    reservation.parking_timestamp = datetime.utcnow() - timedelta(minutes=age_minutes)
+    if parked:
+        db.session.flush()
+        reservation.parking_spot.status = 'O'
+        shift_spot_counts(lot_id, 'R', 'O')
+    db.session.commit()
+    return reservation.id
+
+def counters_match(lot_id):
+    lot = db.session.get(ParkingLot, lot_id, populate_existing=True)
+    actual = dict(db.session.query(ParkingSpot.status, func.count(ParkingSpot.id))
+                  .filter_by(lot_id=lot_id).group_by(ParkingSpot.status).all())
+    return (lot.available_spots_count == actual.get('A', 0)
+            and lot.reserved_spots_count == actual.get('R', 0)
+            and lot.occupied_spots_count == actual.get('O', 0))
+
+def verify_reservation_expiry():
+    print('VERIFICATION: Idle Reservation Expiry')
+    print('=' * 50)
+    checks = []
+    
+    with app.app_context():
+        # Reservations already due elsewhere in the database would be swept too
+        expire_idle_reservations(GRACE_MINUTES)
+        wait_for_jobs()
+        lot_id, user_ids = create_fixture()
+        idle = [book(lot_id, user_ids[0], 120), book(lot_id, user_ids[1], 90)]
+        parked = book(lot_id, user_ids[2], 120, parked=True)
+        fresh = book(lot_id, user_ids[3], 5)
+        wait_for_jobs()
+        sessions_before = db.session.query(func.coalesce(func.sum(LotDailyStats.sessions), 0)).filter_by(
+            lot_id=lot_id).scalar()
+        engine = db.engine
+        
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.lstrip().split(None, 2)[:2])
+        subscription = subscribe()
+        event.listen(engine, 'before_cursor_execute', record)
+        reclaimed = expire_idle_reservations(GRACE_MINUTES, batch_size=1)
+        event.remove(engine, 'before_cursor_execute', record)
+        unsubscribe(subscription)
+        
+        checks.append(('only reservations left in R past the grace period expire', reclaimed == {lot_id: 2}))
+        spot_updates = statements.count(['UPDATE', 'parking_spots'])
+        reservation_updates = statements.count(['UPDATE', 'reservations'])
+        checks.append(('each batch is one UPDATE of spots and one of reservations',
+                       spot_updates == 3 and reservation_updates == 2))
+        
+        rows = {r.id: r for r in Reservation.query.filter(Reservation.id.in_(idle + [parked, fresh]))}
+        checks.append(('expired reservations are closed at no cost',
+                       all(rows[i].expired and rows[i].leaving_timestamp and rows[i].total_cost == 0 for i in idle)))
+        checks.append(('parked and recent reservations stay open',
+                       all(not rows[i].expired and rows[i].leaving_timestamp is None for i in (parked, fresh))))
+        checks.append(('spots are available again and counters match',
+                       all(rows[i].parking_spot.status == 'A' for i in idle) and counters_match(lot_id)))
+        
+        key, deltas = str(lot_id), []
+        while (occupancy_event := subscription.get(timeout=0)) is not None:
+            deltas.append(occupancy_event['lots'].get(key))
+        checks.append(('reclaimed spots are published to live dashboards',
+                       deltas == [{'reserved': -1, 'available': 1}] * 2))
+        
+        wait_for_jobs()
+        sessions_after = db.session.query(func.sum(LotDailyStats.sessions)).filter_by(lot_id=lot_id).scalar()
+        checks.append(('the daily rollup counts each expiry as an unpaid session', sessions_after == sessions_before + 2))
+        
+        stats = reclaimed_spot_stats()
+        checks.append(('reclaimed-spot metrics report the lot',
+                       {'lot_id': lot_id, 'name': 'Expiry Check Lot', 'reclaimed': 2} in stats['lots']
+                       and stats['this_process']['last_reclaimed'] == 2))
+        checks.append(('a second sweep finds nothing', expire_idle_reservations(GRACE_MINUTES) == {}))
+    
+    driver = app.test_client()
+    with driver.session_transaction() as s:
+        s['_user_id'] = str(user_ids[0])
+    driver.get(f'/user/mark_parked/{idle[0]}')
+    with app.app_context():
+        spot = db.session.get(Reservation, idle[0]).parking_spot
+        checks.append(('an expired reservation cannot be marked parked', spot.status == 'A' and counters_match(lot_id)))
+    
+    # Expire the fresh reservation after release_parking has loaded it but
+    # before it writes, as a sweep on another worker could
+    raced_writes = []
+    def expire_concurrently(conn, cursor, statement, parameters, context, executemany):
+        if raced_writes or not statement.lstrip().startswith('UPDATE reservations'):
+            return
+        raced_writes.append(statement)
+        with engine.begin() as other:
+            spot_id = other.execute(db.select(Reservation.spot_id).where(Reservation.id == fresh)).scalar()
+            other.execute(db.update(Reservation).where(Reservation.id == fresh).values(
+                leaving_timestamp=datetime.utcnow(), total_cost=0, expired=True))
+            other.execute(db.update(ParkingSpot).where(ParkingSpot.id == spot_id).values(status='A'))
+            other.execute(db.update(ParkingLot).where(ParkingLot.id == lot_id).values(
+                reserved_spots_count=ParkingLot.reserved_spots_count - 1,
+                available_spots_count=ParkingLot.available_spots_count + 1))
+    driver = app.test_client()
+    with driver.session_transaction() as s:
+        s['_user_id'] = str(user_ids[3])
+    event.listen(engine, 'before_cursor_execute', expire_concurrently)
+    response = driver.get(f'/user/release_parking/{fresh}')
+    event.remove(engine, 'before_cursor_execute', expire_concurrently)
+    with app.app_context():
+        raced = db.session.get(Reservation, fresh)
+        checks.append(('a release racing the sweeper leaves the expiry and the counters alone',
+                       response.status_code == 302 and raced_writes
+                       and raced.expired and raced.total_cost == 0 and counters_match(lot_id)))
+        remove_fixture(lot_id, user_ids)
+    
+    for label, passed in checks:
+        print(f'   {"✓" if passed else "✗"} {label}')
+    
+    return all(passed for _, passed in checks)
+
+if __name__ == '__main__':
+    sys.exit(0 if verify_reservation_expiry() else 1)
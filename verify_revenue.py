@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Revenue series check: hourly, daily and weekly buckets add up to the
+revenue released in the range on this database, and the PostgreSQL
+bucket expression yields naive timestamps that match the bucket starts
+"""
+
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy.dialects import postgresql
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from app_models import User, ParkingLot, ParkingSpot, Reservation, LotDailyStats
+from jobs import wait_for_jobs
+from revenue import bucket_expression, revenue_series
+from spot_provisioning import add_spots
+
+FIRST_DAY = datetime(2023, 5, 1)  # a Monday
+DAYS = 21
+
+def create_fixture():
+    lot = ParkingLot(prime_location_name='Revenue Check Lot', price=1.0, address='Revenue verification only',
+                     pin_code='00000', maximum_number_of_spots=1)
+    user = User(username='revenue_check_user', email='revenue_check_user@example.com',
+                password_hash=generate_password_hash('revenue-check'))
+    db.session.add_all([lot, user])
+    db.session.flush()
+    add_spots(lot.id, 1, 1)
+    spot_id = db.session.scalars(db.select(ParkingSpot.id).filter_by(lot_id=lot.id)).one()
+    
+    # Day n earns n + 1, released at 10:30
+    for n in range(DAYS):
+        left_at = FIRST_DAY + timedelta(days=n, hours=10, minutes=30)
+        db.session.add(Reservation(spot_id=spot_id, user_id=user.id, parking_timestamp=left_at - timedelta(hours=1),
+                                   leaving_timestamp=left_at, parking_cost_per_unit_time=1.0, total_cost=n + 1))
+        db.session.add(LotDailyStats(lot_id=lot.id, day=left_at.date(), revenue=n + 1, sessions=1,
+                                     occupied_hours=1, peak_occupancy=1))
+    db.session.commit()
+    return lot.id, user.id
+
+def remove_fixture(lot_id, user_id):
+    wait_for_jobs()
+    Reservation.query.filter_by(user_id=user_id).delete()
+    LotDailyStats.query.filter_by(lot_id=lot_id).delete()
+    db.session.delete(db.session.get(User, user_id))
+    db.session.delete(db.session.get(ParkingLot, lot_id))
+    db.session.commit()
+
+def lot_amounts(series, lot_id):
+    return next(lot['amounts'] for lot in series['lots'] if lot['lot_id'] == lot_id)
+
+def verify_revenue():
+    print('VERIFICATION: Revenue Series')
+    print('=' * 50)
+    checks = []
+    end = FIRST_DAY + timedelta(days=DAYS)
+    
+    with app.app_context():
+        lot_id, user_id = create_fixture()
+        
+        daily = lot_amounts(revenue_series(FIRST_DAY, end, 'day', by_lot=True), lot_id)
+        checks.append(('daily buckets read each day of the rollup', daily == [float(n + 1) for n in range(DAYS)]))
+        
+        weekly = lot_amounts(revenue_series(FIRST_DAY, end, 'week', by_lot=True), lot_id)
+        checks.append(('weekly buckets start on Monday and sum their days',
+                       weekly == [float(sum(range(7 * w + 1, 7 * w + 8))) for w in range(DAYS // 7)]))
+        
+        hourly = revenue_series(FIRST_DAY, FIRST_DAY + timedelta(days=1), 'hour', by_lot=True)
+        checks.append(('hourly buckets place a release in its hour',
+                       lot_amounts(hourly, lot_id)[10] == 1.0 and sum(lot_amounts(hourly, lot_id)) == 1.0))
+        
+        remove_fixture(lot_id, user_id)
+    
+    compiled = [str(bucket_expression(column, 'week', 'postgresql').compile(dialect=postgresql.dialect()))
+                for column in (LotDailyStats.day, Reservation.leaving_timestamp)]
+    checks.append(('on PostgreSQL buckets are truncated as timestamp without time zone',
+                   all('date_trunc' in sql and 'AS TIMESTAMP WITHOUT TIME ZONE' in sql for sql in compiled)
+                   and isinstance(bucket_expression(LotDailyStats.day, 'day', 'postgresql').type, db.DateTime)
+                   and not bucket_expression(LotDailyStats.day, 'day', 'postgresql').type.timezone))
+    
+    for label, passed in checks:
+        print(f'   {"✓" if passed else "✗"} {label}')
+    
+    return all(passed for _, passed in checks)
+
+if __name__ == '__main__':
+    sys.exit(0 if verify_revenue() else 1)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Spot provisioning check: growing a lot past its number width never renames
+existing spots, new numbers follow the lot's padding, and allocation and
+shrinking still walk the spots in numeric order
+"""
+
+import sys
+from datetime import datetime
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from app_models import User, ParkingLot, ParkingSpot, Reservation, LotDailyStats
+from jobs import wait_for_jobs
+from spot_allocator import first_available_spot
+from spot_provisioning import add_spots, remove_spots
+
+def create_fixture():
+    """A lot of S001..S999 with S002 booked."""
+    lot = ParkingLot(prime_location_name='Provisioning Check Lot', price=1.0, address='Provisioning verification only',
+                     pin_code='00000', maximum_number_of_spots=999)
+    user = User(username='provisioning_check_user', email='provisioning_check_user@example.com',
+                password_hash=generate_password_hash('provisioning-check'))
+    db.session.add_all([lot, user])
+    db.session.flush()
+    add_spots(lot.id, 999, 999)
+    booked = ParkingSpot.query.filter_by(lot_id=lot.id, spot_number='S002').one()
+    booked.status = 'R'
+    db.session.add(Reservation(spot_id=booked.id, user_id=user.id, parking_timestamp=datetime.utcnow(),
+                               parking_cost_per_unit_time=1.0))
+    db.session.commit()
+    return lot.id, user.id, booked.id
+
+def remove_fixture(lot_id, user_id):
+    wait_for_jobs()
+    Reservation.query.filter_by(user_id=user_id).delete()
+    LotDailyStats.query.filter_by(lot_id=lot_id).delete()
+    db.session.delete(db.session.get(User, user_id))
+    db.session.delete(db.session.get(ParkingLot, lot_id))
+    db.session.commit()
+
+def spot_numbers(lot_id):
+    db.session.commit()
+    return set(db.session.scalars(db.select(ParkingSpot.spot_number).filter_by(lot_id=lot_id)))
+
+def verify_spot_provisioning():
+    print('VERIFICATION: Spot Provisioning')
+    print('=' * 50)
+    checks = []
+    
+    with app.app_context():
+        lot_id, user_id, booked_id = create_fixture()
+        before = spot_numbers(lot_id)
+        
+        add_spots(lot_id, 2, 1001)
+        after = spot_numbers(lot_id)
+        checks.append(('growing past three digits renames no spot, booked or not',
+                       before <= after and after - before == {'S1000', 'S1001'}
+                       and db.session.get(ParkingSpot, booked_id).spot_number == 'S002'))
+        
+        db.session.execute(db.update(ParkingSpot).where(
+            ParkingSpot.lot_id == lot_id, ParkingSpot.spot_number.notin_(['S999', 'S1000', 'S1001'])
+        ).values(status='O'))
+        checks.append(('the first available spot is the lowest by number, not by text',
+                       first_available_spot(lot_id).spot_number == 'S999'))
+        
+        remove_spots(lot_id, 1)
+        checks.append(('shrinking removes the highest number first', 'S1001' not in spot_numbers(lot_id)))
+        
+        db.session.execute(db.delete(ParkingSpot).where(ParkingSpot.lot_id == lot_id, ParkingSpot.spot_number == 'S005'))
+        add_spots(lot_id, 1, 1000)
+        numbers = spot_numbers(lot_id)
+        checks.append(("a freed low number is reused with the lot's padding",
+                       'S005' in numbers and 'S0005' not in numbers and len(numbers) == 1000))
+        
+        remove_fixture(lot_id, user_id)
+    
+    for label, passed in checks:
+        print(f'   {"✓" if passed else "✗"} {label}')
+    
+    return all(passed for _, passed in checks)
+
+if __name__ == '__main__':
+    sys.exit(0 if verify_spot_provisioning() else 1)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+User cache check: the logged-in user is served from the per-process cache,
+and neither an ORM write nor a set-based UPDATE or DELETE of users leaves
+a stale user behind
+"""
+
+import sys
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from app_models import User
+from user_cache import user_cache_stats
+
+def create_fixture():
+    user = User(username='user_cache_check', email='user_cache_check@example.com',
+                password_hash=generate_password_hash('user-cache-check'))
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+def remove_fixture(user_id):
+    User.query.filter_by(id=user_id).delete()
+    db.session.commit()
+
+def verify_user_cache():
+    print('VERIFICATION: User Cache')
+    print('=' * 50)
+    checks = []
+    
+    with app.app_context():
+        user_id = create_fixture()
+    driver = app.test_client()
+    with driver.session_transaction() as s:
+        s['_user_id'] = str(user_id)
+    
+    def shown_username():
+        # A second request is served from the cache the first one filled
+        driver.get('/user/dashboard')
+        hits = user_cache_stats()['user_hits']
+        page = driver.get('/user/dashboard')
+        return page.status_code, page.get_data(as_text=True), user_cache_stats()['user_hits'] - hits
+    
+    status, page, hits = shown_username()
+    checks.append(('the logged-in user is served from the cache', status == 200 and hits == 1))
+    
+    with app.app_context():
+        db.session.get(User, user_id).username = 'user_cache_renamed'
+        db.session.commit()
+    status, page, _ = shown_username()
+    checks.append(('an ORM update drops the cached user', 'user_cache_renamed' in page))
+    
+    with app.app_context():
+        User.query.filter_by(id=user_id).update({'username': 'user_cache_bulk_renamed'})
+        db.session.commit()
+    status, page, _ = shown_username()
+    checks.append(('a set-based UPDATE drops the cached user', 'user_cache_bulk_renamed' in page))
+    
+    with app.app_context():
+        remove_fixture(user_id)
+    status, page, _ = shown_username()
+    checks.append(('a set-based DELETE logs the deleted user out', status == 302))
+    
+    for label, passed in checks:
+        print(f'   {"✓" if passed else "✗"} {label}')
+    
+    return all(passed for _, passed in checks)
+
+if __name__ == '__main__':
+    sys.exit(0 if verify_user_cache() else 1)